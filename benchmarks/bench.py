@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmarks for the MCP tools and crawl4ai-service.
+
+Runs a seeded, repeatable workload against local stand-ins (see
+standins.py and docker-compose.yml in this directory) and reports per
+scenario: throughput, p50/p95/p99 latency, errors, Redis cache hit ratio
+(from INFO keyspace_hits/misses deltas) and memory, as JSON.
+
+Scenarios:
+- search:    MCP web_search (queries drawn from a skewed pool, so some repeat)
+- web_crawl: MCP web_crawl of test-site pages
+- crawl:     crawl4ai POST /crawl
+- batch:     crawl4ai POST /crawl/batch, polled via POST /results until done
+
+MCP tools run in-process through fastmcp's in-memory client (server.py is
+imported with SEARXNG_URL/CRAWL4AI_URL/REDIS_* pointed at the stand-ins), or
+against a running server with --mcp-url.
+
+    python benchmarks/bench.py --scenarios search,crawl --concurrency 16 \\
+        --requests 400 --output results.json --baseline baseline.json
+
+With --baseline, the run fails (exit 1) if any scenario's p95 latency or
+throughput regressed by more than --max-regression against the baseline file.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("search", "web_crawl", "crawl", "batch")
+
+QUERY_TOPICS = (
+    "python asyncio", "redis cluster", "kubernetes probes", "web crawling", "bm25 ranking",
+    "headless chrome", "token bucket", "consistent hashing", "bloom filter", "fastapi streaming",
+)
+
+
+def percentile(ordered: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return None
+    rank = max(1, min(len(ordered), int(-(-p * len(ordered) // 100))))
+    return ordered[rank - 1]
+
+
+def skewed_indexes(count: int, unique: int, skew: float, rng: random.Random) -> List[int]:
+    """Zipf-like draw: item i has weight 1/(i+1)^skew, so low indexes repeat (cache hits)"""
+    weights = [1.0 / (i + 1) ** skew for i in range(unique)]
+    return rng.choices(range(unique), weights=weights, k=count)
+
+
+class RedisStats:
+    """Keyspace hit/miss and memory deltas of the benchmark Redis"""
+
+    def __init__(self, url: Optional[str]):
+        self.client = None
+        if url:
+            import redis
+            self.client = redis.Redis.from_url(url)
+
+    def snapshot(self) -> Optional[Dict[str, int]]:
+        if self.client is None:
+            return None
+        try:
+            stats = self.client.info("stats")
+            memory = self.client.info("memory")
+        except Exception:
+            return None
+        return {
+            "hits": stats.get("keyspace_hits", 0),
+            "misses": stats.get("keyspace_misses", 0),
+            "used_memory": memory.get("used_memory", 0),
+        }
+
+    def flush(self):
+        if self.client is not None:
+            self.client.flushdb()
+
+    @staticmethod
+    def delta(before: Optional[Dict], after: Optional[Dict]) -> Optional[Dict[str, Any]]:
+        if not before or not after:
+            return None
+        hits = after["hits"] - before["hits"]
+        misses = after["misses"] - before["misses"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "used_memory_bytes": after["used_memory"],
+            "used_memory_delta_bytes": after["used_memory"] - before["used_memory"],
+        }
+
+
+async def run_load(call: Callable[[Any], Awaitable[None]], items: List[Any], concurrency: int) -> Dict[str, Any]:
+    """Run `call(item)` for every item with at most `concurrency` in flight"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                await call(item)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                label = f"{type(e).__name__}: {str(e)[:120]}"
+                errors[label] = errors.get(label, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": len(items),
+        "succeeded": len(latencies),
+        "failed": sum(errors.values()),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "latency_ms": {
+            "mean": ms(sum(ordered) / len(ordered)) if ordered else None,
+            "p50": ms(percentile(ordered, 50)),
+            "p95": ms(percentile(ordered, 95)),
+            "p99": ms(percentile(ordered, 99)),
+            "max": ms(ordered[-1]) if ordered else None,
+        },
+        "errors": errors,
+    }
+
+
+def load_mcp_server(args):
+    """Import server.py configured against the stand-ins"""
+    os.environ.setdefault("SEARXNG_URL", args.searxng_url)
+    os.environ.setdefault("CRAWL4AI_URL", args.crawl4ai_url)
+    if args.redis_url:
+        from urllib.parse import urlsplit
+        parts = urlsplit(args.redis_url)
+        os.environ.setdefault("REDIS_ENABLED", "true")
+        os.environ.setdefault("REDIS_HOST", parts.hostname or "localhost")
+        os.environ.setdefault("REDIS_PORT", str(parts.port or 6379))
+    sys.path.insert(0, os.path.join(REPO_ROOT, "mcp-server-fastmcp"))
+    import server
+    return server.mcp
+
+
+async def mcp_scenario(tool: str, args, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from fastmcp import Client
+
+    target = args.mcp_url or load_mcp_server(args)
+    async with Client(target) as client:
+        async def call(arguments):
+            result = await client.call_tool(tool, arguments)
+            data = json.loads(result.content[0].text)
+            if isinstance(data, dict) and "error" in data:
+                raise RuntimeError(f"{data['error']}: {data.get('details', '')}")
+
+        return await run_load(call, items, args.concurrency)
+
+
+async def crawl_scenario(args, urls: List[str]) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=args.crawl4ai_url, timeout=args.timeout + 30) as http:
+        async def call(url):
+            response = await http.post("/crawl", json={"url": url, "timeout": args.timeout})
+            response.raise_for_status()
+
+        return await run_load(call, urls, args.concurrency)
+
+
+async def batch_scenario(args, batches: List[List[str]]) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=args.crawl4ai_url, timeout=60) as http:
+        async def call(urls):
+            response = await http.post("/crawl/batch", json={"urls": urls, "timeout": args.timeout})
+            response.raise_for_status()
+            job_ids = [job["job_id"] for job in response.json()["jobs"]]
+            deadline = time.monotonic() + args.timeout * len(urls) + 60
+            while time.monotonic() < deadline:
+                results = (await http.post("/results", json={"job_ids": job_ids})).json()
+                if not results["pending"] and not results["missing"]:
+                    if results["failed"]:
+                        raise RuntimeError(f"{len(results['failed'])} of {len(job_ids)} jobs failed")
+                    return
+                await asyncio.sleep(args.poll_interval)
+            raise TimeoutError(f"batch of {len(urls)} did not finish")
+
+        result = await run_load(call, batches, args.concurrency)
+        result["urls_per_batch"] = args.batch_size
+        if result["elapsed_seconds"]:
+            result["url_throughput"] = round(result["succeeded"] * args.batch_size / result["elapsed_seconds"], 3)
+        return result
+
+
+async def crawl4ai_memory(args) -> Optional[Dict[str, Any]]:
+    """Service-side memory from /debug/memory, when debug endpoints are enabled"""
+    headers = {"X-Debug-Token": args.debug_token} if args.debug_token else {}
+    try:
+        async with httpx.AsyncClient(base_url=args.crawl4ai_url, timeout=10) as http:
+            response = await http.get("/debug/memory", params={"limit": 0}, headers=headers)
+            if response.status_code != 200:
+                return None
+            data = response.json()
+            return {k: data.get(k) for k in ("rss_bytes", "peak_rss_bytes", "browser_rss_bytes", "browser_processes")}
+    except httpx.HTTPError:
+        return None
+
+
+def build_workload(scenario: str, args, rng: random.Random) -> List[Any]:
+    def page_url(i: int) -> str:
+        kind = "js" if args.js_every and i % args.js_every == 0 else "page"
+        return f"{args.site_url}/{kind}/{i}"
+
+    page_urls = [page_url(i) for i in range(args.unique)]
+    picks = skewed_indexes(args.requests, args.unique, args.skew, rng)
+    if scenario == "search":
+        return [{"query": f"{QUERY_TOPICS[i % len(QUERY_TOPICS)]} {i}", "max_results": 10} for i in picks]
+    if scenario == "web_crawl":
+        return [{"url": page_urls[i], "timeout": args.timeout} for i in picks]
+    if scenario == "crawl":
+        return [page_urls[i] for i in picks]
+    # batch: requests / batch_size batches of skewed picks
+    return [[page_urls[i] for i in picks[start:start + args.batch_size]]
+            for start in range(0, len(picks), args.batch_size)]
+
+
+async def run(args) -> Dict[str, Any]:
+    redis_stats = RedisStats(args.redis_url)
+    if args.flush:
+        redis_stats.flush()
+    report: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("debug_token", "output", "baseline")},
+        "scenarios": {},
+    }
+    for scenario in args.scenarios:
+        rng = random.Random(f"{args.seed}:{scenario}")
+        items = build_workload(scenario, args, rng)
+        before = redis_stats.snapshot()
+        if scenario in ("search", "web_crawl"):
+            tool = "web_search" if scenario == "search" else "web_crawl"
+            result = await mcp_scenario(tool, args, items)
+        elif scenario == "crawl":
+            result = await crawl_scenario(args, items)
+        else:
+            result = await batch_scenario(args, items)
+        result["cache"] = RedisStats.delta(before, redis_stats.snapshot())
+        result["memory"] = {
+            # ru_maxrss is in kilobytes on Linux; includes the in-process MCP server
+            "bench_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "crawl4ai": await crawl4ai_memory(args),
+        }
+        report["scenarios"][scenario] = result
+        print(
+            f"{scenario}: {result['throughput_rps']} req/s, p50 {result['latency_ms']['p50']}ms, "
+            f"p95 {result['latency_ms']['p95']}ms, p99 {result['latency_ms']['p99']}ms, "
+            f"{result['failed']} failed, hit ratio {(result['cache'] or {}).get('hit_ratio')}",
+            file=sys.stderr,
+        )
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Regressions of p95 latency or throughput beyond `max_regression` (a fraction)"""
+    problems = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        old_p95, new_p95 = previous["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        if old_p95 and new_p95 and new_p95 > old_p95 * (1 + max_regression):
+            problems.append(f"{name}: p95 {old_p95}ms -> {new_p95}ms")
+        old_rps, new_rps = previous["throughput_rps"], current["throughput_rps"]
+        if old_rps and new_rps is not None and new_rps < old_rps * (1 - max_regression):
+            problems.append(f"{name}: throughput {old_rps} -> {new_rps} req/s")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MCP tools and crawl4ai against local stand-ins")
+    parser.add_argument("--scenarios", default="search,web_crawl,crawl,batch",
+                        type=lambda s: [x.strip() for x in s.split(",") if x.strip()])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Calls per scenario")
+    parser.add_argument("--unique", type=int, default=50, help="Distinct queries/URLs per scenario")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the request mix (0 = uniform)")
+    parser.add_argument("--seed", default="bench")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--js-every", type=int, default=5, help="Every Nth URL is a JavaScript-rendered page (0 = none)")
+    parser.add_argument("--timeout", type=int, default=30, help="Page timeout sent with crawls")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--searxng-url", default="http://localhost:8081")
+    parser.add_argument("--site-url", default="http://standins:8082",
+                        help="Test site base URL as seen by crawl4ai")
+    parser.add_argument("--crawl4ai-url", default="http://localhost:8000")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--mcp-url", default=None, help="Benchmark a running MCP server instead of importing server.py")
+    parser.add_argument("--debug-token", default=os.getenv("DEBUG_TOKEN"))
+    parser.add_argument("--flush", action="store_true", help="FLUSHDB the benchmark Redis first (cold cache)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="Earlier report to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run(args))
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.max_regression)
+        report["regressions"] = problems
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        exit_code = 1 if problems else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
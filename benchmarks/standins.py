@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for benchmarking: a fake SearXNG and a test site.
+
+- Fake SearXNG (default :8081): `GET /search?q=...&format=json` returns a
+  deterministic SearXNG-shaped result list for the query, whose URLs point at
+  the test site, after an optional artificial latency. `GET /healthz` works
+  like SearXNG's.
+- Test site (default :8082): `/page/{n}` are static HTML pages with
+  deterministic text and links to other pages; `/js/{n}` render their body
+  from JavaScript after a delay, to exercise browser rendering; `/` links to
+  everything.
+
+Only the standard library is used, so this runs anywhere (and in the
+python:slim image used by benchmarks/docker-compose.yml).
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+WORDS = (
+    "search crawl index cache latency throughput replica cluster query result page "
+    "browser render markdown extract content token engine shard archive stream "
+    "network request response memory profile budget deadline queue worker redis"
+).split()
+
+
+def page_text(n: int, paragraphs: int) -> list:
+    """Deterministic paragraphs for page n"""
+    rng = random.Random(n)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 90))).capitalize() + "."
+            for _ in range(paragraphs)]
+
+
+def page_links(n: int, pages: int) -> list:
+    return sorted({(n * 2) % pages, (n * 2 + 1) % pages, (n + 1) % pages, (n * 7 + 3) % pages})
+
+
+class Settings:
+    site_url = "http://localhost:8082"
+    pages = 200
+    paragraphs = 12
+    js_delay_ms = 300
+    search_latency_ms = 50
+    results_per_query = 20
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class SearxngHandler(_Handler):
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/healthz":
+            return self._send(200, b"OK", "text/plain")
+        if parts.path != "/search":
+            return self._send(404, b"not found", "text/plain")
+        params = parse_qs(parts.query)
+        query = params.get("q", [""])[0]
+        engines = (params.get("engines", ["google,duckduckgo,brave"])[0] or "google").split(",")
+        time.sleep(Settings.search_latency_ms / 1000)
+
+        # Same query, same results: repeated queries are cacheable
+        seed = int.from_bytes(hashlib.blake2b(query.encode("utf-8"), digest_size=8).digest(), "little")
+        rng = random.Random(seed)
+        results = []
+        for rank in range(Settings.results_per_query):
+            n = rng.randrange(Settings.pages)
+            results.append({
+                "title": f"Page {n} about {query}",
+                "url": f"{Settings.site_url}/page/{n}",
+                "content": page_text(n, 1)[0][:280],
+                "engine": engines[rank % len(engines)],
+                "score": round(1.0 / (rank + 1), 4),
+                "publishedDate": None,
+            })
+        body = json.dumps({
+            "query": query,
+            "number_of_results": len(results),
+            "results": results,
+            "unresponsive_engines": [],
+        }).encode("utf-8")
+        self._send(200, body, "application/json")
+
+
+class SiteHandler(_Handler):
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip("/")
+        kind, _, number = path.lstrip("/").partition("/")
+        if path == "":
+            links = "".join(f'<li><a href="/page/{n}">Page {n}</a></li>' for n in range(Settings.pages))
+            return self._send(200, f"<html><head><title>Index</title></head><body><ul>{links}</ul></body></html>".encode(), "text/html")
+        if kind not in ("page", "js") or not number.isdigit() or int(number) >= Settings.pages:
+            return self._send(404, b"<html><body>Not found</body></html>", "text/html")
+
+        n = int(number)
+        nav = "".join(f'<a href="/{kind}/{m}">Related {m}</a> ' for m in page_links(n, Settings.pages))
+        paragraphs = page_text(n, Settings.paragraphs)
+        if kind == "page":
+            body = "".join(f"<h2>Section {i}</h2><p>{p}</p>" for i, p in enumerate(paragraphs))
+        else:
+            # Content only exists after the script runs
+            body = (
+                '<div id="app">Loading...</div><script>setTimeout(function () {'
+                f"var parts = {json.dumps(paragraphs)};"
+                "document.getElementById('app').innerHTML = parts.map(function (p, i) {"
+                "return '<h2>Section ' + i + '</h2><p>' + p + '</p>'; }).join('');"
+                f"}}, {Settings.js_delay_ms});</script>"
+            )
+        html = (
+            f"<html><head><title>{kind.upper()} page {n}</title>"
+            f'<meta name="description" content="Benchmark page {n}"></head>'
+            f"<body><nav>{nav}</nav><main><h1>Page {n}</h1>{body}</main>"
+            "<footer>Benchmark site</footer></body></html>"
+        )
+        self._send(200, html.encode("utf-8"), "text/html; charset=utf-8")
+
+
+def serve(host: str, searxng_port: int, site_port: int):
+    servers = [
+        ThreadingHTTPServer((host, searxng_port), SearxngHandler),
+        ThreadingHTTPServer((host, site_port), SiteHandler),
+    ]
+    threads = [threading.Thread(target=s.serve_forever, daemon=True) for s in servers]
+    for t in threads:
+        t.start()
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake SearXNG and test site for benchmarks")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--searxng-port", type=int, default=8081)
+    parser.add_argument("--site-port", type=int, default=8082)
+    parser.add_argument("--site-url", default=None,
+                        help="Site base URL as seen by crawl4ai (default: http://localhost:<site-port>)")
+    parser.add_argument("--pages", type=int, default=Settings.pages)
+    parser.add_argument("--paragraphs", type=int, default=Settings.paragraphs)
+    parser.add_argument("--js-delay-ms", type=int, default=Settings.js_delay_ms)
+    parser.add_argument("--search-latency-ms", type=int, default=Settings.search_latency_ms)
+    args = parser.parse_args()
+
+    Settings.site_url = args.site_url or f"http://localhost:{args.site_port}"
+    Settings.pages = args.pages
+    Settings.paragraphs = args.paragraphs
+    Settings.js_delay_ms = args.js_delay_ms
+    Settings.search_latency_ms = args.search_latency_ms
+
+    serve(args.host, args.searxng_port, args.site_port)
+    print(f"Fake SearXNG on :{args.searxng_port}, test site on :{args.site_port} ({Settings.site_url})", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Shared headless browser for crawls.
+
+Launching Chromium for every crawl put one to two seconds of browser start-up
+on each request, and a freshly scaled pod paid it again for its first page
+load. One AsyncWebCrawler is now started per process and shared by all
+crawls (each crawl gets its own page). `prewarm()` launches it and renders a
+trivial page at startup so the readiness probe only passes once the first
+real crawl will be fast.
+
+Crawls hold a lease on the browser (`async with pool.crawler()`), so
+`recycle()` can swap in a fresh browser - e.g. when the old one's memory has
+grown past a limit - while crawls in flight finish on the old one, which is
+closed once its last lease is released. A browser that died under a crawl
+(crashed or was OOM-killed) is recycled the same way when its lease is
+released, and the next crawl relaunches it.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CacheMode, CrawlerRunConfig
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# Rendered once at startup to open the first page and initialize the renderer
+WARMUP_HTML = "raw:<html><head><title>warmup</title></head><body><p>warmup</p></body></html>"
+
+
+class BrowserPool:
+    """Lazily started, shared AsyncWebCrawler."""
+
+    def __init__(self):
+        self._crawler: Optional[AsyncWebCrawler] = None
+        self._lock = asyncio.Lock()
+        self.warm = False
+        self.launched_at: Optional[float] = None
+        self.recycles = 0
+        # Why the last launch failed; cleared by a successful launch
+        self.launch_error: Optional[str] = None
+        # Leases per crawler instance; retired crawlers close at zero
+        self._leases: Dict[AsyncWebCrawler, int] = {}
+        self._retired: set = set()
+        # Root processes (Playwright driver) of each crawler's browser tree
+        self._roots: Dict[AsyncWebCrawler, List[int]] = {}
+
+    @staticmethod
+    def browser_config() -> BrowserConfig:
+        return BrowserConfig(
+            headless=True,
+            verbose=True
+        )
+
+    @staticmethod
+    def alive(crawler: AsyncWebCrawler) -> bool:
+        """Whether the crawler is started and its browser still connected"""
+        if not getattr(crawler, "ready", False):
+            return False
+        manager = getattr(getattr(crawler, "crawler_strategy", None), "browser_manager", None)
+        browser = getattr(manager, "browser", None)
+        # Persistent contexts have no separate Browser object to ask
+        return browser is None or browser.is_connected()
+
+    def healthy(self) -> bool:
+        """False while the running browser is dead or the last launch failed"""
+        if self.launch_error:
+            return False
+        return self._crawler is None or self.alive(self._crawler)
+
+    async def get(self) -> AsyncWebCrawler:
+        """Return the shared crawler, launching the browser on first use or after it died"""
+        crawler = self._crawler
+        if crawler is not None:
+            if self.alive(crawler):
+                return crawler
+            await self.recycle("browser disconnected", crawler)
+        async with self._lock:
+            if self._crawler is None:
+                crawler = AsyncWebCrawler(config=self.browser_config())
+                before = set(profiling.child_pids())
+                try:
+                    await crawler.start()
+                except Exception as e:
+                    self.launch_error = str(e)
+                    raise
+                self._roots[crawler] = self._driver_pids(crawler, before)
+                self._crawler = crawler
+                self.launched_at = time.time()
+                self.launch_error = None
+                logger.info("Browser launched")
+        return self._crawler
+
+    @staticmethod
+    def _driver_pids(crawler: AsyncWebCrawler, before: set) -> List[int]:
+        """
+        PID of the Playwright driver a crawler started (its browsers run
+        below it), else the children that appeared while it launched
+        """
+        manager = getattr(getattr(crawler, "crawler_strategy", None), "browser_manager", None)
+        try:
+            return [manager.playwright._impl_obj._connection._transport._proc.pid]
+        except AttributeError:
+            return sorted(set(profiling.child_pids()) - before)
+
+    def process_roots(self) -> List[int]:
+        """Root processes of the live browser's tree (empty if none is running)"""
+        return list(self._roots.get(self._crawler, [])) if self._crawler is not None else []
+
+    @property
+    def retiring(self) -> int:
+        """Recycled browsers still finishing crawls"""
+        return len(self._retired)
+
+    @asynccontextmanager
+    async def crawler(self):
+        """Lease the shared crawler for one crawl"""
+        crawler = await self.get()
+        self._leases[crawler] = self._leases.get(crawler, 0) + 1
+        try:
+            yield crawler
+        finally:
+            self._leases[crawler] -= 1
+            if not self._leases[crawler]:
+                del self._leases[crawler]
+                if crawler in self._retired:
+                    self._retired.discard(crawler)
+                    await self._close_quietly(crawler)
+            if crawler is self._crawler and not self.alive(crawler):
+                await self.recycle("browser disconnected during a crawl", crawler)
+
+    @staticmethod
+    async def _close_quietly(crawler: AsyncWebCrawler):
+        try:
+            await crawler.close()
+        except Exception as e:
+            logger.warning(f"Closing retired browser failed: {e}")
+
+    async def recycle(self, reason: str, crawler: Optional[AsyncWebCrawler] = None):
+        """
+        Replace the browser: the next crawl launches a new one, and the old
+        one is closed as soon as no crawl holds it. With `crawler`, only
+        recycle if that is still the current browser (another caller may
+        already have replaced it).
+        """
+        async with self._lock:
+            if crawler is not None and crawler is not self._crawler:
+                return
+            old, self._crawler = self._crawler, None
+            self._roots.pop(old, None)
+            self.warm = False
+            self.launched_at = None
+        if old is None:
+            return
+        self.recycles += 1
+        logger.warning(f"Recycling browser ({reason}); {self._leases.get(old, 0)} crawls still in flight")
+        if self._leases.get(old):
+            self._retired.add(old)
+        else:
+            await self._close_quietly(old)
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._crawler is not None,
+            "healthy": self.healthy(),
+            "launch_error": self.launch_error,
+            "warm": self.warm,
+            "uptime_seconds": round(time.time() - self.launched_at, 1) if self.launched_at else None,
+            "in_flight": sum(self._leases.values()),
+            "retired_pending_close": len(self._retired),
+            "recycles": self.recycles,
+        }
+
+    async def prewarm(self) -> float:
+        """Launch the browser and render a trivial page; returns the seconds taken"""
+        started = time.perf_counter()
+        async with self.crawler() as crawler:
+            result = await crawler.arun(url=WARMUP_HTML, config=CrawlerRunConfig(cache_mode=CacheMode.BYPASS))
+        if not result.success:
+            raise RuntimeError(f"Warm-up render failed: {result.error_message}")
+        self.warm = True
+        elapsed = time.perf_counter() - started
+        logger.info(f"Browser pre-warmed in {elapsed:.2f}s")
+        return elapsed
+
+    async def close(self):
+        for crawler in list(self._retired):
+            await self._close_quietly(crawler)
+        self._retired.clear()
+        async with self._lock:
+            if self._crawler is not None:
+                try:
+                    await self._crawler.close()
+                finally:
+                    self._crawler = None
+                    self.warm = False
@@ -0,0 +1,248 @@
+"""
+Canonical cache-key scheme shared by crawl4ai-service and mcp-server-fastmcp.
+
+Both services read and write the same Redis entries, so they must derive keys
+identically. This file is duplicated in each service directory (each has its
+own Docker build context); keep the copies in sync - `make check-shared`
+verifies they match.
+
+Key layout: ``oss:v{SCHEMA_VERSION}:{namespace}:{digest}``. Bump
+SCHEMA_VERSION whenever the shape of a cached payload changes so old entries
+are simply never read again instead of being misparsed.
+"""
+
+import hashlib
+import json
+import re
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+SCHEMA_VERSION = 3
+KEY_PREFIX = f"oss:v{SCHEMA_VERSION}"
+
+# Crawl parameter defaults - a request that omits a parameter and one that
+# passes the default explicitly must map to the same entry
+CRAWL_DEFAULTS = {
+    "extraction": "auto",
+    "chunking": "markdown",
+    "screenshot": False,
+}
+
+# Other crawl options that change the page content; they only enter the key
+# material when they differ from these defaults, so plain crawls keep their keys
+CRAWL_OPTION_DEFAULTS = {
+    "wait_for": None,
+    "js_code": None,
+    "css_selector": None,
+    "word_count_threshold": 10,
+    "readiness": "adaptive",
+}
+
+SEARCH_DEFAULTS = {
+    "categories": "general",
+    "language": "en",
+    "page": 1,
+    "safe_search": 0,
+    "max_results": 10,
+}
+
+# Query parameters that only carry tracking information
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "dclid", "yclid", "mc_cid", "mc_eid", "_ga", "ref_src"}
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# RFC 3986 unreserved characters: their escaped and literal forms are equivalent
+_UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+_PERCENT_ESCAPE_RE = re.compile(r"%([0-9A-Fa-f]{2})")
+
+# Queries containing these are order- or operator-sensitive; their terms are
+# never reordered
+_QUERY_OPERATOR_RE = re.compile(r'["()]|(^|\s)[-+~]|\b(OR|AND|NOT)\b|\w:\S')
+
+# Digests (fast_hash) are 32 lowercase hex digits
+_HANDLE_RE = re.compile(r"[0-9a-f]{32}")
+
+
+def fast_hash(data: str) -> str:
+    """128-bit BLAKE2b hex digest (faster than MD5/SHA on 64-bit CPUs)."""
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _normalize_escape(match: re.Match) -> str:
+    char = chr(int(match.group(1), 16))
+    return char if char in _UNRESERVED else match.group(0).upper()
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonicalize a URL so trivially different spellings share a cache entry.
+
+    Lowercases scheme and host, drops default ports, fragments and tracking
+    parameters, sorts the query string and normalizes percent-encoding:
+    escaped unreserved characters are decoded and other escapes uppercased,
+    so reserved escapes such as %2F keep their meaning.
+    """
+    url = url.strip()
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower().rstrip(".")
+
+    netloc = host
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parts.port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else "")
+        netloc = f"{userinfo}@{netloc}"
+
+    path = quote(parts.path, safe="/:@!$&'()*+,;=-._~%")
+    path = _PERCENT_ESCAPE_RE.sub(_normalize_escape, path) or "/"
+
+    query_pairs = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    query = urlencode(sorted(query_pairs))
+
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def canonical_host(url: str) -> str:
+    """Return the lowercased host of a URL without port or trailing dot."""
+    return (urlsplit(url.strip()).hostname or "").lower().rstrip(".")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query: case-fold, collapse whitespace and, when the
+    query is a plain bag of words, sort its terms.
+    """
+    collapsed = " ".join(query.split())
+    if _QUERY_OPERATOR_RE.search(collapsed):
+        # Operators and phrases change meaning when case-folded or reordered
+        return collapsed
+    return " ".join(sorted(collapsed.lower().split()))
+
+
+def normalize_engines(engines: Optional[str]) -> str:
+    """Normalize a comma-separated engine list into a sorted, de-duplicated form."""
+    if not engines:
+        return "all"
+    names = {e.strip().lower() for e in engines.split(",") if e.strip()}
+    return ",".join(sorted(names)) or "all"
+
+
+def digest(material: Any) -> str:
+    """Stable digest of JSON-serializable material."""
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":"), default=str)
+    return fast_hash(encoded)
+
+
+def make_key(namespace: str, material: Any) -> str:
+    """Build a versioned key from a namespace and JSON-serializable material."""
+    return f"{KEY_PREFIX}:{namespace}:{digest(material)}"
+
+
+def crawl_params(
+    extraction: Optional[str] = None,
+    chunking: Optional[str] = None,
+    screenshot: Optional[bool] = None,
+    **options: Any,
+) -> Dict[str, Any]:
+    """Fill in crawl parameter defaults; `options` are CRAWL_OPTION_DEFAULTS keys."""
+    params = {
+        "extraction": extraction or CRAWL_DEFAULTS["extraction"],
+        "chunking": chunking or CRAWL_DEFAULTS["chunking"],
+        "screenshot": bool(screenshot) if screenshot is not None else CRAWL_DEFAULTS["screenshot"],
+    }
+    for name, value in options.items():
+        if name not in CRAWL_OPTION_DEFAULTS:
+            raise TypeError(f"Unknown crawl option: {name}")
+        if value is not None and value != "" and value != CRAWL_OPTION_DEFAULTS[name]:
+            params[name] = value
+    return params
+
+
+def schema_extraction(schema: Dict[str, Any]) -> str:
+    """Extraction parameter of a crawl with a structured-extraction schema."""
+    return f"schema:{digest(schema)}"
+
+
+def crawl_digest(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Digest identifying a crawl; doubles as the batch job ID."""
+    return digest({"url": canonicalize_url(url), **crawl_params(**(params or {}))})
+
+
+def crawl_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Key of the full crawl4ai CrawlResponse payload for a URL."""
+    return crawl_key_from_digest(crawl_digest(url, params))
+
+
+def crawl_key_from_digest(job_id: str) -> str:
+    """Key of a crawl entry given its digest (job ID)."""
+    return f"{KEY_PREFIX}:crawl:{job_id}"
+
+
+def chunks_key_from_digest(job_id: str) -> str:
+    """Key of the Redis list holding a crawl's paginated markdown."""
+    return f"{KEY_PREFIX}:chunks:{job_id}"
+
+
+def url_failure_key(url: str) -> str:
+    """Key of the negative-cache entry of a URL (any crawl parameters)."""
+    return make_key("fail:url", canonicalize_url(url))
+
+
+def host_failure_key(host: str) -> str:
+    """Key of the negative-cache entry counting host-level failures."""
+    return make_key("fail:host", host.lower().rstrip("."))
+
+
+def failure_key(cache_key: str) -> str:
+    """Key of the negative-cache entry for a cache key (e.g. a search)."""
+    return f"{KEY_PREFIX}:fail:{cache_key[len(KEY_PREFIX) + 1:]}"
+
+
+def simhash_band_key(chunking: str, band: int, value: str) -> str:
+    """Key of the near-duplicate index entry for one band of a page fingerprint."""
+    return make_key("simhash", [chunking, band, value])
+
+
+def readiness_key(host: str) -> str:
+    """Key of the learned page-readiness statistics of a host."""
+    return make_key("readiness", host.lower().rstrip("."))
+
+
+def search_key(
+    query: str,
+    engines: Optional[str] = None,
+    categories: Optional[str] = None,
+    language: Optional[str] = None,
+    page: int = 1,
+    safe_search: int = 0,
+    max_results: int = 10,
+) -> str:
+    """Key of a formatted web_search response."""
+    material = {
+        "q": normalize_query(query),
+        "engines": normalize_engines(engines),
+        "categories": (categories or SEARCH_DEFAULTS["categories"]).strip().lower(),
+        "language": (language or SEARCH_DEFAULTS["language"]).strip().lower(),
+        "page": int(page),
+        "safe_search": int(safe_search),
+        "max_results": int(max_results),
+    }
+    return make_key("search", material)
+
+
+def search_handle(cache_key: str) -> str:
+    """Handle of a cached web_search response: the digest part of its key."""
+    return cache_key.rsplit(":", 1)[-1]
+
+
+def search_key_from_handle(handle: str) -> Optional[str]:
+    """Key of a web_search response given its handle, or None if it is malformed."""
+    if not _HANDLE_RE.fullmatch(handle or ""):
+        return None
+    return f"{KEY_PREFIX}:search:{handle}"
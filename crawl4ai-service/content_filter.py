@@ -0,0 +1,248 @@
+"""
+Query-focused pruning of crawled markdown, shared by crawl4ai-service and
+mcp-server-fastmcp.
+
+Pages are cached in full once; pruning runs per query on the cached markdown,
+so a new question about the same page costs a BM25 pass over a few hundred
+passages instead of a re-crawl. This file is duplicated in each service
+directory; keep the copies in sync - `make check-shared` verifies they match.
+
+Pruning happens in two steps:
+
+1. Boilerplate removal: link-dense blocks (navigation, footers, link
+   lists), lines repeated across the page and tiny fragments are dropped.
+   Fenced code blocks are kept whole and exempt from these rules.
+2. Relevance: the remaining blocks are merged into passages of roughly
+   PASSAGE_CHARS, scored against the query with Okapi BM25 (the nearest
+   heading counts towards a passage's terms), and the best passages are
+   returned in document order until `max_chars` is reached.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+PASSAGE_CHARS = 600
+# Blocks whose visible text is mostly link text are navigation
+MAX_LINK_DENSITY = 0.6
+MIN_BLOCK_WORDS = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_LINK_RE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.*)$")
+_FENCE_RE = re.compile(r"^(`{3,}|~{3,})")
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i in is it its of on or "
+    "that the this to was were what when where which who why will with you your".split()
+)
+
+
+# Crude suffix stripping so "install", "installs" and "installation" match
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ed", "es", "s")
+
+
+def _stem(token: str) -> str:
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _visible_text(block: str) -> str:
+    return _LINK_RE.sub(r"\1", block)
+
+
+def _link_density(block: str) -> float:
+    visible = _visible_text(block)
+    if not visible.strip():
+        return 1.0
+    link_chars = sum(len(m.group(1)) for m in _LINK_RE.finditer(block))
+    return link_chars / len(visible)
+
+
+def _closes(stripped: str, fence: str) -> bool:
+    """Whether a (stripped) line closes the code fence opened by `fence`"""
+    match = _FENCE_RE.match(stripped)
+    return bool(match) and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence) \
+        and not stripped[len(match.group(1)):].strip()
+
+
+def _close_fence(text: str) -> str:
+    """Terminate a code fence left open (e.g. by truncation)"""
+    fence = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if fence is None:
+            match = _FENCE_RE.match(stripped)
+            fence = match.group(1) if match else None
+        elif _closes(stripped, fence):
+            fence = None
+    return f"{text}\n{fence}" if fence else text
+
+
+def split_blocks(markdown: str) -> List[Dict[str, Any]]:
+    """
+    Split markdown into paragraph blocks, each tagged with its nearest
+    heading, dropping boilerplate. A fenced code block is one block, kept
+    as is.
+    """
+    lines = markdown.splitlines()
+
+    # Mark the lines inside code fences: "code", or "end" for a closing fence
+    in_code: List[Optional[str]] = []
+    fence = None
+    for line in lines:
+        stripped = line.strip()
+        if fence is None:
+            match = _FENCE_RE.match(stripped)
+            fence = match.group(1) if match else None
+            in_code.append("code" if fence else None)
+        elif _closes(stripped, fence):
+            in_code.append("end")
+            fence = None
+        else:
+            in_code.append("code")
+
+    # Lines that occur several times (menus repeated in header and footer, "Share" widgets)
+    counts = Counter(l.strip() for l, code in zip(lines, in_code) if l.strip() and not code)
+    repeated = {line for line, n in counts.items() if n >= 3}
+
+    blocks, current, code, heading = [], [], [], ""
+
+    def flush_code():
+        if code:
+            blocks.append({"heading": heading, "text": _close_fence("\n".join(code))})
+            code.clear()
+
+    def flush():
+        if current:
+            text = "\n".join(current).strip()
+            words = len(_visible_text(text).split())
+            if text and words >= MIN_BLOCK_WORDS and _link_density(text) <= MAX_LINK_DENSITY:
+                blocks.append({"heading": heading, "text": text})
+            current.clear()
+
+    for line, is_code in zip(lines, in_code):
+        if is_code:
+            if not code:
+                flush()
+            code.append(line)
+            if is_code == "end":
+                flush_code()
+            continue
+        flush_code()
+        stripped = line.strip()
+        match = _HEADING_RE.match(stripped)
+        if match:
+            flush()
+            heading = _visible_text(match.group(1)).strip()
+        elif not stripped:
+            flush()
+        elif stripped not in repeated:
+            current.append(line)
+    flush()
+    flush_code()
+    return blocks
+
+
+def make_passages(blocks: List[Dict[str, Any]], target_chars: int = PASSAGE_CHARS) -> List[Dict[str, Any]]:
+    """Merge consecutive blocks under the same heading into passages of about `target_chars`"""
+    passages: List[Dict[str, Any]] = []
+    for block in blocks:
+        last = passages[-1] if passages else None
+        if (
+            last
+            and last["heading"] == block["heading"]
+            and len(last["text"]) + len(block["text"]) <= target_chars
+        ):
+            last["text"] += "\n\n" + block["text"]
+        else:
+            passages.append({"heading": block["heading"], "text": block["text"]})
+    for index, passage in enumerate(passages):
+        passage["index"] = index
+    return passages
+
+
+def bm25_scores(query: str, passages: List[Dict[str, Any]]) -> List[float]:
+    """Okapi BM25 score of each passage (heading + text) for the query"""
+    terms = set(tokenize(query))
+    docs = [Counter(tokenize(f"{p['heading']} {p['text']}")) for p in passages]
+    if not terms or not docs:
+        return [0.0] * len(passages)
+    lengths = [sum(doc.values()) for doc in docs]
+    avg_length = sum(lengths) / len(docs) or 1.0
+    idf = {}
+    for term in terms:
+        df = sum(1 for doc in docs if term in doc)
+        idf[term] = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+    scores = []
+    for doc, length in zip(docs, lengths):
+        score = 0.0
+        for term in terms:
+            tf = doc.get(term, 0)
+            if not tf:
+                continue
+            score += idf[term] * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+def prune_markdown(markdown: str, query: Optional[str], max_chars: int = 4000) -> Dict[str, Any]:
+    """
+    Return the passages of `markdown` most relevant to `query`, at most
+    `max_chars` in total, in document order.
+
+    With no query (or no passage matching it) the leading non-boilerplate
+    passages are returned instead. The result holds the pruned markdown plus
+    sizes and the kept passages' indexes and scores.
+    """
+    passages = make_passages(split_blocks(markdown or ""))
+    scores = bm25_scores(query or "", passages)
+    for passage, score in zip(passages, scores):
+        passage["score"] = round(score, 4)
+
+    matched = any(score > 0 for score in scores)
+    if matched:
+        ranked = sorted((p for p in passages if p["score"] > 0), key=lambda p: p["score"], reverse=True)
+    else:
+        ranked = passages
+
+    kept, used = [], 0
+    for passage in ranked:
+        size = len(passage["text"]) + (len(passage["heading"]) + 4 if passage["heading"] else 0)
+        if used + size > max_chars:
+            if kept:
+                continue
+            # A single oversized best passage is cut rather than dropped
+            passage = {**passage, "text": _close_fence(passage["text"][:max_chars])}
+            size = max_chars
+        kept.append(passage)
+        used += size
+        if used >= max_chars:
+            break
+    kept.sort(key=lambda p: p["index"])
+
+    sections, last_heading = [], None
+    for passage in kept:
+        if passage["heading"] and passage["heading"] != last_heading:
+            sections.append(f"## {passage['heading']}")
+        last_heading = passage["heading"]
+        sections.append(passage["text"])
+
+    pruned = "\n\n".join(sections)
+    return {
+        "markdown": pruned,
+        "query": query,
+        "matched": matched,
+        "total_chars": len(markdown or ""),
+        "kept_chars": len(pruned),
+        "passages_total": len(passages),
+        "passages_kept": [{"index": p["index"], "score": p["score"]} for p in kept],
+    }
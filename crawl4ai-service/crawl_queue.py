@@ -0,0 +1,305 @@
+"""
+Redis Streams work queue for split API / worker deployments.
+
+With CRAWL_MODE=queue the FastAPI app enqueues crawl jobs instead of running
+the browser itself, and a fleet of worker processes (worker.py) consumes them
+through a consumer group. Jobs are acknowledged only after their result is
+cached; jobs left pending by a crashed or stuck worker are reclaimed with
+XAUTOCLAIM and retried, and moved to a dead-letter stream after
+QUEUE_MAX_ATTEMPTS deliveries. Failures a retry can't fix (the page itself
+failed, or its URL is backing off) are marked failed at once with their
+error, so waiting callers get it instead of a timeout.
+
+Jobs enqueued on behalf of a caller with a deadline carry it; workers drop
+jobs whose deadline has passed instead of crawling for nobody. A caller
+that joins an in-flight job extends its deadline to the later of the two
+(or removes it), and a page cut short by the deadline is handed back
+through a short-lived partial-result key, since partial pages are never
+cached.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+CRAWL_MODE = os.getenv("CRAWL_MODE", "inline")  # inline | queue
+
+# The hash tag keeps both streams in one cluster slot so a single XREADGROUP
+# can block on them together
+JOB_STREAM = os.getenv("QUEUE_STREAM", "{oss-crawl}:jobs")
+LOW_PRIORITY_STREAM = f"{JOB_STREAM}:low"
+DEAD_LETTER_STREAM = f"{JOB_STREAM}:dead"
+CONSUMER_GROUP = os.getenv("QUEUE_GROUP", "crawl-workers")
+
+# Approximate cap on stream length so a stalled fleet can't exhaust Redis memory
+STREAM_MAXLEN = int(os.getenv("QUEUE_MAXLEN", "100000"))
+# Pending jobs idle longer than this are assumed lost and reclaimed
+CLAIM_IDLE_MS = int(os.getenv("QUEUE_CLAIM_IDLE_MS", "180000"))
+MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+# How long job status entries are kept
+STATUS_TTL = int(os.getenv("QUEUE_STATUS_TTL", "3600"))
+# How long a partial result waits for the callers of its job
+PARTIAL_TTL = int(os.getenv("QUEUE_PARTIAL_TTL", "60"))
+
+# States of a job that will still produce a result; "retrying" means an
+# attempt failed and the job is waiting to be reclaimed
+IN_FLIGHT_STATES = ("queued", "running", "retrying")
+
+
+class JobFailed(Exception):
+    """
+    Raised by a handler for a failure that retrying won't fix: the job is
+    acknowledged and marked failed right away with `detail` and `status_code`
+    """
+
+    def __init__(self, detail: Any, status_code: int = 500):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def job_status_key(job_id: str) -> str:
+    """Key of a queued job's status entry"""
+    return f"oss:crawl:job:{job_id}"
+
+
+def job_partial_key(job_id: str) -> str:
+    """Key of the partial result a worker hands back for a job"""
+    return f"oss:crawl:job:{job_id}:partial"
+
+
+async def set_partial_result(client: redis.Redis, job_id: str, payload: str):
+    """Hand a partial (uncached) result back to the job's waiting callers"""
+    await client.setex(job_partial_key(job_id), PARTIAL_TTL, payload)
+
+
+async def get_partial_result(client: redis.Redis, job_id: str) -> Optional[str]:
+    return await client.get(job_partial_key(job_id))
+
+
+async def get_job_status(client: redis.Redis, job_id: str) -> Optional[Dict[str, Any]]:
+    """Return a job's status ({"state": queued|running|retrying|done|failed, ...}) if known"""
+    raw = await client.get(job_status_key(job_id))
+    return json.loads(raw) if raw else None
+
+
+async def set_job_status(client: redis.Redis, job_id: str, state: str, **extra):
+    """Record a job's state"""
+    status = {"state": state, "updated": time.time(), **extra}
+    await client.setex(job_status_key(job_id), STATUS_TTL, json.dumps(status))
+
+
+async def ensure_groups(client: redis.Redis):
+    """Create the consumer group on both job streams if missing"""
+    for stream in (JOB_STREAM, LOW_PRIORITY_STREAM):
+        try:
+            await client.xgroup_create(stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+
+async def enqueue(
+    client: redis.Redis,
+    job_id: str,
+    request: Dict[str, Any],
+    priority: str = "normal",
+    deadline: Optional[float] = None,
+) -> bool:
+    """
+    Enqueue a crawl job. Returns False if the same job is already queued or
+    running, so concurrent requests for one URL share a single crawl.
+    `deadline` (epoch seconds) is when the caller stops waiting for it; the
+    job's status carries the latest deadline of everyone sharing it.
+    """
+    claimed = await client.set(
+        job_status_key(job_id),
+        json.dumps({"state": "queued", "updated": time.time(), "deadline": deadline}),
+        nx=True,
+        ex=STATUS_TTL,
+    )
+    if not claimed:
+        status = await get_job_status(client, job_id)
+        if status and status["state"] in IN_FLIGHT_STATES:
+            await extend_deadline(client, job_id, status, deadline)
+            return False
+        await set_job_status(client, job_id, "queued", deadline=deadline)
+
+    stream = LOW_PRIORITY_STREAM if priority == "low" else JOB_STREAM
+    fields = {"job_id": job_id, "request": json.dumps(request)}
+    if deadline is not None:
+        fields["deadline"] = repr(deadline)
+    await client.xadd(
+        stream,
+        fields,
+        maxlen=STREAM_MAXLEN,
+        approximate=True,
+    )
+    return True
+
+
+async def extend_deadline(client: redis.Redis, job_id: str, status: Dict[str, Any], deadline: Optional[float]):
+    """Keep an in-flight job alive until its latest caller's deadline (None: no deadline)"""
+    current = status.get("deadline")
+    if "deadline" not in status or current is None:
+        return
+    extended = None if deadline is None else max(current, deadline)
+    if extended != current:
+        await client.setex(job_status_key(job_id), STATUS_TTL, json.dumps({**status, "deadline": extended}))
+
+
+async def wait_for_job(client: redis.Redis, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    Poll a job's status until it finishes or `timeout` seconds pass.
+    Returns the final status, or None on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while time.monotonic() < deadline:
+        status = await get_job_status(client, job_id)
+        if status and status["state"] in ("done", "failed"):
+            return status
+        await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 1.0)
+    return None
+
+
+class CrawlWorker:
+    """
+    Consumes crawl jobs from the streams and runs them with `handler`.
+
+    `handler(job_id, request_dict, deadline)` must cache the result before
+    returning. Raising JobFailed fails the job at once (state "failed");
+    any other exception leaves it pending for retry (state "retrying"), or
+    dead-letters it after the last attempt. `deadline` is the epoch time the
+    caller stops waiting, or None.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        handler: Callable[[str, Dict[str, Any], Optional[float]], Awaitable[None]],
+        concurrency: int = 1,
+        consumer: Optional[str] = None,
+    ):
+        self.client = client
+        self.handler = handler
+        self.concurrency = concurrency
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        await ensure_groups(self.client)
+        logger.info(f"Crawl worker {self.consumer} consuming {JOB_STREAM} with concurrency {self.concurrency}")
+        await asyncio.gather(*(self._consume() for _ in range(self.concurrency)))
+
+    async def _consume(self):
+        while not self._stopping.is_set():
+            try:
+                reclaimed = await self._reclaim()
+                for entry in ([reclaimed] if reclaimed else await self._read()):
+                    await self._process(*entry)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Crawl worker error: {e}")
+                await asyncio.sleep(1)
+
+    async def _reclaim(self):
+        """Take over one job left pending too long by another consumer"""
+        for stream in (JOB_STREAM, LOW_PRIORITY_STREAM):
+            result = await self.client.xautoclaim(
+                stream, CONSUMER_GROUP, self.consumer, CLAIM_IDLE_MS, start_id="0-0", count=1
+            )
+            claimed = result[1] if result else []
+            if claimed and claimed[0][1]:
+                message_id, fields = claimed[0]
+                logger.warning(f"Reclaimed stuck job {fields.get('job_id')} from {stream}")
+                return stream, message_id, fields
+        return None
+
+    async def _read(self):
+        """Read new jobs, preferring the normal-priority stream"""
+        response = await self.client.xreadgroup(
+            CONSUMER_GROUP, self.consumer, {JOB_STREAM: ">"}, count=1
+        )
+        if not response:
+            # Nothing urgent: block on both streams (at most one job from each)
+            response = await self.client.xreadgroup(
+                CONSUMER_GROUP, self.consumer,
+                {JOB_STREAM: ">", LOW_PRIORITY_STREAM: ">"}, count=1, block=5000
+            )
+        return [
+            (stream, message_id, fields)
+            for stream, messages in (response or [])
+            for message_id, fields in messages
+        ]
+
+    async def _deliveries(self, stream: str, message_id: str) -> int:
+        pending = await self.client.xpending_range(
+            stream, CONSUMER_GROUP, min=message_id, max=message_id, count=1
+        )
+        return pending[0]["times_delivered"] if pending else 1
+
+    async def _process(self, stream: str, message_id: str, fields: Dict[str, str]):
+        job_id = fields["job_id"]
+        attempts = await self._deliveries(stream, message_id)
+        if attempts > MAX_ATTEMPTS:
+            await self._dead_letter(stream, message_id, fields, "Maximum attempts exceeded")
+            return
+
+        deadline = float(fields["deadline"]) if fields.get("deadline") else None
+        status = await get_job_status(self.client, job_id)
+        if status and "deadline" in status:
+            # Later callers may have extended (or removed) the deadline
+            deadline = status["deadline"]
+        if deadline is not None and deadline <= time.time():
+            logger.info(f"Dropping job {job_id}: its caller's deadline has passed")
+            await self._ack(stream, message_id)
+            await set_job_status(self.client, job_id, "failed", error="Deadline exceeded before the crawl started")
+            return
+
+        await set_job_status(
+            self.client, job_id, "running", worker=self.consumer, attempt=attempts, deadline=deadline
+        )
+        try:
+            await self.handler(job_id, json.loads(fields["request"]), deadline)
+        except JobFailed as e:
+            logger.info(f"Job {job_id} failed: {e.detail}")
+            await self._ack(stream, message_id)
+            await set_job_status(self.client, job_id, "failed", error=e.detail, status_code=e.status_code)
+            return
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e)
+            logger.warning(f"Job {job_id} attempt {attempts} failed: {error}")
+            if attempts >= MAX_ATTEMPTS:
+                await self._dead_letter(stream, message_id, fields, error)
+                return
+            # Leave the job pending; it is retried once it has been idle for CLAIM_IDLE_MS
+            await set_job_status(self.client, job_id, "retrying", error=error, attempt=attempts, deadline=deadline)
+            return
+
+        await self._ack(stream, message_id)
+        await set_job_status(self.client, job_id, "done")
+
+    async def _dead_letter(self, stream: str, message_id: str, fields: Dict[str, str], error: str):
+        """Give up on a job: move it to the dead-letter stream and mark it failed"""
+        logger.error(f"Job {fields['job_id']} failed after {MAX_ATTEMPTS} attempts, moving to dead-letter stream")
+        await self.client.xadd(DEAD_LETTER_STREAM, fields, maxlen=STREAM_MAXLEN, approximate=True)
+        await self._ack(stream, message_id)
+        await set_job_status(self.client, fields["job_id"], "failed", error=error)
+
+    async def _ack(self, stream: str, message_id: str):
+        await self.client.xack(stream, CONSUMER_GROUP, message_id)
+        await self.client.xdel(stream, message_id)
@@ -3,20 +3,38 @@ Crawl4AI Service - FastAPI Wrapper for Web Crawling
 Provides RESTful API for the Crawl4AI library
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, HttpUrl, Field, field_validator
-from typing import Optional, List, Dict, Any
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header, Depends, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import AfterValidator, BaseModel, HttpUrl, Field, field_validator
+from typing import Annotated, Optional, List, Dict, Any, Tuple
 import asyncio
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
-from crawl4ai.extraction_strategy import LLMExtractionStrategy, CosineStrategy
-from crawl4ai.chunking_strategy import RegexChunking, SlidingWindowChunking
-# MarkdownChunking removed in newer versions - use RegexChunking for markdown
+from crawl4ai import CrawlerRunConfig, CacheMode
 import redis.asyncio as redis
-import hashlib
+from redis.asyncio.cluster import RedisCluster
 import json
 import logging
+import os
+import secrets
 from datetime import datetime
+from browser_pool import BrowserPool
+import cache_keys
+import content_filter
+import crawl_queue
+import dedup
+import negative_cache
+import page_archive
+import postprocess
+import profiling
+import readiness
+import screenshot_store
+import site_crawl
+import structured
+from postprocess import get_chunking_strategy
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,10 +47,90 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Redis connection
+# Redis connection (RedisCluster when REDIS_CLUSTER=true)
 redis_client: Optional[redis.Redis] = None
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() == "true"
+
+# Maximum job IDs per bulk result request
+MAX_BULK_RESULTS = int(os.getenv("MAX_BULK_RESULTS", "500"))
+
+# Low-priority (speculative prefetch) crawls share a small concurrency budget so
+# they never compete with interactive requests for browser capacity
+LOW_PRIORITY_CONCURRENCY = int(os.getenv("LOW_PRIORITY_CONCURRENCY", "1"))
+low_priority_semaphore: Optional[asyncio.Semaphore] = None
+
+# Extra time an API request waits for a queued crawl beyond its page timeout
+QUEUE_WAIT_SLACK = int(os.getenv("QUEUE_WAIT_SLACK", "30"))
+
+# Process pool for CPU-bound post-processing (see postprocess.py)
+postprocess_pool: Optional[postprocess.PostProcessPool] = None
+
+# Shared browser, launched and warmed at startup unless BROWSER_PREWARM=false
+# (API pods in queue mode never crawl, so they skip it)
+browser_pool = BrowserPool()
+BROWSER_PREWARM = os.getenv("BROWSER_PREWARM", "true").lower() == "true"
+
+# Readiness: set once startup (including pre-warm) has finished, cleared on shutdown
+service_ready = False
+startup_timings: Dict[str, float] = {"imports": round(IMPORT_SECONDS, 3)}
+startup_error: Optional[str] = None
+
+# Browsers are recycled when their RSS passes BROWSER_RSS_LIMIT_MB (0 disables)
+BROWSER_RSS_LIMIT_MB = int(os.getenv("BROWSER_RSS_LIMIT_MB", "1200"))
+BROWSER_RSS_CHECK_SECONDS = int(os.getenv("BROWSER_RSS_CHECK_SECONDS", "30"))
+browser_watchdog_task: Optional[asyncio.Task] = None
+# Started by /health/ready when the browser died outside a crawl or failed to launch
+browser_relaunch_task: Optional[asyncio.Task] = None
+
+# /debug endpoints (profiling, tracemalloc, memory) are off unless enabled, and
+# require X-Debug-Token when DEBUG_TOKEN is set
+DEBUG_ENDPOINTS_ENABLED = os.getenv("DEBUG_ENDPOINTS_ENABLED", "false").lower() == "true"
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+MAX_PROFILE_SECONDS = int(os.getenv("MAX_PROFILE_SECONDS", "120"))
+request_memory_log = profiling.RequestMemoryLog()
+profile_lock = asyncio.Lock()
+
+# On-disk cold tier below Redis (see page_archive.py)
+archive: Optional[page_archive.ShardedArchive] = None
+archive_compaction_task: Optional[asyncio.Task] = None
+
+# Callers send their remaining time budget in X-Request-Deadline-Ms. A crawl
+# is refused if less than MIN_CRAWL_SECONDS remain, and its page timeout is cut
+# so DEADLINE_RESERVE_SECONDS are left for post-processing and the response.
+MIN_CRAWL_SECONDS = float(os.getenv("MIN_CRAWL_SECONDS", "3"))
+DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "2"))
+
+# Failed crawls are negative-cached with exponential backoff per URL and host
+# (see negative_cache.py), so retries of a dead page fail fast
+NEGATIVE_CACHE_ENABLED = os.getenv("NEGATIVE_CACHE_ENABLED", "true").lower() == "true"
+BACKOFF_BASE_SECONDS = float(os.getenv("BACKOFF_BASE_SECONDS", str(negative_cache.BACKOFF_BASE_SECONDS)))
+BACKOFF_MAX_SECONDS = float(os.getenv("BACKOFF_MAX_SECONDS", str(negative_cache.BACKOFF_MAX_SECONDS)))
+HOST_FAILURE_THRESHOLD = int(os.getenv("HOST_FAILURE_THRESHOLD", str(negative_cache.HOST_FAILURE_THRESHOLD)))
+
+# Without a wait_for selector, wait until the page has settled (DOM, network and
+# text quiet for READINESS_QUIET_MS) but no longer than READINESS_MAX_WAIT_MS;
+# per-host settle times are learned (see readiness.py)
+ADAPTIVE_READINESS = os.getenv("ADAPTIVE_READINESS", "true").lower() == "true"
+READINESS_QUIET_MS = int(os.getenv("READINESS_QUIET_MS", str(readiness.QUIET_MS)))
+READINESS_MAX_WAIT_MS = int(os.getenv("READINESS_MAX_WAIT_MS", str(readiness.MAX_WAIT_MS)))
+
+# Pages within DEDUP_MAX_DISTANCE SimHash bits of a cached page are stored as a
+# reference to it instead of a second copy (see dedup.py)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", str(dedup.MAX_DISTANCE)))
 
 # Pydantic models
+def validate_extraction_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Compile the schema up front (the compilation is cached) so a bad one is a 422"""
+    try:
+        structured.compile_schema(schema)
+    except structured.SchemaError as e:
+        raise ValueError(f"Invalid extraction schema: {e}")
+    return schema
+
+# CSS/XPath extraction schema (see structured.py); replaces extraction_strategy when set
+ExtractionSchema = Annotated[Dict[str, Any], AfterValidator(validate_extraction_schema)]
+
 class CrawlRequest(BaseModel):
     url: HttpUrl
     extraction_strategy: str = Field(default="auto", pattern="^(auto|llm|cosine)$")
@@ -43,13 +141,44 @@ class CrawlRequest(BaseModel):
     js_code: Optional[str] = None
     css_selector: Optional[str] = None
     word_count_threshold: int = Field(default=10, ge=1)
+    # Return only the passages relevant to `query`, at most `max_chars` (the full page is still cached)
+    query: Optional[str] = None
+    max_chars: int = Field(default=4000, ge=200, le=200000)
+    # "adaptive": extract once the page settles (ignored when wait_for is set); "load": right after DOMContentLoaded
+    readiness: str = Field(default="adaptive", pattern="^(adaptive|load)$")
+    extraction_schema: Optional[ExtractionSchema] = None
 
 class BatchCrawlRequest(BaseModel):
     urls: List[HttpUrl]
     extraction_strategy: str = Field(default="auto", pattern="^(auto|llm|cosine)$")
+    extraction_schema: Optional[ExtractionSchema] = None
     chunking_strategy: str = Field(default="markdown", pattern="^(regex|markdown|sliding)$")
     screenshot: bool = False
     timeout: int = Field(default=30, ge=5, le=120)
+    priority: str = Field(default="normal", pattern="^(normal|low)$")
+
+class SiteCrawlRequest(BaseModel):
+    url: HttpUrl
+    max_depth: int = Field(default=2, ge=0, le=5)
+    max_pages: int = Field(default=50, ge=1, le=500)
+    path_prefix: Optional[str] = None  # Defaults to the seed URL's directory
+    include_subdomains: bool = False
+    concurrency: int = Field(default=4, ge=1, le=16)
+    extraction_strategy: str = Field(default="auto", pattern="^(auto|llm|cosine)$")
+    extraction_schema: Optional[ExtractionSchema] = None
+    chunking_strategy: str = Field(default="markdown", pattern="^(regex|markdown|sliding)$")
+    timeout: int = Field(default=30, ge=5, le=120)
+    include_html: bool = False
+
+class ExtractRequest(BaseModel):
+    extraction_schema: ExtractionSchema
+    # Extract from this HTML, or else from the HTML cached for this crawl job
+    html: Optional[str] = None
+    job_id: Optional[str] = None
+
+class BulkResultRequest(BaseModel):
+    job_ids: List[str] = Field(min_length=1)
+    stream: bool = False
 
 class CrawlResponse(BaseModel):
     url: str
@@ -58,8 +187,14 @@ class CrawlResponse(BaseModel):
     links: List[str]
     media: Dict[str, List[str]]
     metadata: Dict[str, Any]
-    screenshot: Optional[str] = None
+    extracted_content: Optional[Any] = None
+    screenshot: Optional[str] = None  # Legacy inline base64; new entries use screenshot_ref
+    screenshot_ref: Optional[Dict[str, Any]] = None
     timestamp: str
+    partial: bool = False  # Page timed out at the caller's deadline; content is what had loaded
+    relevance: Optional[Dict[str, Any]] = None  # Pruning stats when the request had a query
+    chunks: Optional[Dict[str, Any]] = None  # Pagination info; pages are read from /result/{job_id}/chunks/{index}
+    duplicate_of: Optional[Dict[str, Any]] = None  # Cached page this one nearly duplicates; its body is stored once
     
     @field_validator('links', mode='before')
     @classmethod
@@ -93,10 +228,38 @@ class HealthResponse(BaseModel):
 
 # Startup/Shutdown
 @app.on_event("startup")
-async def startup_event():
-    global redis_client
+async def startup_event(prewarm: Optional[bool] = None):
+    """
+    Connect Redis, start the post-processing pool and archive, and pre-warm
+    the browser (by default only when this process crawls inline; the crawl
+    worker passes prewarm=True). /health/ready passes once this returns.
+    """
+    global redis_client, low_priority_semaphore, postprocess_pool, archive, archive_compaction_task
+    global service_ready, startup_error, browser_watchdog_task
+    started = time.perf_counter()
+    
+    step = time.perf_counter()
+    low_priority_semaphore = asyncio.Semaphore(LOW_PRIORITY_CONCURRENCY)
+    postprocess_pool = postprocess.create_pool()
+    postprocess_pool.start()
+    startup_timings["postprocess_pool"] = round(time.perf_counter() - step, 3)
+    
+    removed = await asyncio.to_thread(screenshot_store.prune_screenshots)
+    if removed:
+        logger.info(f"Pruned {removed} expired screenshots")
+    
+    step = time.perf_counter()
+    try:
+        archive = await asyncio.to_thread(page_archive.create_archive)
+        if archive:
+            archive_compaction_task = asyncio.create_task(compact_archive_periodically())
+    except Exception as e:
+        logger.error(f"Page archive unavailable: {e}")
+        archive = None
+    startup_timings["archive"] = round(time.perf_counter() - step, 3)
+    
+    step = time.perf_counter()
     try:
-        import os
         redis_host = os.getenv("REDIS_HOST", "redis")
         redis_port = os.getenv("REDIS_PORT", "6379")
         redis_password = os.getenv("REDIS_PASSWORD", "")
@@ -105,88 +268,410 @@ async def startup_event():
             redis_url = f"redis://:{redis_password}@{redis_host}:{redis_port}"
         else:
             redis_url = f"redis://{redis_host}:{redis_port}"
-        redis_client = await redis.from_url(
-            redis_url,
-            encoding="utf-8",
-            decode_responses=True
-        )
+        if REDIS_CLUSTER:
+            # Cluster client routes each key to its slot owner
+            redis_client = RedisCluster.from_url(
+                redis_url,
+                encoding="utf-8",
+                decode_responses=True
+            )
+        else:
+            redis_client = await redis.from_url(
+                redis_url,
+                encoding="utf-8",
+                decode_responses=True
+            )
         await redis_client.ping()
         logger.info("Redis connected successfully")
     except Exception as e:
         logger.error(f"Redis connection failed: {e}")
         redis_client = None
+    startup_timings["redis"] = round(time.perf_counter() - step, 3)
+    
+    if prewarm is None:
+        prewarm = BROWSER_PREWARM and crawl_queue.CRAWL_MODE != "queue"
+    if prewarm:
+        try:
+            startup_timings["browser_prewarm"] = round(await browser_pool.prewarm(), 3)
+        except Exception as e:
+            # Stay unready: traffic would only hit a broken browser
+            startup_error = f"Browser pre-warm failed: {e}"
+            logger.error(startup_error)
+    
+    if BROWSER_RSS_LIMIT_MB > 0:
+        browser_watchdog_task = asyncio.create_task(watch_browser_memory())
+    
+    startup_timings["startup"] = round(time.perf_counter() - started, 3)
+    service_ready = startup_error is None
+    logger.info(f"Startup finished in {startup_timings['startup']:.2f}s (imports {IMPORT_SECONDS:.2f}s): {startup_timings}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    global service_ready
+    # Fail readiness first so no new traffic arrives while draining
+    service_ready = False
+    if browser_watchdog_task:
+        browser_watchdog_task.cancel()
+    await browser_pool.close()
+    if postprocess_pool:
+        postprocess_pool.shutdown()
+    if archive_compaction_task:
+        archive_compaction_task.cancel()
+    if archive:
+        await asyncio.to_thread(archive.close)
     if redis_client:
         await redis_client.close()
 
 # Helper functions
-def get_chunking_strategy(strategy_name: str):
-    """Get chunking strategy based on name"""
-    strategies = {
-        "regex": RegexChunking(),
-        "markdown": RegexChunking(),  # Use RegexChunking for markdown (MarkdownChunking removed)
-        "sliding": SlidingWindowChunking()
-    }
-    return strategies.get(strategy_name, RegexChunking())
-
-def get_extraction_strategy(strategy_name: str):
-    """Get extraction strategy based on name"""
-    if strategy_name == "cosine":
-        return CosineStrategy(
-            semantic_filter="",
-            word_count_threshold=10,
-            max_dist=0.2,
-            linkage_method="ward",
-            top_k=3
-        )
-    # For 'auto' and 'llm', we'll use default extraction
-    return None
+async def watch_browser_memory():
+    """
+    Recycle the shared browser once the PSS of its process tree passes
+    BROWSER_RSS_LIMIT_MB. Only the live browser is measured, and checks pause
+    while a recycled one is still draining so its memory can't trigger
+    another recycle.
+    """
+    limit = BROWSER_RSS_LIMIT_MB * 1024 * 1024
+    while True:
+        await asyncio.sleep(BROWSER_RSS_CHECK_SECONDS)
+        try:
+            roots = browser_pool.process_roots()
+            if browser_pool.retiring or not roots:
+                continue
+            memory = await asyncio.to_thread(profiling.tree_memory, roots)
+            if memory["pss_bytes"] > limit:
+                await browser_pool.recycle(
+                    f"browser PSS {memory['pss_bytes'] // (1024 * 1024)}MB > {BROWSER_RSS_LIMIT_MB}MB"
+                )
+                if BROWSER_PREWARM:
+                    await browser_pool.prewarm()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Browser memory check failed: {e}")
 
-async def get_cached_result(cache_key: str) -> Optional[Dict]:
-    """Get cached crawl result"""
-    if not redis_client:
+async def relaunch_browser():
+    """Replace a dead browser (or retry a failed launch) so readiness can recover"""
+    try:
+        if BROWSER_PREWARM:
+            await browser_pool.prewarm()
+        else:
+            await browser_pool.get()
+    except Exception as e:
+        logger.error(f"Browser relaunch failed: {e}")
+
+async def compact_archive_periodically():
+    """Expire and compact the page archive every ARCHIVE_COMPACT_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(page_archive.ARCHIVE_COMPACT_INTERVAL)
+        try:
+            await asyncio.to_thread(archive.compact)
+        except Exception as e:
+            logger.error(f"Archive compaction error: {e}")
+
+async def get_archived_raw(cache_key: str) -> Optional[str]:
+    """Read a crawl payload from the page archive and promote it back into Redis"""
+    if not archive:
         return None
-    
     try:
-        cached = await redis_client.get(cache_key)
+        cached = await asyncio.to_thread(archive.get, cache_key)
+    except Exception as e:
+        logger.error(f"Archive retrieval error: {e}")
+        return None
+    if cached and redis_client:
+        try:
+            await redis_client.setex(cache_key, 86400, cached)
+        except Exception as e:
+            logger.error(f"Cache storage error: {e}")
+    return cached
+
+async def get_cached_result(cache_key: str, hydrate: bool = True) -> Optional[Dict]:
+    """
+    Get cached crawl result from Redis, falling back to the page archive.
+    Near-duplicates come back with their original's body (`hydrate=False`
+    returns the stored reference).
+    """
+    cached = None
+    if redis_client:
+        try:
+            cached = await redis_client.get(cache_key)
+        except Exception as e:
+            logger.error(f"Cache retrieval error: {e}")
+    
+    if not cached:
+        cached = await get_archived_raw(cache_key)
         if cached:
-            return json.loads(cached)
+            logger.info(f"Archive hit for {cache_key}")
+    
+    result = json.loads(cached) if cached else None
+    if result and hydrate and dedup.is_duplicate_entry(result):
+        result = await hydrate_duplicate(result)
+    return result
+
+async def hydrate_duplicate(entry: Dict) -> Optional[Dict]:
+    """Fill a near-duplicate's entry with its original's body; None (a miss) if that is gone"""
+    original_key = cache_keys.crawl_key_from_digest(entry["duplicate_of"]["job_id"])
+    return dedup.hydrate(entry, await get_cached_result(original_key, hydrate=False))
+
+async def find_near_duplicate(payload: Dict, cache_key: str, chunking: str) -> Optional[Dict]:
+    """
+    Look up a cached page within DEDUP_MAX_DISTANCE bits of this payload's
+    fingerprint; returns the `duplicate_of` reference to it
+    """
+    simhash = payload.get("simhash")
+    if not (DEDUP_ENABLED and redis_client and simhash):
+        return None
+    own_job_id = cache_key.rsplit(":", 1)[-1]
+    band_keys = [cache_keys.simhash_band_key(chunking, band, value) for band, value in dedup.bands(simhash)]
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key in band_keys:
+            pipe.hgetall(key)
+        buckets = await pipe.execute()
     except Exception as e:
-        logger.error(f"Cache retrieval error: {e}")
+        logger.error(f"Duplicate lookup error: {e}")
+        return None
     
+    candidates = []
+    for bucket in buckets:
+        for other, raw in bucket.items():
+            other = other.decode() if isinstance(other, bytes) else other
+            ref = json.loads(raw)
+            d = dedup.distance(simhash, other)
+            if d <= DEDUP_MAX_DISTANCE and ref["job_id"] != own_job_id:
+                candidates.append((d, other, ref))
+    for d, other, ref in sorted(candidates, key=lambda c: c[0]):
+        original_key = cache_keys.crawl_key_from_digest(ref["job_id"])
+        try:
+            raw = await redis_client.get(original_key)
+            # The index outlives re-crawls: the original must still be a full entry with this fingerprint
+            if raw and dedup.can_reference(json.loads(raw), other):
+                return {"url": ref["url"], "job_id": ref["job_id"], "distance": d, "simhash": other}
+            await unindex_fingerprint(other, chunking)
+        except Exception as e:
+            logger.error(f"Duplicate lookup error: {e}")
+            return None
     return None
 
-async def set_cached_result(cache_key: str, result: Dict, ttl: int = 86400):
-    """Cache crawl result"""
+async def unindex_fingerprint(simhash: str, chunking: str):
+    """Drop a fingerprint whose page is gone or has changed from the band index"""
+    pipe = redis_client.pipeline(transaction=False)
+    for band, value in dedup.bands(simhash):
+        pipe.hdel(cache_keys.simhash_band_key(chunking, band, value), simhash)
+    await pipe.execute()
+
+async def index_fingerprint(payload: Dict, cache_key: str, chunking: str, ttl: int = 86400):
+    """Register a fully stored page so later near-duplicates can reference it"""
+    simhash = payload.get("simhash")
+    if not (DEDUP_ENABLED and redis_client and simhash):
+        return
+    ref = json.dumps({"job_id": cache_key.rsplit(":", 1)[-1], "url": payload["url"]})
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for band, value in dedup.bands(simhash):
+            key = cache_keys.simhash_band_key(chunking, band, value)
+            pipe.hset(key, simhash, ref)
+            pipe.expire(key, ttl)
+        await pipe.execute()
+    except Exception as e:
+        logger.error(f"Fingerprint index error: {e}")
+
+async def set_cached_duplicate(cache_key: str, payload: Dict, ttl: int = 86400):
+    """Cache a near-duplicate as a reference to its original, keeping the original alive as long"""
+    await set_cached_result(cache_key, dedup.strip_body(payload), ttl)
     if not redis_client:
         return
-    
+    original_key = cache_keys.crawl_key_from_digest(payload["duplicate_of"]["job_id"])
     try:
-        await redis_client.setex(
-            cache_key,
-            ttl,
-            json.dumps(result)
-        )
+        pipe = redis_client.pipeline(transaction=False)
+        # A chunk list left from an earlier, full crawl of this URL
+        pipe.delete(chunks_key_for(cache_key))
+        pipe.expire(original_key, ttl)
+        pipe.expire(chunks_key_for(original_key), ttl)
+        await pipe.execute()
     except Exception as e:
         logger.error(f"Cache storage error: {e}")
 
-def generate_cache_key(url: str, params: Dict) -> str:
-    """Generate cache key for crawl request"""
-    key_data = f"{url}:{json.dumps(params, sort_keys=True)}"
-    return f"crawl:{hashlib.md5(key_data.encode()).hexdigest()}"
+async def set_cached_result(
+    cache_key: str,
+    result: Dict,
+    ttl: int = 86400,
+    encoded: Optional[str] = None,
+    chunks: Optional[List[str]] = None,
+):
+    """
+    Cache crawl result in Redis and the page archive (pass `encoded` when the
+    JSON encoding is already available, and `chunks` to store the paginated
+    markdown alongside it)
+    """
+    if encoded is None:
+        encoded = json.dumps(result)
+    
+    if redis_client:
+        try:
+            await redis_client.setex(cache_key, ttl, encoded)
+        except Exception as e:
+            logger.error(f"Cache storage error: {e}")
+        if chunks:
+            await set_cached_chunks(cache_key, chunks, ttl)
+    
+    if archive:
+        try:
+            await asyncio.to_thread(archive.put, cache_key, encoded)
+        except Exception as e:
+            logger.error(f"Archive storage error: {e}")
+
+def chunks_key_for(cache_key: str) -> str:
+    """Key of the chunk list stored next to a crawl cache entry"""
+    return cache_keys.chunks_key_from_digest(cache_key.rsplit(":", 1)[-1])
 
-async def perform_crawl(request: CrawlRequest) -> CrawlResponse:
-    """Perform web crawl with specified parameters"""
+async def set_cached_chunks(cache_key: str, chunks: List[str], ttl: int = 86400):
+    """
+    Store paginated markdown as a Redis list so any page is one LINDEX away.
+    Single-page results aren't paginated, so they get no list; a read of
+    chunk 0 is rebuilt from the cached result.
+    """
+    if len(chunks) < 2:
+        return
+    try:
+        chunks_key = chunks_key_for(cache_key)
+        # RPUSH is atomic on its own; a reader between DELETE and RPUSH just misses
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.delete(chunks_key)
+        pipe.rpush(chunks_key, *chunks)
+        pipe.expire(chunks_key, ttl)
+        await pipe.execute()
+    except Exception as e:
+        logger.error(f"Chunk storage error: {e}")
+
+async def get_cached_raw_many(keys: List[str]) -> List[Optional[str]]:
+    """
+    Fetch many cached values in one round trip.
+    Standalone Redis serves a single MGET; on a cluster the keys are grouped
+    by hash slot and the per-slot MGETs are pipelined to their owners.
+    """
+    if not redis_client or not keys:
+        return [None] * len(keys)
+    
+    try:
+        if REDIS_CLUSTER:
+            return await redis_client.mget_nonatomic(keys)
+        return await redis_client.mget(keys)
+    except Exception as e:
+        logger.error(f"Bulk cache retrieval error: {e}")
+        return [None] * len(keys)
+
+def failure_keys(url: str) -> List[str]:
+    return [cache_keys.url_failure_key(url), cache_keys.host_failure_key(cache_keys.canonical_host(url))]
+
+async def get_crawl_failures(url: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """Negative-cache entries of a URL and of its host"""
+    if not NEGATIVE_CACHE_ENABLED or not redis_client:
+        return None, None
+    url_raw, host_raw = await get_cached_raw_many(failure_keys(url))
+    return (json.loads(url_raw) if url_raw else None, json.loads(host_raw) if host_raw else None)
+
+class PageCrawlError(HTTPException):
+    """The page itself failed (or its URL/host is backing off); retrying now won't help"""
+
+def raise_if_backing_off(failures: Tuple[Optional[Dict], Optional[Dict]], timeout: float):
+    """Fail fast with the recorded error while the URL or its host is backing off"""
+    now = time.time()
+    for entry, scope in zip(failures, ("url", "host")):
+        if negative_cache.blocks(entry, now, timeout):
+            body = negative_cache.error_response(entry, scope, now)
+            body["error"] = f"Crawl failed: {body['error']}"
+            raise PageCrawlError(status_code=500, detail=body, headers={"Retry-After": str(body["retry_after"])})
+
+async def record_crawl_failure(
+    url: str,
+    message: str,
+    timeout: float,
+    failures: Tuple[Optional[Dict], Optional[Dict]],
+    status_code: Optional[int] = None,
+):
+    """Negative-cache a failed crawl, and count host-level failures against its host"""
+    error_class = negative_cache.classify_error(message, status_code)
+    if not NEGATIVE_CACHE_ENABLED or not redis_client or not negative_cache.cacheable(error_class):
+        return
+    now = time.time()
+    url_entry, host_entry = failures
+    url_key, host_key = failure_keys(url)
+    updates = [(url_key, negative_cache.record_failure(
+        url_entry, error_class, message, now, timeout, BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS
+    ))]
+    if error_class in negative_cache.HOST_ERROR_CLASSES:
+        updates.append((host_key, negative_cache.record_failure(
+            host_entry, error_class, message, now, timeout,
+            BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS, threshold=HOST_FAILURE_THRESHOLD, member=url_key
+        )))
+    try:
+        for key, entry in updates:
+            await redis_client.set(key, json.dumps(entry), ex=negative_cache.entry_ttl(entry, now, BACKOFF_MAX_SECONDS))
+        logger.info(f"Negative-cached {url} ({error_class}, failure {updates[0][1]['failures']})")
+    except Exception as e:
+        logger.error(f"Negative cache write error: {e}")
+
+async def clear_crawl_failures(url: str, failures: Tuple[Optional[Dict], Optional[Dict]]):
+    """A success resets the URL's and host's backoff"""
+    if not redis_client or not any(failures):
+        return
+    try:
+        for key, entry in zip(failure_keys(url), failures):
+            if entry:
+                await redis_client.delete(key)
+    except Exception as e:
+        logger.error(f"Negative cache delete error: {e}")
+
+def crawl_cache_params(request: CrawlRequest) -> Dict:
+    """Crawl parameters that select a distinct cache entry (everything that changes the output)"""
+    extraction = request.extraction_strategy
+    if request.extraction_schema:
+        extraction = cache_keys.schema_extraction(request.extraction_schema)
+    return cache_keys.crawl_params(
+        extraction,
+        request.chunking_strategy,
+        request.screenshot,
+        wait_for=request.wait_for,
+        js_code=request.js_code,
+        css_selector=request.css_selector,
+        word_count_threshold=request.word_count_threshold,
+        readiness=request.readiness,
+    )
+
+def crawl_job_id(request: CrawlRequest) -> str:
+    """Job ID (cache key digest) of a crawl request"""
+    return cache_keys.crawl_digest(str(request.url), crawl_cache_params(request))
+
+def deadline_from_header(deadline_ms: Optional[int]) -> Optional[float]:
+    """Convert a remaining-budget header to an absolute (epoch) deadline"""
+    return time.time() + deadline_ms / 1000 if deadline_ms is not None else None
+
+def check_deadline(deadline: Optional[float]) -> Optional[float]:
+    """
+    Return the seconds left before `deadline` (None if there is none), raising
+    504 when too little remains for a crawl to be worth starting.
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.time()
+    if remaining < MIN_CRAWL_SECONDS:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Deadline too close to start a crawl ({max(remaining, 0):.1f}s left)"
+        )
+    return remaining
+
+async def perform_crawl(request: CrawlRequest, deadline: Optional[float] = None) -> CrawlResponse:
+    """
+    Perform web crawl with specified parameters
+
+    `deadline` (epoch seconds) caps the page timeout; if the page times out
+    because of it, whatever content had loaded is returned as a partial,
+    uncached result.
+    """
     
     # Generate cache key
-    cache_params = {
-        "extraction": request.extraction_strategy,
-        "chunking": request.chunking_strategy,
-        "screenshot": request.screenshot
-    }
-    cache_key = generate_cache_key(str(request.url), cache_params)
+    cache_key = cache_keys.crawl_key_from_digest(crawl_job_id(request))
     
     # Check cache
     cached_result = await get_cached_result(cache_key)
@@ -204,19 +689,31 @@ async def perform_crawl(request: CrawlRequest) -> CrawlResponse:
             cached_result["links"] = [str(l) for l in cached_links]  # Final safety pass
         return CrawlResponse(**cached_result)
     
+    # Recently failing URLs and hosts answer with the recorded error
+    failures = await get_crawl_failures(str(request.url))
+    raise_if_backing_off(failures, request.timeout)
+    
+    # Don't launch a browser for an answer nobody will wait for
+    remaining = check_deadline(deadline)
+    page_timeout = request.timeout
+    deadline_bound = remaining is not None and remaining - DEADLINE_RESERVE_SECONDS < page_timeout
+    if deadline_bound:
+        page_timeout = max(1.0, remaining - DEADLINE_RESERVE_SECONDS)
+    
     # Perform crawl
     try:
-        # Configure browser
-        browser_config = BrowserConfig(
-            headless=True,
-            verbose=True
-        )
-        
         # Configure chunking strategy
         chunking_strategy = get_chunking_strategy(request.chunking_strategy)
         
-        # Configure extraction strategy
-        extraction_strategy = get_extraction_strategy(request.extraction_strategy)
+        # A caller's wait_for selector wins; otherwise wait adaptively for the page to settle
+        wait_for = request.wait_for
+        host = cache_keys.canonical_host(str(request.url))
+        adaptive = not wait_for and ADAPTIVE_READINESS and request.readiness == "adaptive"
+        if adaptive:
+            readiness_plan = await readiness.plan(
+                redis_client, host, page_timeout, READINESS_QUIET_MS, READINESS_MAX_WAIT_MS
+            )
+            wait_for = readiness.wait_for_script(readiness_plan)
         
         # Create crawler run config
         # Based on Crawl4AI self-hosting best practices: https://docs.crawl4ai.com/core/self-hosting/
@@ -224,133 +721,279 @@ async def perform_crawl(request: CrawlRequest) -> CrawlResponse:
             word_count_threshold=request.word_count_threshold,
             cache_mode=CacheMode.BYPASS,  # We handle caching ourselves via Redis
             chunking_strategy=chunking_strategy,
-            extraction_strategy=extraction_strategy,
+            # Extraction (e.g. cosine clustering) runs in the post-processing pool instead
             screenshot=request.screenshot,
-            wait_for=request.wait_for,
+            wait_for=wait_for,
             js_code=request.js_code,
             css_selector=request.css_selector,
-            page_timeout=request.timeout * 1000 if request.timeout else 30000,  # Convert to milliseconds
+            keep_attrs=["id", "class"],  # Keep cached HTML addressable by CSS selectors
+            page_timeout=int(page_timeout * 1000),  # Convert to milliseconds
             verbose=True,
             # Additional options from self-hosting best practices
             remove_overlay_elements=True  # Remove popups/overlays for cleaner content
             # Note: cache_mode=CacheMode.BYPASS already set above (we handle caching via Redis)
         )
         
-        # Execute crawl with proper configuration
-        async with AsyncWebCrawler(config=browser_config) as crawler:
-            result = await crawler.arun(url=str(request.url), config=run_config)
-            
-            # Process result
-            if not result.success:
-                raise HTTPException(
+        # Execute crawl on the shared, pre-warmed browser (each crawl gets its own page)
+        async with browser_pool.crawler() as crawler:
+            try:
+                result = await crawler.arun(url=str(request.url), config=run_config)
+            except Exception as e:
+                if browser_pool.alive(crawler):
+                    raise
+                result = None
+                error = str(e)
+            else:
+                error = result.error_message
+            if (result is None or not result.success) and not browser_pool.alive(crawler):
+                # Not the page's fault: don't negative-cache it; the browser is recycled on release
+                raise HTTPException(status_code=503, detail=f"Browser crashed during the crawl: {error}")
+        
+        if adaptive and result.html:
+            marker = await readiness.observe(redis_client, host, result.html, readiness_plan["learned"])
+            if marker:
+                logger.info(
+                    f"{request.url} ready after {marker['settle_ms']}ms ({marker['reason']}, "
+                    f"cap {readiness_plan['cap_ms']}ms, min {readiness_plan['min_wait_ms']}ms)"
+                )
+        
+        # Process result
+        partial = False
+        if not result.success:
+            if deadline_bound and (result.html or result.markdown):
+                # Timed out at the caller's deadline: return what rendered
+                logger.info(f"Returning partial content for {request.url}: {result.error_message}")
+                partial = True
+            else:
+                # A timeout forced by the caller's deadline says nothing about the page
+                if not (deadline_bound and negative_cache.classify_error(result.error_message) == "timeout"):
+                    await record_crawl_failure(
+                        str(request.url), result.error_message, page_timeout, failures,
+                        getattr(result, "status_code", None),
+                    )
+                raise PageCrawlError(
                     status_code=500,
                     detail=f"Crawl failed: {result.error_message}"
                 )
-            
-            # Extract data
-            # Handle markdown - it might be an object with raw_markdown and fit_markdown
-            if hasattr(result.markdown, 'raw_markdown'):
-                markdown_content = result.markdown.raw_markdown or result.markdown.fit_markdown or ""
-            elif isinstance(result.markdown, str):
-                markdown_content = result.markdown
-            else:
-                markdown_content = str(result.markdown) if result.markdown else ""
-            
-            # Handle HTML - prefer cleaned_html if available
-            html_content = result.cleaned_html if hasattr(result, 'cleaned_html') and result.cleaned_html else (result.html or "")
-            
-            # Convert links to strings if they're dicts
-            links_dict = result.links if isinstance(result.links, dict) else {}
-            internal_links = links_dict.get("internal", []) or []
-            external_links = links_dict.get("external", []) or []
-            all_links = []
-            
-            # Process all links - extract href from dicts
-            for link in list(internal_links) + list(external_links):
-                if isinstance(link, dict):
-                    # Try multiple possible keys for the URL
-                    url = link.get("href") or link.get("url") or link.get("link") or link.get("src")
-                    if url:
-                        all_links.append(str(url))
-                    else:
-                        # Fallback: convert entire dict to string representation
-                        all_links.append(str(link))
-                elif isinstance(link, str):
-                    all_links.append(link)
-                else:
-                    # Convert anything else to string
-                    all_links.append(str(link))
-            
-            # Convert media to strings as well
-            media_dict = result.media if isinstance(result.media, dict) else {}
-            images = media_dict.get("images", [])
-            videos = media_dict.get("videos", [])
-            image_urls = []
-            video_urls = []
-            
-            for img in images:
-                if isinstance(img, dict):
-                    image_urls.append(img.get("src", img.get("url", str(img))))
-                else:
-                    image_urls.append(str(img))
-            
-            for vid in videos:
-                if isinstance(vid, dict):
-                    video_urls.append(vid.get("src", vid.get("url", str(vid))))
-                else:
-                    video_urls.append(str(vid))
-            
-            # Get metadata
-            metadata_dict = result.metadata if isinstance(result.metadata, dict) else {}
-            
-            # Debug: Verify links are strings
-            logger.info(f"Links before validation: {all_links[:3] if all_links else []}")
-            logger.info(f"Link types: {[type(l).__name__ for l in all_links[:3]] if all_links else []}")
-            
-            # CRITICAL: Final conversion - ensure ALL links are strings before creating response_data
-            # This must happen BEFORE response_data is created to avoid Pydantic validation errors
-            final_links_list = []
-            for item in all_links:
-                if isinstance(item, dict):
-                    url = item.get("href") or item.get("url") or item.get("link") or item.get("src")
-                    final_links_list.append(str(url) if url else str(item))
-                else:
-                    final_links_list.append(str(item))
-            
-            # One more safety pass - force everything to string
-            final_links_list = [str(l) for l in final_links_list]
-            
-            logger.info(f"Final links count: {len(final_links_list)}, all strings: {all(isinstance(l, str) for l in final_links_list)}")
-            
-            response_data = {
-                "url": str(request.url),
-                "markdown": markdown_content,
-                "html": html_content,
-                "links": final_links_list,  # Use final_links_list which is guaranteed to be strings
-                "media": {
-                    "images": image_urls,
-                    "videos": video_urls
-                },
-                "metadata": {
-                    "title": metadata_dict.get("title", ""),
-                    "description": metadata_dict.get("description", ""),
-                    "keywords": metadata_dict.get("keywords", []),
-                    "language": metadata_dict.get("language", ""),
-                },
-                "screenshot": result.screenshot if request.screenshot and hasattr(result, 'screenshot') else None,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            # Cache result
-            await set_cached_result(cache_key, response_data)
-            
-            return CrawlResponse(**response_data)
-            
+
+        # Extract data
+        # Handle markdown - it might be an object with raw_markdown and fit_markdown
+        if hasattr(result.markdown, 'raw_markdown'):
+            markdown_content = result.markdown.raw_markdown or result.markdown.fit_markdown or ""
+        elif isinstance(result.markdown, str):
+            markdown_content = result.markdown
+        else:
+            markdown_content = str(result.markdown) if result.markdown else ""
+        
+        # Handle HTML - prefer cleaned_html if available
+        html_content = result.cleaned_html if hasattr(result, 'cleaned_html') and result.cleaned_html else (result.html or "")
+        
+        raw = {
+            "url": str(request.url),
+            "markdown": markdown_content,
+            "html": html_content,
+            "links": result.links,
+            "media": result.media,
+            "metadata": result.metadata,
+            "screenshot": result.screenshot if request.screenshot and hasattr(result, 'screenshot') else None,
+            "timestamp": datetime.utcnow().isoformat(),
+            "extraction_strategy": request.extraction_strategy,
+            "chunking_strategy": request.chunking_strategy,
+            "extraction_schema": request.extraction_schema,
+            "rendered_html": result.html if request.extraction_schema else None,
+        }
+    
+        # Flatten links/media, run extraction and encode JSON off the event loop
+        response_data, encoded, chunks = await postprocess_pool.run(postprocess.build_crawl_payload, raw)
+        
+        if partial:
+            # Don't cache truncated pages; the next caller may have more time
+            return CrawlResponse(**response_data, partial=True)
+        
+        # Cache result; a near-duplicate of a cached page only references its body
+        chunking = request.chunking_strategy
+        duplicate_of = await find_near_duplicate(response_data, cache_key, chunking)
+        if duplicate_of:
+            logger.info(f"{request.url} duplicates {duplicate_of['url']} (distance {duplicate_of['distance']})")
+            response_data["duplicate_of"] = duplicate_of
+            await set_cached_duplicate(cache_key, response_data)
+        else:
+            await set_cached_result(cache_key, response_data, encoded=encoded, chunks=chunks)
+            await index_fingerprint(response_data, cache_key, chunking)
+        await clear_crawl_failures(str(request.url), failures)
+        
+        return CrawlResponse(**response_data)
+        
+    except HTTPException:
+        raise
     except Exception as e:
+        # Our own failure (post-processing, Redis, ...), not the page's: only
+        # browser/navigation failures from result.error_message are negative-cached
         logger.error(f"Crawl error for {request.url}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def apply_query(response: CrawlResponse, query: str, max_chars: int) -> CrawlResponse:
+    """Prune the markdown to the passages relevant to `query`; the HTML is dropped"""
+    pruned = await postprocess_pool.run(content_filter.prune_markdown, response.markdown, query, max_chars)
+    markdown = pruned.pop("markdown")
+    return response.model_copy(update={"markdown": markdown, "html": "", "relevance": pruned})
+
+async def enqueue_crawl(
+    request: CrawlRequest, priority: str = "normal", deadline: Optional[float] = None
+) -> str:
+    """Hand a crawl to the worker fleet (CRAWL_MODE=queue) and return its job ID"""
+    if not redis_client:
+        raise HTTPException(
+            status_code=503,
+            detail="Crawl queue unavailable"
+        )
+    job_id = crawl_job_id(request)
+    await crawl_queue.enqueue(redis_client, job_id, request.model_dump(mode="json"), priority, deadline)
+    return job_id
+
+async def crawl_via_queue(request: CrawlRequest, deadline: Optional[float] = None) -> CrawlResponse:
+    """Enqueue a crawl for the worker fleet and wait for its cached result"""
+    cache_key = cache_keys.crawl_key_from_digest(crawl_job_id(request))
+    cached_result = await get_cached_result(cache_key)
+    if cached_result:
+        logger.info(f"Cache hit for {request.url}")
+        return CrawlResponse(**cached_result)
+    # Don't queue a crawl the worker would refuse
+    raise_if_backing_off(await get_crawl_failures(str(request.url)), request.timeout)
+    
+    wait_timeout = request.timeout + QUEUE_WAIT_SLACK
+    remaining = check_deadline(deadline)
+    if remaining is not None:
+        wait_timeout = min(wait_timeout, remaining)
+    job_id = await enqueue_crawl(request, deadline=deadline)
+    status = await crawl_queue.wait_for_job(redis_client, job_id, wait_timeout)
+    if status is None:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Crawl still queued or running; retrieve it later with job_id {job_id}"
+        )
+    if status["state"] == "failed":
+        error = status.get("error", "unknown error")
+        if "status_code" in status:
+            # Failed for good by the worker: pass its error through unchanged
+            headers = {"Retry-After": str(error["retry_after"])} if isinstance(error, dict) and "retry_after" in error else None
+            raise HTTPException(status_code=status["status_code"], detail=error, headers=headers)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Crawl failed: {error}"
+        )
+    
+    result = await get_cached_result(cache_key)
+    if not result:
+        # Pages cut short by the deadline aren't cached; the worker hands them back
+        partial = await crawl_queue.get_partial_result(redis_client, job_id)
+        if partial:
+            return CrawlResponse.model_validate_json(partial)
+        raise HTTPException(
+            status_code=500,
+            detail="Crawl finished but its result is no longer cached"
+        )
+    return CrawlResponse(**result)
+
+async def perform_low_priority_crawl(request: CrawlRequest, cache_key: str):
+    """Run a speculative crawl with limited concurrency"""
+    # Skip URLs that are already cached - the prefetch would be a no-op
+    if await get_cached_result(cache_key):
+        return
+
+    async with low_priority_semaphore:
+        await perform_crawl(request)
+
+async def set_job_state(job_id: str, state: str, **extra):
+    """Record a batch job's state so bulk retrieval can report it as pending"""
+    if not redis_client:
+        return
+    try:
+        await crawl_queue.set_job_status(redis_client, job_id, state, **extra)
+    except Exception as e:
+        logger.error(f"Job status update error: {e}")
+
+async def mark_jobs_queued(job_ids: List[str]):
+    """Mark many batch jobs as queued in one pipelined round trip"""
+    if not redis_client or not job_ids:
+        return
+    try:
+        status = json.dumps({"state": "queued", "updated": datetime.utcnow().timestamp()})
+        pipe = redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.setex(crawl_queue.job_status_key(job_id), crawl_queue.STATUS_TTL, status)
+        await pipe.execute()
+    except Exception as e:
+        logger.error(f"Job status update error: {e}")
+
+async def run_batch_job(request: CrawlRequest, job_id: str, priority: str):
+    """Run one batch crawl in this process, tracking its status"""
+    await set_job_state(job_id, "running")
+    try:
+        if priority == "low":
+            await perform_low_priority_crawl(request, cache_keys.crawl_key_from_digest(job_id))
+        else:
+            await perform_crawl(request)
+    except Exception as e:
+        logger.warning(f"Batch crawl failed for {request.url}: {e}")
+        await set_job_state(job_id, "failed", error=getattr(e, "detail", str(e)))
+        return
+    await set_job_state(job_id, "done")
+
+@app.middleware("http")
+async def record_request_memory(request: Request, call_next):
+    """Per-request RSS growth and payload sizes for /debug/memory"""
+    if request.url.path.startswith(("/health", "/debug")):
+        return await call_next(request)
+    mark = request_memory_log.start()
+    response = await call_next(request)
+    request_length = request.headers.get("content-length")
+    response_length = response.headers.get("content-length")
+    request_memory_log.finish(
+        mark, request.method, request.url.path, response.status_code,
+        int(request_length) if request_length else None,
+        # Streaming responses (NDJSON) have no length
+        int(response_length) if response_length else None,
+    )
+    return response
+
+def require_debug_access(x_debug_token: Optional[str] = Header(default=None)):
+    """Hide /debug unless enabled; check the token when one is configured"""
+    if not DEBUG_ENDPOINTS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if DEBUG_TOKEN and not secrets.compare_digest(x_debug_token or "", DEBUG_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
 # API Endpoints
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and its event loop responds"""
+    return {"status": "alive", "timestamp": datetime.utcnow().isoformat()}
+
+@app.get("/health/ready")
+async def readiness_probe():
+    """
+    Readiness probe: startup (Redis, pools, browser pre-warm) has finished,
+    the browser is alive (or relaunchable) and the service is not shutting
+    down. Returns 503 otherwise.
+    """
+    global browser_relaunch_task
+    browser_healthy = browser_pool.healthy()
+    ready = service_ready and browser_healthy
+    if service_ready and not browser_healthy and (browser_relaunch_task is None or browser_relaunch_task.done()):
+        browser_relaunch_task = asyncio.create_task(relaunch_browser())
+    body = {
+        "ready": ready,
+        "crawl_mode": crawl_queue.CRAWL_MODE,
+        "browser_warm": browser_pool.warm,
+        "browser_healthy": browser_healthy,
+        "browser_error": browser_pool.launch_error,
+        "redis_connected": redis_client is not None,
+        "startup_seconds": startup_timings,
+        "error": startup_error,
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
@@ -369,19 +1012,35 @@ async def health_check():
     )
 
 @app.post("/crawl", response_model=CrawlResponse)
-async def crawl_url(request: CrawlRequest):
+async def crawl_url(
+    request: CrawlRequest,
+    deadline_ms: Optional[int] = Header(default=None, alias="X-Request-Deadline-Ms", ge=0),
+):
     """
     Crawl a single URL and extract content
     
     - **url**: The URL to crawl
     - **extraction_strategy**: Content extraction method (auto, llm, cosine)
+    - **extraction_schema**: CSS/XPath schema to extract records with instead (see structured.py)
     - **chunking_strategy**: How to chunk content (regex, markdown, sliding)
     - **screenshot**: Whether to capture screenshot
     - **wait_for**: CSS selector to wait for before extraction
     - **timeout**: Request timeout in seconds
+    - **query**: Return only the markdown passages relevant to this query (BM25), up to **max_chars**
+
+    An `X-Request-Deadline-Ms` header (the caller's remaining budget) caps
+    the page timeout and queue wait; crawls that can't start in time get 504.
     """
     logger.info(f"Crawling URL: {request.url}")
-    return await perform_crawl(request)
+    deadline = deadline_from_header(deadline_ms)
+    if crawl_queue.CRAWL_MODE == "queue":
+        response = await crawl_via_queue(request, deadline)
+    else:
+        response = await perform_crawl(request, deadline)
+    # The full page was cached; pruning reruns cheaply for each new query
+    if request.query:
+        response = await apply_query(response, request.query, request.max_chars)
+    return response
 
 @app.post("/crawl/batch")
 async def batch_crawl(request: BatchCrawlRequest, background_tasks: BackgroundTasks):
@@ -389,6 +1048,8 @@ async def batch_crawl(request: BatchCrawlRequest, background_tasks: BackgroundTa
     Crawl multiple URLs in batch
     
     Returns immediately with job IDs. Results are cached and can be retrieved later.
+    Use priority="low" for speculative prefetches: already-cached URLs are skipped
+    and the remaining crawls run with limited concurrency.
     """
     if len(request.urls) > 50:
         raise HTTPException(
@@ -397,42 +1058,108 @@ async def batch_crawl(request: BatchCrawlRequest, background_tasks: BackgroundTa
         )
     
     job_ids = []
+    queued_job_ids = []
     
     for url in request.urls:
         # Create individual crawl request
         crawl_req = CrawlRequest(
             url=url,
             extraction_strategy=request.extraction_strategy,
+            extraction_schema=request.extraction_schema,
             chunking_strategy=request.chunking_strategy,
             screenshot=request.screenshot,
             timeout=request.timeout
         )
         
-        # Generate job ID (cache key)
-        cache_params = {
-            "extraction": request.extraction_strategy,
-            "chunking": request.chunking_strategy,
-            "screenshot": request.screenshot
-        }
-        job_id = generate_cache_key(str(url), cache_params)
+        # Generate job ID (cache key digest)
+        job_id = crawl_job_id(crawl_req)
         job_ids.append({"url": str(url), "job_id": job_id})
         
-        # Add to background tasks
-        background_tasks.add_task(perform_crawl, crawl_req)
+        # Hand off to the worker fleet, or run as background tasks in this process
+        if crawl_queue.CRAWL_MODE == "queue":
+            if request.priority == "low" and await get_cached_result(cache_keys.crawl_key_from_digest(job_id)):
+                continue
+            await enqueue_crawl(crawl_req, request.priority)
+        else:
+            queued_job_ids.append(job_id)
+            background_tasks.add_task(run_batch_job, crawl_req, job_id, request.priority)
+    
+    await mark_jobs_queued(queued_job_ids)
     
     return {
         "status": "processing",
         "total_urls": len(request.urls),
         "jobs": job_ids,
-        "message": "Batch crawl initiated. Use job_id to retrieve results from cache."
+        "message": "Batch crawl initiated. Use job_id to retrieve results from cache, or POST all job_ids to /results."
     }
 
+@app.post("/crawl/site")
+async def crawl_site(
+    request: SiteCrawlRequest,
+    deadline_ms: Optional[int] = Header(default=None, alias="X-Request-Deadline-Ms", ge=0),
+):
+    """
+    Crawl a site breadth-first from a seed URL
+    
+    Follows in-scope links (same host, path under `path_prefix`) up to
+    `max_depth` hops and `max_pages` pages. Pages go through the normal crawl
+    path, so cached pages are free and queue mode uses the worker fleet.
+    The response is NDJSON: one {"type": "page"} line per page as it
+    finishes, then a {"type": "summary"} line. Every page is cached and can
+    be re-read later by its job_id.
+    """
+    deadline = deadline_from_header(deadline_ms)
+    scope = site_crawl.SiteScope(str(request.url), request.path_prefix, request.include_subdomains)
+    
+    async def crawl_page(url: str) -> Dict[str, Any]:
+        crawl_req = CrawlRequest(
+            url=url,
+            extraction_strategy=request.extraction_strategy,
+            extraction_schema=request.extraction_schema,
+            chunking_strategy=request.chunking_strategy,
+            timeout=request.timeout
+        )
+        if crawl_queue.CRAWL_MODE == "queue":
+            response = await crawl_via_queue(crawl_req, deadline)
+        else:
+            response = await perform_crawl(crawl_req, deadline)
+        return {"job_id": crawl_job_id(crawl_req), **response.model_dump()}
+    
+    async def ndjson():
+        pages = errors = 0
+        stopped = None
+        async for entry in site_crawl.crawl_site(
+            str(request.url), crawl_page, scope,
+            request.max_depth, request.max_pages, request.concurrency
+        ):
+            if "result" in entry:
+                pages += 1
+                if not request.include_html:
+                    entry["result"].pop("html", None)
+            else:
+                errors += 1
+            yield json.dumps({"type": "page", **entry}) + "\n"
+            if deadline is not None and time.time() >= deadline:
+                stopped = "deadline"
+                break
+        yield json.dumps({
+            "type": "summary",
+            "seed": str(request.url),
+            "scope": {"host": scope.host, "path_prefix": scope.path_prefix},
+            "pages": pages,
+            "errors": errors,
+            "stopped": stopped,
+        }) + "\n"
+    
+    logger.info(f"Site crawl from {request.url} (depth {request.max_depth}, max {request.max_pages} pages)")
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @app.get("/result/{job_id}")
 async def get_result(job_id: str):
     """
-    Retrieve crawl result by job ID (cache key)
+    Retrieve crawl result by job ID (cache key digest)
     """
-    result = await get_cached_result(f"crawl:{job_id}")
+    result = await get_cached_result(cache_keys.crawl_key_from_digest(job_id))
     
     if not result:
         raise HTTPException(
@@ -442,19 +1169,188 @@ async def get_result(job_id: str):
     
     return result
 
+@app.get("/result/{job_id}/chunks/{index}")
+async def get_result_chunk(job_id: str, index: int):
+    """
+    Retrieve one page of a crawl's paginated markdown
+    
+    Pages are produced at crawl time with the request's chunking strategy
+    and stored as a Redis list, so each read is a single LINDEX. If the list
+    is gone (evicted, or the page came back from the archive) it is rebuilt
+    from the cached result.
+    """
+    return await read_result_chunk(job_id, index)
+
+async def read_result_chunk(job_id: str, index: int, follow_duplicate: bool = True) -> Dict:
+    """One chunk of a crawl's markdown; a near-duplicate reads its original's (one level only)"""
+    if index < 0:
+        raise HTTPException(status_code=400, detail="Chunk index must be >= 0")
+    cache_key = cache_keys.crawl_key_from_digest(job_id)
+    chunks_key = chunks_key_for(cache_key)
+    
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.lindex(chunks_key, index)
+            pipe.llen(chunks_key)
+            content, total = await pipe.execute()
+            if total:
+                if content is None:
+                    raise HTTPException(status_code=404, detail=f"Chunk {index} out of range (0-{total - 1})")
+                return {"job_id": job_id, "index": index, "total": total, "content": content}
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Chunk retrieval error: {e}")
+    
+    result = await get_cached_result(cache_key, hydrate=False)
+    if result and dedup.is_duplicate_entry(result):
+        if not follow_duplicate:
+            # References are never chained; a stale one is a miss
+            raise HTTPException(status_code=404, detail="Result not found or expired")
+        # Near-duplicates read their original's chunks
+        original = await read_result_chunk(result["duplicate_of"]["job_id"], index, follow_duplicate=False)
+        return {**original, "job_id": job_id}
+    if not result:
+        raise HTTPException(
+            status_code=404,
+            detail="Result not found or expired"
+        )
+    strategy = (result.get("chunks") or {}).get("strategy", cache_keys.CRAWL_DEFAULTS["chunking"])
+    chunks = await postprocess_pool.run(postprocess.paginate_markdown, result.get("markdown", ""), strategy)
+    if redis_client and chunks:
+        await set_cached_chunks(cache_key, chunks)
+    if not 0 <= index < len(chunks):
+        raise HTTPException(status_code=404, detail=f"Chunk {index} out of range (0-{max(len(chunks) - 1, 0)})")
+    return {"job_id": job_id, "index": index, "total": len(chunks), "content": chunks[index]}
+
+@app.post("/extract")
+async def extract_structured(request: ExtractRequest):
+    """
+    Run a CSS/XPath extraction schema over supplied HTML, or over the HTML
+    cached for a crawl job (crawl4ai's cleaned HTML, not the rendered DOM;
+    crawl with extraction_schema to extract from the rendered page)
+    """
+    html = request.html
+    if html is None:
+        if not request.job_id:
+            raise HTTPException(status_code=400, detail="Provide html or job_id")
+        result = await get_cached_result(cache_keys.crawl_key_from_digest(request.job_id))
+        if not result:
+            raise HTTPException(
+                status_code=404,
+                detail="Result not found or expired"
+            )
+        html = result.get("html") or ""
+    
+    try:
+        records = await postprocess_pool.run(structured.extract_with_schema, request.extraction_schema, html)
+    except structured.SchemaError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "name": request.extraction_schema.get("name") or "records",
+        "count": len(records),
+        "records": records,
+    }
+
+@app.get("/screenshot/{screenshot_id}")
+async def get_screenshot(screenshot_id: str):
+    """
+    Fetch a stored screenshot by the ID from a crawl's screenshot_ref
+    """
+    stored = await asyncio.to_thread(screenshot_store.load_screenshot, screenshot_id)
+    if not stored:
+        raise HTTPException(
+            status_code=404,
+            detail="Screenshot not found or expired"
+        )
+    
+    data, media_type = stored
+    # Content-addressed, so the bytes behind an ID never change
+    return Response(
+        content=data,
+        media_type=media_type,
+        headers={"Cache-Control": "public, max-age=604800, immutable"}
+    )
+
+@app.post("/results")
+async def get_results_bulk(request: BulkResultRequest):
+    """
+    Retrieve many crawl results by job ID in one round trip
+    
+    Every job ID is reported as found, pending (queued, running or retrying), failed or
+    missing. Cached payloads are passed through without re-encoding. With
+    stream=true the response is NDJSON, one job per line.
+    """
+    if len(request.job_ids) > MAX_BULK_RESULTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {MAX_BULK_RESULTS} job IDs allowed per request"
+        )
+    
+    job_ids = list(dict.fromkeys(request.job_ids))
+    result_keys = [cache_keys.crawl_key_from_digest(job_id) for job_id in job_ids]
+    status_keys = [crawl_queue.job_status_key(job_id) for job_id in job_ids]
+    values = await get_cached_raw_many(result_keys + status_keys)
+    results, statuses = values[:len(job_ids)], values[len(job_ids):]
+    # Redis misses may still be in the page archive
+    for i, key in enumerate(result_keys):
+        if results[i] is None:
+            results[i] = await get_archived_raw(key)
+        # A key can only appear unescaped in JSON as a key, so this finds near-duplicate entries
+        if results[i] and '"duplicate_of": {' in results[i]:
+            entry = json.loads(results[i])
+            if dedup.is_duplicate_entry(entry):
+                hydrated = await hydrate_duplicate(entry)
+                results[i] = json.dumps(hydrated) if hydrated else None
+    
+    entries = []
+    for job_id, raw_result, raw_status in zip(job_ids, results, statuses):
+        status = json.loads(raw_status) if raw_status else {}
+        if raw_result:
+            entries.append((job_id, "found", raw_result))
+        elif status.get("state") in crawl_queue.IN_FLIGHT_STATES:
+            entries.append((job_id, "pending", None))
+        elif status.get("state") == "failed":
+            entries.append((job_id, "failed", json.dumps(status.get("error"))))
+        else:
+            entries.append((job_id, "missing", None))
+    
+    if request.stream:
+        async def ndjson():
+            for job_id, state, raw in entries:
+                yield f'{{"job_id":{json.dumps(job_id)},"status":"{state}","result":{raw or "null"}}}\n'
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    
+    # Assemble the body by hand so cached JSON is not decoded and re-encoded
+    found = ",".join(f"{json.dumps(job_id)}:{raw}" for job_id, state, raw in entries if state == "found")
+    failed = ",".join(f"{json.dumps(job_id)}:{raw}" for job_id, state, raw in entries if state == "failed")
+    pending = [job_id for job_id, state, _ in entries if state == "pending"]
+    missing = [job_id for job_id, state, _ in entries if state == "missing"]
+    body = (
+        f'{{"found":{{{found}}},"failed":{{{failed}}},'
+        f'"pending":{json.dumps(pending)},"missing":{json.dumps(missing)}}}'
+    )
+    return Response(content=body, media_type="application/json")
+
 @app.delete("/cache/{job_id}")
 async def clear_cache(job_id: str):
     """
     Clear cached result by job ID
     """
-    if not redis_client:
+    if not redis_client and not archive:
         raise HTTPException(
             status_code=503,
             detail="Cache service unavailable"
         )
     
     try:
-        deleted = await redis_client.delete(f"crawl:{job_id}")
+        cache_key = cache_keys.crawl_key_from_digest(job_id)
+        deleted = await redis_client.delete(cache_key) if redis_client else 0
+        if redis_client:
+            await redis_client.delete(chunks_key_for(cache_key))
+        if archive and await asyncio.to_thread(archive.delete, cache_key):
+            deleted = True
         return {
             "status": "success" if deleted else "not_found",
             "job_id": job_id
@@ -462,17 +1358,105 @@ async def clear_cache(job_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/debug/profile", dependencies=[Depends(require_debug_access)])
+async def debug_profile(seconds: float = 10.0, interval_ms: float = 10.0, format: str = "collapsed"):
+    """
+    Sample this worker's Python stacks for `seconds` and return collapsed
+    stacks (feed to flamegraph.pl or speedscope), or with format=json the
+    hottest frames by self time.
+    """
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS}]")
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'json'")
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+    
+    async with profile_lock:
+        profiler = profiling.SamplingProfiler(interval=max(interval_ms, 1.0) / 1000)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(profiler.stop)
+    
+    if format == "json":
+        return {
+            "pid": os.getpid(),
+            "seconds": seconds,
+            "samples": profiler.samples,
+            "top_frames": profiler.top_frames(),
+        }
+    return PlainTextResponse(profiler.collapsed(), headers={"X-Profile-Samples": str(profiler.samples)})
+
+@app.post("/debug/tracemalloc/start", dependencies=[Depends(require_debug_access)])
+async def debug_tracemalloc_start(frames: int = 10):
+    """Start tracing allocations (slows allocation-heavy code while on)"""
+    profiling.tracemalloc_start(max(1, min(frames, 100)))
+    return {"pid": os.getpid(), **profiling.tracemalloc_status()}
+
+@app.post("/debug/tracemalloc/snapshot", dependencies=[Depends(require_debug_access)])
+async def debug_tracemalloc_snapshot(limit: int = 25, key_type: str = "lineno"):
+    """Largest allocation sites, plus growth since the previous snapshot"""
+    if key_type not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="key_type must be lineno, filename or traceback")
+    try:
+        snapshot = await asyncio.to_thread(profiling.tracemalloc_snapshot, limit, key_type)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"pid": os.getpid(), **snapshot}
+
+@app.post("/debug/tracemalloc/stop", dependencies=[Depends(require_debug_access)])
+async def debug_tracemalloc_stop():
+    profiling.tracemalloc_stop()
+    return {"pid": os.getpid(), "tracing": False}
+
+@app.get("/debug/memory", dependencies=[Depends(require_debug_access)])
+async def debug_memory(limit: int = 50, sort: Optional[str] = None):
+    """
+    Process and browser RSS, tracemalloc status and recent requests' memory
+    growth and payload sizes (sort=peak_rss_growth_bytes for the worst first)
+    """
+    if sort not in (None, "peak_rss_growth_bytes", "rss_delta_bytes", "response_bytes", "duration_ms"):
+        raise HTTPException(status_code=400, detail="Unsupported sort field")
+    memory = await asyncio.to_thread(profiling.process_memory)
+    live_browser = await asyncio.to_thread(profiling.tree_memory, browser_pool.process_roots())
+    return {
+        "pid": os.getpid(),
+        **memory,
+        "live_browser_pss_bytes": live_browser["pss_bytes"],
+        "peak_rss_bytes": profiling.peak_rss_bytes(),
+        "browser_rss_limit_bytes": BROWSER_RSS_LIMIT_MB * 1024 * 1024 if BROWSER_RSS_LIMIT_MB > 0 else None,
+        "browser": browser_pool.stats(),
+        "tracemalloc": profiling.tracemalloc_status(),
+        "requests": request_memory_log.recent(limit, sort),
+    }
+
+@app.post("/debug/browser/recycle", dependencies=[Depends(require_debug_access)])
+async def debug_browser_recycle():
+    """Replace this worker's browser now (in-flight crawls finish on the old one)"""
+    await browser_pool.recycle("requested via /debug/browser/recycle")
+    return {"pid": os.getpid(), "browser": browser_pool.stats()}
+
 @app.get("/")
 async def root():
     """API information"""
     return {
         "name": "Crawl4AI Service",
         "version": "1.0.0",
+        "crawl_mode": crawl_queue.CRAWL_MODE,
+        "archive": archive.stats() if archive else None,
         "endpoints": {
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
             "crawl": "/crawl",
             "batch_crawl": "/crawl/batch",
+            "site_crawl": "/crawl/site",
             "get_result": "/result/{job_id}",
+            "get_result_chunk": "/result/{job_id}/chunks/{index}",
+            "get_results_bulk": "/results",
+            "get_screenshot": "/screenshot/{screenshot_id}",
             "clear_cache": "/cache/{job_id}"
         }
     }
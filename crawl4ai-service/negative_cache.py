@@ -0,0 +1,142 @@
+"""
+Negative caching with exponential backoff, shared by crawl4ai-service and
+mcp-server-fastmcp.
+
+A failed crawl or search used to leave nothing behind, so every retrying
+agent launched another full browser attempt (or SearXNG query) against the
+same dead target. Failures are now recorded in short-lived negative entries
+holding the error class, and until the entry's backoff expires the same
+request fails immediately with the recorded error.
+
+- Per target (URL or search query): the n-th consecutive failure backs off
+  for min(cap, base * 2^(n-1)) seconds (+-10% jitter so retries spread out).
+  The entry outlives its backoff by `cap` seconds so the failure count keeps
+  growing across retries; a success deletes it.
+- Per host: failures whose class means the whole host is unreachable (DNS,
+  refused connections, TLS, timeouts, 5xx) are also counted per host, once
+  per distinct URL. Once HOST_FAILURE_THRESHOLD URLs have failed, every URL
+  on the host backs off; one URL failing repeatedly only backs off itself.
+- A timeout only blocks requests that would wait no longer than the attempt
+  that timed out; a caller offering a longer timeout still gets through.
+
+This module holds only the record logic; each service does its own Redis
+I/O with the keys from cache_keys. This file is duplicated in each service
+directory; keep the copies in sync - `make check-shared` verifies they match.
+"""
+
+import random
+import re
+from typing import Any, Dict, Optional
+
+BACKOFF_BASE_SECONDS = 30.0
+BACKOFF_MAX_SECONDS = 3600.0
+HOST_FAILURE_THRESHOLD = 3
+
+# Error classes that say the host, not the page, is the problem
+HOST_ERROR_CLASSES = frozenset({"dns", "connection", "tls", "timeout", "http_5xx"})
+
+# First match wins; matched against the lowercased error message
+_CLASS_PATTERNS = (
+    # Failures of our own browser or service are never the target's fault
+    ("internal", re.compile(r"browser has been closed|target closed|browser closed|browsertype\.launch|"
+                            r"connection closed while reading from the driver")),
+    ("dns", re.compile(r"err_name_not_resolved|name or service not known|nodename nor servname|"
+                       r"getaddrinfo|temporary failure in name resolution|no address associated")),
+    ("tls", re.compile(r"err_cert|err_ssl|ssl|certificate")),
+    ("connection", re.compile(r"err_connection|err_address_unreachable|err_network|connection refused|"
+                              r"connection reset|connecterror|remoteprotocolerror|network is unreachable")),
+    ("timeout", re.compile(r"timeout|timed out|err_timed_out")),
+    ("blocked", re.compile(r"err_blocked|access denied|captcha|forbidden")),
+    ("too_many_redirects", re.compile(r"err_too_many_redirects|too many redirects")),
+)
+
+
+def classify_error(message: str, status_code: Optional[int] = None) -> str:
+    """Map an error message (and HTTP status, if known) to a coarse error class"""
+    text = (message or "").lower()
+    for error_class, pattern in _CLASS_PATTERNS:
+        if pattern.search(text):
+            return error_class
+    if status_code:
+        if status_code == 429:
+            return "rate_limited"
+        if status_code >= 500:
+            return "http_5xx"
+        if status_code >= 400:
+            return "http_4xx"
+    return "error"
+
+
+def cacheable(error_class: str) -> bool:
+    """Whether a failure of this class should be negative-cached"""
+    return error_class != "internal"
+
+
+def backoff_seconds(failures: int, base: float = BACKOFF_BASE_SECONDS, cap: float = BACKOFF_MAX_SECONDS) -> float:
+    delay = min(cap, base * 2 ** max(0, failures - 1))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def record_failure(
+    previous: Optional[Dict[str, Any]],
+    error_class: str,
+    message: str,
+    now: float,
+    timeout: Optional[float] = None,
+    base: float = BACKOFF_BASE_SECONDS,
+    cap: float = BACKOFF_MAX_SECONDS,
+    threshold: int = 1,
+    member: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Return the updated negative entry after another failure. With
+    `threshold` > 1 (host entries) the entry only starts blocking once that
+    many failures have been counted; with `member` (the failing URL's key)
+    a member that already failed is not counted again until then.
+    """
+    previous = previous or {}
+    failures = previous.get("failures", 0)
+    members = list(previous.get("members", []))
+    if member is None or failures >= threshold or member not in members:
+        failures += 1
+        if member is not None and len(members) < threshold:
+            members.append(member)
+    blocking = failures >= threshold
+    entry = {
+        "error_class": error_class,
+        "error": (message or "")[:500],
+        "failures": failures,
+        "first_failed_at": previous.get("first_failed_at", now),
+        "last_failed_at": now,
+        "retry_at": now + backoff_seconds(failures - threshold + 1, base, cap) if blocking else 0,
+        "timeout": timeout,
+    }
+    if member is not None:
+        entry["members"] = members
+    return entry
+
+
+def entry_ttl(entry: Dict[str, Any], now: float, cap: float = BACKOFF_MAX_SECONDS) -> int:
+    """Seconds to keep an entry: its backoff plus `cap`, so consecutive failures keep counting"""
+    return max(1, int(max(entry.get("retry_at", 0), now) - now + cap))
+
+
+def blocks(entry: Optional[Dict[str, Any]], now: float, timeout: Optional[float] = None) -> bool:
+    """Whether `entry` still rejects a request (offering `timeout` seconds)"""
+    if not entry or now >= entry.get("retry_at", 0):
+        return False
+    if entry.get("error_class") == "timeout" and timeout and entry.get("timeout"):
+        return timeout <= entry["timeout"]
+    return True
+
+
+def error_response(entry: Dict[str, Any], scope: str, now: float) -> Dict[str, Any]:
+    """Client-facing description of a negative-cache rejection"""
+    return {
+        "error": entry.get("error") or entry.get("error_class"),
+        "error_class": entry.get("error_class"),
+        "negative_cached": True,
+        "scope": scope,
+        "failures": entry.get("failures"),
+        "retry_after": max(1, int(entry.get("retry_at", now) - now)),
+    }
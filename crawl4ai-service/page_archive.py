@@ -0,0 +1,524 @@
+"""
+Append-only on-disk page archive: the cold tier below Redis.
+
+Redis keeps crawl results for 24h under allkeys-lru, so large pages push out
+everything else and nothing survives a flush. Every cached crawl payload is
+also appended here, zlib-compressed, to numbered segment files; an in-memory
+index maps cache keys to their latest record. Reads go through mmap, so
+re-reading a page crawled last week costs a disk (or page cache) read instead
+of a browser render, and the caller promotes the hit back into Redis.
+
+Layout of an archive directory:
+
+    00000001.seg   records: header | key | compressed value (or tombstone)
+    00000001.idx   record list of a sealed segment, written when it rolls over
+    LOCK           flock held by the owning process
+
+The active segment's index is rebuilt by scanning it on startup; a torn
+record at its tail (crash mid-write) is truncated away. Sealed segments whose
+live bytes fall below ARCHIVE_COMPACT_RATIO are compacted by copying their
+live records into the active segment, and the oldest segments are dropped
+once the archive exceeds ARCHIVE_MAX_GB.
+
+An archive directory is written by one process. Each process (uvicorn worker,
+crawl worker) takes the first free shard directory under ARCHIVE_DIR as its
+writer and opens every other shard read-only, so a page archived by any
+process on the shared volume is readable by all of them. Read-only views
+follow their shard by tail-scanning its segments at most every
+ARCHIVE_REFRESH_SECONDS; a lookup takes the newest version of a key across
+shards, so a tombstone written by one process hides puts made by another.
+ARCHIVE_SHARDS must therefore cover every process on the volume (uvicorn
+workers x API replicas + crawl worker replicas, plus any surged during a
+rolling update) and be the same for all of them; a process that finds every
+shard taken runs without an archive.
+"""
+
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "/app/archive")
+# At least one per process writing to ARCHIVE_DIR; identical on all of them
+ARCHIVE_SHARDS = int(os.getenv("ARCHIVE_SHARDS", "8"))
+ARCHIVE_SEGMENT_MB = int(os.getenv("ARCHIVE_SEGMENT_MB", "64"))
+ARCHIVE_MAX_GB = float(os.getenv("ARCHIVE_MAX_GB", "5"))
+ARCHIVE_MAX_AGE_DAYS = float(os.getenv("ARCHIVE_MAX_AGE_DAYS", "30"))
+ARCHIVE_COMPACT_RATIO = float(os.getenv("ARCHIVE_COMPACT_RATIO", "0.5"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))
+# Seconds between expiry/compaction passes
+ARCHIVE_COMPACT_INTERVAL = int(os.getenv("ARCHIVE_COMPACT_INTERVAL", "3600"))
+# Seconds between rescans of the shards written by other processes
+ARCHIVE_REFRESH_SECONDS = float(os.getenv("ARCHIVE_REFRESH_SECONDS", "5"))
+
+# magic, flags, key length, value length, crc32(key + value), timestamp
+HEADER = struct.Struct("<4sBHIId")
+MAGIC = b"OSA1"
+FLAG_PUT, FLAG_DELETE = 0, 1
+
+# [key, offset, record length, timestamp, flags]
+Entry = List
+
+
+class PageArchive:
+    """Segmented append-only key/value log with an in-memory index."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_bytes: int = 5 * 1024 ** 3,
+        max_age_seconds: float = 30 * 86400,
+        compact_ratio: float = 0.5,
+        compression_level: int = 6,
+        read_only: bool = False,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.compact_ratio = compact_ratio
+        self.compression_level = compression_level
+        self.read_only = read_only
+        # key -> (segment, offset, record length, timestamp)
+        self._index: Dict[str, Tuple[int, int, int, float]] = {}
+        # key -> (segment, offset, timestamp) of its latest tombstone
+        self._tombstones: Dict[str, Tuple[int, int, float]] = {}
+        self._sizes: Dict[int, int] = {}  # segment -> bytes on disk
+        self._live: Dict[int, int] = {}  # segment -> bytes of records the index points to
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._active = 0
+        self._active_entries: List[Entry] = []
+        self._file = None
+        self._lock_file = None
+        self._lock = threading.RLock()
+
+    # Lifecycle
+
+    def open(self):
+        """Take the directory lock and load the index; raises if another process owns it"""
+        if self.read_only:
+            self.refresh()
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, "LOCK"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(f"{self.directory} is in use by another process")
+        self._lock_file = lock_file
+
+        with self._lock:
+            segments = self._segment_numbers()
+            for number in segments[:-1]:
+                self._load_sealed(number)
+            self._active = segments[-1] if segments else 1
+            self._load_active()
+            self._file = open(self._path(self._active), "ab")
+        logger.info(f"Page archive {self.directory}: {len(self._index)} pages in {len(self._sizes)} segments")
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+            for segment_map in self._maps.values():
+                segment_map.close()
+            self._maps.clear()
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    # Public API
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the archived value for `key`, or None if absent or expired"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            number, offset, length, timestamp = entry
+            if self._expired(timestamp):
+                return None
+            try:
+                record = self._map(number, offset + length)[offset:offset + length]
+            except (OSError, ValueError):
+                # A read-only view can lag behind the writer dropping a segment
+                return None
+        _, _, key_len, _, crc, _ = HEADER.unpack_from(record)
+        if zlib.crc32(record[HEADER.size:]) != crc:
+            logger.error(f"Archive record for {key} is corrupt (segment {number}, offset {offset})")
+            return None
+        return zlib.decompress(record[HEADER.size + key_len:]).decode()
+
+    def put(self, key: str, value: str):
+        """Append a new version of `key`"""
+        compressed = zlib.compress(value.encode(), self.compression_level)
+        self._append(key, self._record(key, compressed, FLAG_PUT, time.time()))
+
+    def delete(self, key: str) -> bool:
+        """Append a tombstone for `key`; returns False if it wasn't archived"""
+        with self._lock:
+            if key not in self._index:
+                return False
+            self.tombstone(key)
+            return True
+
+    def tombstone(self, key: str):
+        """Append a tombstone for `key` even if this archive never held it"""
+        self._append(key, self._record(key, b"", FLAG_DELETE, time.time()))
+
+    def version(self, key: str) -> Optional[Tuple[float, bool]]:
+        """(timestamp, is live) of the latest record for `key`, or None if there is none"""
+        with self._lock:
+            entry = self._index.get(key)
+            tombstone = self._tombstones.get(key)
+        if entry and not self._expired(entry[3]):
+            return entry[3], True
+        if tombstone and not self._expired(tombstone[2]):
+            return tombstone[2], False
+        return None
+
+    def refresh(self):
+        """
+        Bring a read-only view up to date with its writer: forget segments
+        that were dropped and scan whatever was appended since the last call.
+        """
+        with self._lock:
+            segments = self._segment_numbers() if os.path.isdir(self.directory) else []
+            for number in set(self._sizes) - set(segments):
+                self._forget_segment(number)
+            for number in segments:
+                known = self._sizes.get(number)
+                try:
+                    size = os.path.getsize(self._path(number))
+                    if known is not None and size < known:
+                        # The writer truncated a torn record on restart
+                        self._forget_segment(number)
+                        known = None
+                    if size == known:
+                        continue
+                    entries, end = self._scan(number, known or 0)
+                except FileNotFoundError:
+                    # Dropped by the writer since the listing
+                    self._forget_segment(number)
+                    continue
+                self._sizes[number] = end
+                self._live.setdefault(number, 0)
+                for key, offset, length, timestamp, flags in entries:
+                    self._apply(key, number, offset, length, timestamp, flags)
+
+    def compact(self) -> Dict[str, int]:
+        """
+        Expire old pages, then rewrite sealed segments that are mostly dead.
+        Returns the number of segments compacted and bytes reclaimed.
+        """
+        with self._lock:
+            for key, (number, _, length, timestamp) in list(self._index.items()):
+                if self._expired(timestamp):
+                    del self._index[key]
+                    self._live[number] -= length
+            for key, (_, _, timestamp) in list(self._tombstones.items()):
+                if self._expired(timestamp):
+                    del self._tombstones[key]
+            candidates = [
+                number for number in sorted(self._sizes)
+                if number != self._active
+                and self._live.get(number, 0) < self._sizes[number] * self.compact_ratio
+            ]
+
+        compacted = reclaimed = 0
+        for number in candidates:
+            # One segment per lock hold so reads are never blocked for long
+            with self._lock:
+                if number not in self._sizes:
+                    continue
+                size = self._sizes[number]
+                for key, offset, length, timestamp, flags in self._read_index(number):
+                    if number not in self._sizes:
+                        # Retention dropped it while its records were being copied
+                        break
+                    if flags == FLAG_PUT:
+                        if self._index.get(key, (None, None))[:2] == (number, offset):
+                            self._append(key, self._map(number, offset + length)[offset:offset + length])
+                    elif self._tombstones.get(key, (None, None))[:2] == (number, offset):
+                        # Keep shadowing puts in older segments and other shards
+                        # until they would have expired anyway
+                        self._append(key, self._record(key, b"", FLAG_DELETE, timestamp))
+                if number in self._sizes:
+                    self._drop_segment(number)
+                compacted += 1
+                reclaimed += size
+        if compacted:
+            logger.info(f"Archive compaction rewrote {compacted} segments, reclaimed {reclaimed} bytes")
+        return {"segments_compacted": compacted, "bytes_reclaimed": reclaimed}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pages": len(self._index),
+                "segments": len(self._sizes),
+                "bytes": sum(self._sizes.values()),
+                "live_bytes": sum(self._live.values()),
+            }
+
+    # Internals
+
+    def _path(self, number: int, extension: str = "seg") -> str:
+        return os.path.join(self.directory, f"{number:08d}.{extension}")
+
+    def _segment_numbers(self) -> List[int]:
+        return sorted(
+            int(name[:-4]) for name in os.listdir(self.directory)
+            if name.endswith(".seg") and name[:-4].isdigit()
+        )
+
+    def _expired(self, timestamp: float) -> bool:
+        return bool(self.max_age_seconds) and time.time() - timestamp > self.max_age_seconds
+
+    @staticmethod
+    def _record(key: str, value: bytes, flags: int, timestamp: float) -> bytes:
+        body = key.encode() + value
+        return HEADER.pack(MAGIC, flags, len(body) - len(value), len(value), zlib.crc32(body), timestamp) + body
+
+    def _apply(self, key: str, number: int, offset: int, length: int, timestamp: float, flags: int):
+        previous = self._index.pop(key, None)
+        if previous:
+            self._live[previous[0]] -= previous[2]
+        if flags == FLAG_PUT:
+            self._tombstones.pop(key, None)
+            self._index[key] = (number, offset, length, timestamp)
+            self._live[number] = self._live.get(number, 0) + length
+        elif not self._expired(timestamp):
+            self._tombstones[key] = (number, offset, timestamp)
+
+    def _append(self, key: str, record: bytes):
+        _, flags, _, _, _, timestamp = HEADER.unpack_from(record)
+        with self._lock:
+            if self._sizes[self._active] and self._sizes[self._active] + len(record) > self.segment_bytes:
+                self._roll()
+            offset = self._sizes[self._active]
+            self._file.write(record)
+            self._file.flush()
+            self._sizes[self._active] += len(record)
+            self._active_entries.append([key, offset, len(record), timestamp, flags])
+            self._apply(key, self._active, offset, len(record), timestamp, flags)
+
+    def _roll(self):
+        """Seal the active segment and start a new one"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._write_index(self._active, self._active_entries)
+        self._unmap(self._active)
+
+        self._active += 1
+        self._active_entries = []
+        self._sizes[self._active] = 0
+        self._live[self._active] = 0
+        self._file = open(self._path(self._active), "ab")
+
+        # Retention: drop the oldest segments once over the size cap
+        while sum(self._sizes.values()) > self.max_bytes and len(self._sizes) > 1:
+            self._drop_segment(min(self._sizes))
+
+    def _drop_segment(self, number: int):
+        self._forget_segment(number)
+        for extension in ("seg", "idx"):
+            try:
+                os.remove(self._path(number, extension))
+            except FileNotFoundError:
+                pass
+
+    def _forget_segment(self, number: int):
+        """Remove a segment from the in-memory state, leaving its files alone"""
+        for key, (segment, _, _, _) in list(self._index.items()):
+            if segment == number:
+                del self._index[key]
+        for key, (segment, _, _) in list(self._tombstones.items()):
+            if segment == number:
+                del self._tombstones[key]
+        self._unmap(number)
+        self._sizes.pop(number, None)
+        self._live.pop(number, None)
+
+    def _map(self, number: int, end: int) -> mmap.mmap:
+        """mmap of a segment covering at least `end` bytes (the active one grows)"""
+        segment_map = self._maps.get(number)
+        if segment_map is None or len(segment_map) < end:
+            self._unmap(number)
+            with open(self._path(number), "rb") as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[number] = segment_map
+        return segment_map
+
+    def _unmap(self, number: int):
+        segment_map = self._maps.pop(number, None)
+        if segment_map is not None:
+            segment_map.close()
+
+    def _scan(self, number: int, start: int = 0) -> Tuple[List[Entry], int]:
+        """Parse a segment's records from `start`; returns them and the end of the last intact one"""
+        entries: List[Entry] = []
+        offset = start
+        with open(self._path(number), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= start:
+                return entries, start
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                while offset + HEADER.size <= size:
+                    magic, flags, key_len, value_len, crc, timestamp = HEADER.unpack_from(data, offset)
+                    end = offset + HEADER.size + key_len + value_len
+                    if magic != MAGIC or end > size or zlib.crc32(data[offset + HEADER.size:end]) != crc:
+                        break
+                    key = data[offset + HEADER.size:offset + HEADER.size + key_len].decode()
+                    entries.append([key, offset, end - offset, timestamp, flags])
+                    offset = end
+        return entries, offset
+
+    def _read_index(self, number: int) -> List[Entry]:
+        try:
+            with open(self._path(number, "idx")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            entries, _ = self._scan(number)
+            return entries
+
+    def _write_index(self, number: int, entries: List[Entry]):
+        path = self._path(number, "idx")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(entries, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _load_sealed(self, number: int):
+        self._sizes[number] = os.path.getsize(self._path(number))
+        self._live.setdefault(number, 0)
+        if not os.path.exists(self._path(number, "idx")):
+            self._write_index(number, self._scan(number)[0])
+        for key, offset, length, timestamp, flags in self._read_index(number):
+            self._apply(key, number, offset, length, timestamp, flags)
+
+    def _load_active(self):
+        path = self._path(self._active)
+        if not os.path.exists(path):
+            open(path, "ab").close()
+        entries, end = self._scan(self._active)
+        if end < os.path.getsize(path):
+            logger.warning(f"Truncating torn record at {path}:{end}")
+            os.truncate(path, end)
+        self._sizes[self._active] = end
+        self._live.setdefault(self._active, 0)
+        self._active_entries = entries
+        for key, offset, length, timestamp, flags in entries:
+            self._apply(key, self._active, offset, length, timestamp, flags)
+
+
+class ShardedArchive:
+    """
+    The shard this process writes plus read-only views of every other shard,
+    behind the PageArchive get/put/delete/compact/stats/close API.
+    """
+
+    def __init__(self, writer: PageArchive, readers: List[PageArchive], refresh_seconds: float = 5.0):
+        self.writer = writer
+        self.readers = readers
+        self.refresh_seconds = refresh_seconds
+        self._refreshed = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the newest value for `key` across shards, or None if absent, deleted or expired"""
+        self._refresh()
+        newest, source = None, None
+        for shard in [self.writer] + self.readers:
+            version = shard.version(key)
+            if version and (newest is None or version[0] > newest[0]):
+                newest, source = version, shard
+        if newest is None or not newest[1]:
+            return None
+        return source.get(key)
+
+    def put(self, key: str, value: str):
+        self.writer.put(key, value)
+
+    def delete(self, key: str) -> bool:
+        """Tombstone `key` in this process's shard so it is hidden in every shard"""
+        self._refresh()
+        if not any(shard.version(key) for shard in [self.writer] + self.readers):
+            return False
+        self.writer.tombstone(key)
+        return True
+
+    def compact(self) -> Dict[str, int]:
+        return self.writer.compact()
+
+    def stats(self) -> Dict[str, int]:
+        stats = self.writer.stats()
+        stats["shards"] = 1 + len(self.readers)
+        stats["readable_pages"] = stats["pages"] + sum(reader.stats()["pages"] for reader in self.readers)
+        return stats
+
+    def close(self):
+        self.writer.close()
+        for reader in self.readers:
+            reader.close()
+
+    def _refresh(self):
+        with self._lock:
+            if time.monotonic() - self._refreshed < self.refresh_seconds:
+                return
+            self._refreshed = time.monotonic()
+            for reader in self.readers:
+                try:
+                    reader.refresh()
+                except OSError as e:
+                    logger.warning(f"Refreshing archive shard {reader.directory} failed: {e}")
+
+
+def create_archive() -> Optional[ShardedArchive]:
+    """
+    Open the archive from the ARCHIVE_* settings: the first free shard
+    directory becomes this process's writer and every other shard is opened
+    read-only. Returns None if it is disabled or every shard is taken.
+    """
+    if not ARCHIVE_ENABLED:
+        return None
+
+    def shard_archive(shard: int, read_only: bool = False) -> PageArchive:
+        return PageArchive(
+            os.path.join(ARCHIVE_DIR, f"shard-{shard}"),
+            segment_bytes=ARCHIVE_SEGMENT_MB * 1024 * 1024,
+            max_bytes=int(ARCHIVE_MAX_GB * 1024 ** 3),
+            max_age_seconds=ARCHIVE_MAX_AGE_DAYS * 86400,
+            compact_ratio=ARCHIVE_COMPACT_RATIO,
+            compression_level=ARCHIVE_COMPRESSION_LEVEL,
+            read_only=read_only,
+        )
+
+    for shard in range(ARCHIVE_SHARDS):
+        writer = shard_archive(shard)
+        try:
+            writer.open()
+        except RuntimeError:
+            continue
+        readers = [shard_archive(other, read_only=True) for other in range(ARCHIVE_SHARDS) if other != shard]
+        for reader in readers:
+            reader.open()
+        return ShardedArchive(writer, readers, refresh_seconds=ARCHIVE_REFRESH_SECONDS)
+    logger.warning(
+        f"All {ARCHIVE_SHARDS} archive shards under {ARCHIVE_DIR} are in use; running without an archive. "
+        "Raise ARCHIVE_SHARDS to at least uvicorn workers x API replicas + crawl worker replicas"
+    )
+    return None
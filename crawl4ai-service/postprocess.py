@@ -0,0 +1,234 @@
+"""
+CPU-bound crawl post-processing, run in a process pool.
+
+Link/media flattening, JSON encoding of large pages and CosineStrategy
+clustering used to run on the service's event loop, stalling every other
+in-flight request. The functions here are module-level and picklable so they
+can execute in worker processes; the pool is started with the "spawn" method
+so workers import only this module, not the FastAPI app.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from crawl4ai.extraction_strategy import CosineStrategy
+from crawl4ai.chunking_strategy import RegexChunking, SlidingWindowChunking
+# MarkdownChunking removed in newer versions - use RegexChunking for markdown
+
+import dedup
+import screenshot_store
+import structured
+
+logger = logging.getLogger(__name__)
+
+# Keys Crawl4AI uses for the URL of a link or media entry
+URL_KEYS = ("href", "url", "link", "src")
+
+# Target size of one page of paginated markdown (see paginate_markdown)
+CHUNK_PAGE_CHARS = int(os.getenv("CHUNK_PAGE_CHARS", "8000"))
+
+
+def get_chunking_strategy(strategy_name: str):
+    """Get chunking strategy based on name"""
+    strategies = {
+        "regex": RegexChunking(),
+        "markdown": RegexChunking(),  # Use RegexChunking for markdown (MarkdownChunking removed)
+        "sliding": SlidingWindowChunking()
+    }
+    return strategies.get(strategy_name, RegexChunking())
+
+
+def get_extraction_strategy(strategy_name: str):
+    """Get extraction strategy based on name"""
+    if strategy_name == "cosine":
+        return CosineStrategy(
+            semantic_filter="",
+            word_count_threshold=10,
+            max_dist=0.2,
+            linkage_method="ward",
+            top_k=3
+        )
+    # For 'auto' and 'llm', we'll use default extraction
+    return None
+
+
+def flatten_links(links: Any) -> List[str]:
+    """Flatten Crawl4AI's {"internal": [...], "external": [...]} link dicts to URL strings"""
+    links_dict = links if isinstance(links, dict) else {}
+    flattened = []
+    for link in list(links_dict.get("internal", []) or []) + list(links_dict.get("external", []) or []):
+        if isinstance(link, dict):
+            url = next((link[k] for k in URL_KEYS if link.get(k)), None)
+            flattened.append(str(url) if url else str(link))
+        else:
+            flattened.append(str(link))
+    return flattened
+
+
+def flatten_media(media: Any) -> Dict[str, List[str]]:
+    """Flatten Crawl4AI media dicts to lists of image and video URLs"""
+    media_dict = media if isinstance(media, dict) else {}
+    flattened = {}
+    for kind in ("images", "videos"):
+        urls = []
+        for item in media_dict.get(kind, []) or []:
+            if isinstance(item, dict):
+                urls.append(str(item.get("src", item.get("url", str(item)))))
+            else:
+                urls.append(str(item))
+        flattened[kind] = urls
+    return flattened
+
+
+def run_extraction(strategy_name: str, chunking_name: str, url: str, markdown: str) -> Optional[List[Dict]]:
+    """Chunk the page and run the named extraction strategy over the chunks"""
+    strategy = get_extraction_strategy(strategy_name)
+    if strategy is None or not markdown:
+        return None
+    sections = get_chunking_strategy(chunking_name).chunk(markdown)
+    return strategy.run(url, sections)
+
+
+def paginate_markdown(markdown: str, chunking_name: str, page_chars: int = CHUNK_PAGE_CHARS) -> List[str]:
+    """
+    Split markdown into pages for cursor-based reads.
+
+    The request's chunking strategy decides where the text may be cut: regex
+    and markdown chunks are packed into pages of up to `page_chars`;
+    sliding windows (which overlap by design) are sized to about `page_chars`
+    and each window is a page.
+    """
+    if not markdown:
+        return []
+    if chunking_name == "sliding":
+        window = max(50, page_chars // 6)  # ~6 characters per word
+        chunker = SlidingWindowChunking(window_size=window, step=window * 3 // 4)
+        return [chunk for chunk in chunker.chunk(markdown) if chunk.strip()]
+
+    pages: List[str] = []
+    current = ""
+    for chunk in get_chunking_strategy(chunking_name).chunk(markdown):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        if current and len(current) + len(chunk) + 2 > page_chars:
+            pages.append(current)
+            current = ""
+        while len(chunk) > page_chars:
+            # A single oversized chunk is cut at the page size
+            if current:
+                pages.append(current)
+                current = ""
+            pages.append(chunk[:page_chars])
+            chunk = chunk[page_chars:]
+        current = f"{current}\n\n{chunk}" if current else chunk
+    if current:
+        pages.append(current)
+    return pages
+
+
+def build_crawl_payload(raw: Dict[str, Any]) -> Tuple[Dict[str, Any], str, List[str]]:
+    """
+    Turn raw crawl output into the cached CrawlResponse payload.
+
+    Returns the payload, its JSON encoding (so the event loop never has to
+    serialize a large page itself) and the markdown split into pages.
+    """
+    metadata_dict = raw.get("metadata") if isinstance(raw.get("metadata"), dict) else {}
+    payload = {
+        "url": raw["url"],
+        "markdown": raw.get("markdown") or "",
+        "html": raw.get("html") or "",
+        "links": flatten_links(raw.get("links")),
+        "media": flatten_media(raw.get("media")),
+        "metadata": {
+            "title": metadata_dict.get("title", ""),
+            "description": metadata_dict.get("description", ""),
+            "keywords": metadata_dict.get("keywords", []),
+            "language": metadata_dict.get("language", ""),
+        },
+        "extracted_content": None,
+        "screenshot": None,
+        "screenshot_ref": None,
+        "timestamp": raw["timestamp"],
+        "simhash": dedup.fingerprint(raw.get("markdown") or ""),
+    }
+    if raw.get("screenshot"):
+        # Store the image out of band; the payload only carries a reference
+        try:
+            payload["screenshot_ref"] = screenshot_store.store_screenshot(raw["screenshot"])
+        except Exception as e:
+            # e.g. PIL's DecompressionBombError on very tall full-page captures
+            logger.warning(f"Screenshot storage failed for {raw['url']}: {e}")
+    if raw.get("extraction_schema"):
+        # Schemas are written against the rendered DOM, not crawl4ai's cleaned HTML
+        try:
+            payload["extracted_content"] = structured.extract_with_schema(
+                raw["extraction_schema"], raw.get("rendered_html") or payload["html"]
+            )
+        except structured.SchemaError as e:
+            # A bad schema must not fail (and negative-cache) the crawl of a good page
+            payload["extracted_content"] = {"error": f"Extraction failed: {e}"}
+    elif raw.get("extraction_strategy"):
+        payload["extracted_content"] = run_extraction(
+            raw["extraction_strategy"], raw.get("chunking_strategy", "markdown"),
+            raw["url"], payload["markdown"]
+        )
+    chunking = raw.get("chunking_strategy", "markdown")
+    chunks = paginate_markdown(payload["markdown"], chunking)
+    payload["chunks"] = {"count": len(chunks), "strategy": chunking, "page_chars": CHUNK_PAGE_CHARS}
+    return payload, json.dumps(payload), chunks
+
+
+class PostProcessPool:
+    """
+    Process pool with a bounded queue.
+
+    At most `max_pending` jobs may be queued or running; further callers wait
+    for a slot, so a burst of large pages applies backpressure instead of
+    growing an unbounded backlog. With `workers=0` jobs run inline, which is
+    handy for local development.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(max_pending)
+
+    def start(self):
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"Post-processing pool started with {self.workers} workers")
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def pending(self) -> int:
+        return self.max_pending - self._slots._value
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) in the pool, waiting for a queue slot first"""
+        async with self._slots:
+            if self._executor is None:
+                return fn(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+
+def create_pool() -> PostProcessPool:
+    """Create the pool from POSTPROCESS_WORKERS / POSTPROCESS_MAX_PENDING"""
+    workers = int(os.getenv("POSTPROCESS_WORKERS", str(os.cpu_count() or 1)))
+    max_pending = int(os.getenv("POSTPROCESS_MAX_PENDING", str(max(workers, 1) * 4)))
+    return PostProcessPool(workers, max_pending)
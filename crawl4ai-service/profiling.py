@@ -0,0 +1,311 @@
+"""
+Profiling and memory accounting for the /debug endpoints.
+
+Memory growth in crawl pods used to surface only as OOM kills. This module
+provides the measurements behind the guarded /debug routes in main.py:
+
+- `SamplingProfiler`: samples every thread's Python stack at a fixed interval
+  for a time window and aggregates them as collapsed stacks
+  ("frame;frame;frame count" per line), the input format of flamegraph.pl
+  and speedscope. Sampling costs one `sys._current_frames()` walk per tick,
+  so it is safe to run briefly in production.
+- tracemalloc helpers: start/stop tracing, take snapshots, and diff each
+  snapshot against the previous one to find what is growing.
+- `process_memory()`: RSS of this process and of the headless browser
+  processes it spawned (read from /proc).
+- `tree_memory()`: PSS of one browser's process tree, used to recycle
+  bloated browsers. Chromium processes share most of their pages, so summing
+  their RSS counts the shared pages once per process; PSS splits them.
+- `RequestMemoryLog`: a ring buffer of per-request RSS growth, peak RSS
+  growth and request/response payload sizes.
+
+Each uvicorn worker is its own process, so every measurement covers only the
+worker that served the request.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# Process names of Playwright's Chromium builds
+BROWSER_PROCESS_NAMES = ("chrome", "chromium", "headless_shell")
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler producing collapsed (flamegraph) stacks."""
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+    def _sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("Profiler already running")
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """One "frame;frame;frame count" line per distinct stack, hottest first"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top_frames(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Functions by self time (share of samples where they are the innermost frame)"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return [
+            {"frame": frame, "samples": count, "share": round(count / total, 4)}
+            for frame, count in leaves.most_common(limit)
+        ]
+
+
+# tracemalloc state: the last snapshot is the baseline for the next diff
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+# Allocations made by tracemalloc itself would dominate every diff
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def tracemalloc_start(frames: int = 10):
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _last_snapshot = None
+
+
+def tracemalloc_stop():
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+
+
+def tracemalloc_status() -> Dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": current,
+        "peak_traced_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+    }
+
+
+def _stat_entry(stat) -> Dict[str, Any]:
+    entry = {
+        "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        "size_bytes": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_bytes"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+def tracemalloc_snapshot(limit: int = 25, key_type: str = "lineno") -> Dict[str, Any]:
+    """
+    Take a snapshot and return its largest allocation sites plus the sites
+    that grew most since the previous snapshot (if any).
+    """
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not tracing; start it first")
+    snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+    result: Dict[str, Any] = {
+        **tracemalloc_status(),
+        "top": [_stat_entry(s) for s in snapshot.statistics(key_type)[:limit]],
+    }
+    if _last_snapshot is not None:
+        diff = snapshot.compare_to(_last_snapshot, key_type)
+        result["growth"] = [_stat_entry(s) for s in diff[:limit] if s.size_diff > 0]
+    _last_snapshot = snapshot
+    return result
+
+
+def rss_bytes(pid: Optional[int] = None) -> int:
+    """Resident set size of a process (0 if it is gone or /proc is unavailable)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def pss_bytes(pid: Optional[int] = None) -> int:
+    """Proportional set size of a process from smaps_rollup (RSS if unavailable)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return rss_bytes(pid)
+
+
+def _children_map() -> Dict[int, List[int]]:
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # comm may contain spaces; fields after the closing paren are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def _process_name(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/comm") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def process_memory() -> Dict[str, Any]:
+    """
+    RSS of this process and of the browser processes below it (Playwright's
+    driver launches Chromium, so they are grandchildren, not children).
+    """
+    browser_rss, browser_pids, other_rss = 0, [], 0
+    try:
+        children = _children_map()
+    except OSError:
+        children = {}
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        rss = rss_bytes(pid)
+        if any(name in _process_name(pid).lower() for name in BROWSER_PROCESS_NAMES):
+            browser_rss += rss
+            browser_pids.append(pid)
+        else:
+            other_rss += rss
+    return {
+        "rss_bytes": rss_bytes(),
+        "browser_rss_bytes": browser_rss,
+        "browser_processes": len(browser_pids),
+        # Playwright driver and post-processing workers
+        "other_children_rss_bytes": other_rss,
+    }
+
+
+def child_pids(pid: Optional[int] = None) -> List[int]:
+    """Direct children of a process (this one by default)"""
+    try:
+        return _children_map().get(pid or os.getpid(), [])
+    except OSError:
+        return []
+
+
+def tree_memory(root_pids: List[int]) -> Dict[str, int]:
+    """PSS of the given processes and every process below them"""
+    try:
+        children = _children_map()
+    except OSError:
+        children = {}
+    stack, seen, pss = list(root_pids), set(), 0
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        stack.extend(children.get(pid, []))
+        pss += pss_bytes(pid)
+    return {"pss_bytes": pss, "processes": len(seen)}
+
+
+def peak_rss_bytes() -> int:
+    """High-water mark of this process's RSS"""
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+class RequestMemoryLog:
+    """
+    Ring buffer of per-request memory and payload measurements.
+
+    Requests overlap on the event loop, so RSS growth during one request
+    includes whatever ran concurrently; the peak growth (how far the request
+    pushed the process high-water mark) is the useful leak/OOM signal.
+    """
+
+    def __init__(self, size: int = 500):
+        self._entries: deque = deque(maxlen=size)
+
+    def start(self) -> Dict[str, int]:
+        return {"rss": rss_bytes(), "peak": peak_rss_bytes(), "started": time.perf_counter()}
+
+    def finish(self, mark: Dict[str, int], method: str, path: str, status: int,
+               request_bytes: Optional[int], response_bytes: Optional[int]):
+        self._entries.append({
+            "method": method,
+            "path": path,
+            "status": status,
+            "duration_ms": int((time.perf_counter() - mark["started"]) * 1000),
+            "request_bytes": request_bytes,
+            "response_bytes": response_bytes,
+            "rss_delta_bytes": rss_bytes() - mark["rss"],
+            "peak_rss_growth_bytes": peak_rss_bytes() - mark["peak"],
+            "timestamp": time.time(),
+        })
+
+    def recent(self, limit: int = 50, sort: Optional[str] = None) -> List[Dict[str, Any]]:
+        entries = list(self._entries)
+        if sort:
+            entries.sort(key=lambda e: e.get(sort) or 0, reverse=True)
+        else:
+            entries.reverse()
+        return entries[:limit]
@@ -0,0 +1,186 @@
+"""
+Adaptive page readiness for crawls.
+
+Without a caller-supplied `wait_for`, a crawl used to extract right after
+DOMContentLoaded: JavaScript-rendered pages came back half empty, while
+waiting for a fixed time wastes most of it on pages that were ready early.
+Adaptive mode hands crawl4ai a `js:` wait_for predicate (polled in the page)
+that returns once the page has settled:
+
+- DOM quiescence: no childList/characterData mutations for `quiet_ms`
+- network idle: no fetch/XHR in flight and no resource finished for `quiet_ms`
+- content growth: the body's text length unchanged for `quiet_ms`
+
+or once the hard cap `cap_ms` has passed, whichever comes first. The
+predicate stamps the outcome on <html data-oss-ready="total;settle;reason">,
+which is read back from the raw HTML after the crawl.
+
+Settle times of pages that became quiet are learned per host (an EWMA and
+mean deviation kept in Redis, or in-process without it). A host with enough
+samples gets a cap just above its usual settle time instead of the global
+maximum, and a minimum wait of half its average so a slow API request
+doesn't look like quiescence. A page that hits such a learned cap still
+counts as a sample (of at least the cap), so the cap grows back for hosts
+whose pages got slower.
+
+Some hosts never settle (long polling, rotating ads, live tickers), so their
+crawls never produce a sample and every one of them waited the full global
+cap. Each crawl also updates an EWMA of how often the host's pages hit the
+cap; once it passes CAPPED_RATE the host is waited on for only MIN_CAP_MS.
+Those short-capped crawls keep feeding the rate (but not the settle time),
+so a host whose pages start settling in time leaves this mode on its own.
+"""
+
+import json
+import re
+import time
+from typing import Any, Dict, Optional
+
+import cache_keys
+
+QUIET_MS = 500
+MAX_WAIT_MS = 10000
+MIN_CAP_MS = 2000
+MIN_SAMPLES = 3
+# Share of a host's crawls hitting the cap above which its cap drops to MIN_CAP_MS
+CAPPED_RATE = 0.8
+EWMA_ALPHA = 0.2
+STATS_TTL_SECONDS = 30 * 86400
+MAX_LOCAL_HOSTS = 10000
+
+_MARKER_RE = re.compile(r'data-oss-ready="(\d+);(\d+);(\w+)"')
+
+# Placeholders are substituted by wait_for_script; braces are literal JS
+_PREDICATE = """js:() => {
+  const QUIET = __QUIET__, MIN_WAIT = __MIN_WAIT__, CAP = __CAP__;
+  const now = performance.now();
+  let s = window.__ossReadiness;
+  if (!s) {
+    s = window.__ossReadiness = {start: now, lastMutation: now, lastNetwork: now, lastGrowth: now, text: -1, pending: 0};
+    new MutationObserver(() => { s.lastMutation = performance.now(); })
+      .observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+    try {
+      new PerformanceObserver(() => { s.lastNetwork = performance.now(); }).observe({type: 'resource'});
+    } catch (e) {}
+    const done = () => { s.pending = Math.max(0, s.pending - 1); s.lastNetwork = performance.now(); };
+    const fetch = window.fetch;
+    if (fetch) {
+      window.fetch = function () { s.pending++; return fetch.apply(this, arguments).finally(done); };
+    }
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () { s.pending++; this.addEventListener('loadend', done); return send.apply(this, arguments); };
+  }
+  const text = document.body ? document.body.textContent.length : 0;
+  if (text !== s.text) { s.text = text; s.lastGrowth = now; }
+  const elapsed = now - s.start;
+  let reason = null;
+  if (elapsed >= CAP) {
+    reason = 'cap';
+  } else if (elapsed >= MIN_WAIT && text > 0 && s.pending === 0
+             && now - s.lastMutation >= QUIET && now - s.lastNetwork >= QUIET && now - s.lastGrowth >= QUIET) {
+    reason = 'quiet';
+  }
+  if (!reason) return false;
+  document.documentElement.setAttribute('data-oss-ready', Math.round(now) + ';' + Math.round(elapsed) + ';' + reason);
+  return true;
+}"""
+
+# Fallback when Redis is unavailable: host -> stats
+_local_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _remember_locally(host: str, stats: Dict[str, float]):
+    if host not in _local_stats and len(_local_stats) >= MAX_LOCAL_HOSTS:
+        # Forget the oldest host (dicts keep insertion order)
+        _local_stats.pop(next(iter(_local_stats)))
+    _local_stats[host] = stats
+
+
+def wait_for_script(plan: Dict[str, int]) -> str:
+    return (
+        _PREDICATE.replace("__QUIET__", str(plan["quiet_ms"]))
+        .replace("__MIN_WAIT__", str(plan["min_wait_ms"]))
+        .replace("__CAP__", str(plan["cap_ms"]))
+    )
+
+
+def parse_marker(html: str) -> Optional[Dict[str, Any]]:
+    """Read the predicate's outcome from the rendered page's <html> tag"""
+    match = _MARKER_RE.search((html or "")[:4096])
+    if not match:
+        return None
+    return {"total_ms": int(match.group(1)), "settle_ms": int(match.group(2)), "reason": match.group(3)}
+
+
+async def get_stats(redis_client, host: str) -> Dict[str, float]:
+    if redis_client is None:
+        return dict(_local_stats.get(host, {}))
+    try:
+        raw = await redis_client.hgetall(cache_keys.readiness_key(host))
+    except Exception:
+        return dict(_local_stats.get(host, {}))
+    return {k.decode() if isinstance(k, bytes) else k: float(v) for k, v in raw.items()}
+
+
+async def plan(
+    redis_client,
+    host: str,
+    page_timeout: float,
+    quiet_ms: int = QUIET_MS,
+    max_wait_ms: int = MAX_WAIT_MS,
+) -> Dict[str, int]:
+    """Quiet window, minimum wait and cap for a crawl of `host`"""
+    # The wait follows navigation, which shares the page timeout
+    cap_ms = min(max_wait_ms, int(page_timeout * 1000 * 0.8))
+    min_wait_ms = 0
+    learned = False
+    stats = await get_stats(redis_client, host)
+    if stats.get("observed", 0) >= MIN_SAMPLES and stats.get("cap_rate", 0) >= CAPPED_RATE:
+        # Mostly caps out: waiting longer would not make it settle
+        cap_ms = min(cap_ms, MIN_CAP_MS)
+    elif stats.get("samples", 0) >= MIN_SAMPLES:
+        learned = True
+        learned_cap = int(stats["ewma_ms"] + 4 * stats.get("dev_ms", 0) + quiet_ms)
+        cap_ms = min(cap_ms, max(MIN_CAP_MS, learned_cap))
+        min_wait_ms = int(min(stats["ewma_ms"] * 0.5, cap_ms / 2))
+    return {"quiet_ms": quiet_ms, "min_wait_ms": min_wait_ms, "cap_ms": max(quiet_ms, cap_ms), "learned": learned}
+
+
+async def observe(redis_client, host: str, html: str, learned_cap: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Learn from a finished crawl's readiness marker; returns the parsed marker.
+    `learned_cap`: the crawl's cap came from this host's stats.
+    """
+    marker = parse_marker(html)
+    if not marker:
+        return None
+    stats = await get_stats(redis_client, host)
+    if marker["reason"] == "quiet" or learned_cap:
+        settle = float(marker["settle_ms"])
+        if stats.get("samples"):
+            deviation = abs(settle - stats["ewma_ms"])
+            stats["ewma_ms"] = EWMA_ALPHA * settle + (1 - EWMA_ALPHA) * stats["ewma_ms"]
+            stats["dev_ms"] = EWMA_ALPHA * deviation + (1 - EWMA_ALPHA) * stats.get("dev_ms", 0)
+        else:
+            stats["ewma_ms"], stats["dev_ms"] = settle, settle / 2
+        stats["samples"] = stats.get("samples", 0) + 1
+    capped = marker["reason"] == "cap"
+    if capped:
+        stats["capped"] = stats.get("capped", 0) + 1
+    if stats.get("observed"):
+        stats["cap_rate"] = EWMA_ALPHA * capped + (1 - EWMA_ALPHA) * stats.get("cap_rate", 0)
+    else:
+        stats["cap_rate"] = float(capped)
+    stats["observed"] = stats.get("observed", 0) + 1
+    stats["updated_at"] = time.time()
+
+    if redis_client is None:
+        _remember_locally(host, stats)
+        return marker
+    try:
+        key = cache_keys.readiness_key(host)
+        await redis_client.hset(key, mapping={k: json.dumps(round(v, 1)) for k, v in stats.items()})
+        await redis_client.expire(key, STATS_TTL_SECONDS)
+    except Exception:
+        _remember_locally(host, stats)
+    return marker
@@ -0,0 +1,118 @@
+"""
+Out-of-band screenshot storage.
+
+Full-page PNG screenshots used to travel base64-encoded inside every cache
+entry and tool response. Instead they are re-encoded (WebP by default,
+optionally downscaled), written once to a content-addressed directory and
+referenced by ID; clients fetch the image from GET /screenshot/{id}.
+
+SCREENSHOT_DIR stands in for an object store: point it at a volume shared by
+all replicas (or a mounted bucket) so any replica can serve any screenshot.
+"""
+
+import base64
+import hashlib
+import io
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+SCREENSHOT_DIR = os.getenv("SCREENSHOT_DIR", "/app/screenshots")
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "webp").lower()  # webp | jpeg | png
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+# Downscale wider screenshots to this width (0 keeps the original size)
+SCREENSHOT_MAX_WIDTH = int(os.getenv("SCREENSHOT_MAX_WIDTH", "1280"))
+SCREENSHOT_RETENTION_DAYS = float(os.getenv("SCREENSHOT_RETENTION_DAYS", "7"))
+
+# WebP cannot encode images taller or wider than this
+WEBP_MAX_DIMENSION = 16383
+
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg", "png": "png"}
+MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg", "png": "image/png"}
+SCREENSHOT_ID_RE = re.compile(r"^[0-9a-f]{32}\.(webp|jpg|png)$")
+
+
+def _path(screenshot_id: str) -> str:
+    # Two-level fan-out keeps directories small
+    return os.path.join(SCREENSHOT_DIR, screenshot_id[:2], screenshot_id[2:4], screenshot_id)
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, format="WEBP", quality=SCREENSHOT_QUALITY, method=4)
+    elif fmt == "jpeg":
+        image.convert("RGB").save(buffer, format="JPEG", quality=SCREENSHOT_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def store_screenshot(screenshot_b64: str) -> Dict[str, Any]:
+    """
+    Re-encode a base64 screenshot and store it content-addressed.
+    Returns a reference: {"id", "url", "format", "width", "height", "bytes"}.
+    """
+    image = Image.open(io.BytesIO(base64.b64decode(screenshot_b64)))
+    image.load()
+
+    if SCREENSHOT_MAX_WIDTH and image.width > SCREENSHOT_MAX_WIDTH:
+        height = max(1, round(image.height * SCREENSHOT_MAX_WIDTH / image.width))
+        image = image.resize((SCREENSHOT_MAX_WIDTH, height), Image.LANCZOS)
+
+    fmt = SCREENSHOT_FORMAT if SCREENSHOT_FORMAT in EXTENSIONS else "webp"
+    if fmt == "webp" and max(image.size) > WEBP_MAX_DIMENSION:
+        # Very long full-page captures exceed WebP's limits
+        fmt = "jpeg"
+    data = _encode(image, fmt)
+
+    screenshot_id = f"{hashlib.blake2b(data, digest_size=16).hexdigest()}.{EXTENSIONS[fmt]}"
+    path = _path(screenshot_id)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    return {
+        "id": screenshot_id,
+        "url": f"/screenshot/{screenshot_id}",
+        "format": EXTENSIONS[fmt],
+        "width": image.width,
+        "height": image.height,
+        "bytes": len(data),
+    }
+
+
+def load_screenshot(screenshot_id: str) -> Optional[Tuple[bytes, str]]:
+    """Return (image bytes, media type) for a stored screenshot, or None."""
+    if not SCREENSHOT_ID_RE.match(screenshot_id):
+        return None
+    try:
+        with open(_path(screenshot_id), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    return data, MEDIA_TYPES[screenshot_id.rsplit(".", 1)[1]]
+
+
+def prune_screenshots() -> int:
+    """Delete screenshots older than SCREENSHOT_RETENTION_DAYS; returns the count removed."""
+    if SCREENSHOT_RETENTION_DAYS <= 0 or not os.path.isdir(SCREENSHOT_DIR):
+        return 0
+    cutoff = time.time() - SCREENSHOT_RETENTION_DAYS * 86400
+    removed = 0
+    for root, _, files in os.walk(SCREENSHOT_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
@@ -0,0 +1,154 @@
+"""
+Breadth-first site crawling for /crawl/site.
+
+Starting from a seed URL, links extracted from each crawled page are expanded
+breadth-first within a scope (same host, optional path prefix) up to depth
+and page limits. The seen-set is a Bloom filter over canonical URLs, so a
+site with many thousands of links costs a few kilobytes of frontier state.
+Each page is crawled through the caller's normal crawl path (cache, queue,
+browser), and results are yielded as soon as each page finishes.
+"""
+
+import asyncio
+import hashlib
+import math
+import posixpath
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+from cache_keys import canonicalize_url
+
+# Links to these are never HTML pages worth rendering
+SKIP_EXTENSIONS = {
+    ".pdf", ".zip", ".gz", ".tar", ".tgz", ".rar", ".7z", ".exe", ".dmg", ".iso",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".bmp", ".tiff",
+    ".mp3", ".mp4", ".m4a", ".wav", ".avi", ".mov", ".webm", ".mkv",
+    ".css", ".js", ".json", ".xml", ".rss", ".atom", ".woff", ".woff2", ".ttf",
+}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one BLAKE2b digest."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        bits = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_bits = bits
+        self.num_hashes = max(1, round(bits / capacity * math.log(2)))
+        self._bits = bytearray((bits + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str) -> bool:
+        """Add an item; returns False if it was (probably) already present"""
+        added = False
+        for pos in self._positions(item):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                added = True
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SiteScope:
+    """Decides which discovered links belong to the crawl."""
+
+    def __init__(self, seed: str, path_prefix: Optional[str] = None, include_subdomains: bool = False):
+        parts = urlsplit(seed)
+        self.host = (parts.hostname or "").lower()
+        self.include_subdomains = include_subdomains
+        if path_prefix is None:
+            # Default to the seed's directory: /docs/intro -> /docs/
+            path_prefix = parts.path if parts.path.endswith("/") else posixpath.dirname(parts.path) + "/"
+        self.path_prefix = path_prefix if path_prefix.startswith("/") else f"/{path_prefix}"
+
+    def allows(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return False
+        host = (parts.hostname or "").lower()
+        if host != self.host and not (self.include_subdomains and host.endswith(f".{self.host}")):
+            return False
+        path = parts.path or "/"
+        if not path.startswith(self.path_prefix):
+            return False
+        return posixpath.splitext(path)[1].lower() not in SKIP_EXTENSIONS
+
+
+async def crawl_site(
+    seed: str,
+    crawl_page: Callable[[str], Awaitable[Dict[str, Any]]],
+    scope: SiteScope,
+    max_depth: int,
+    max_pages: int,
+    concurrency: int,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Crawl `seed` and its in-scope links breadth-first.
+
+    `crawl_page(url)` returns a CrawlResponse payload (with `links`) or
+    raises. Yields {"url", "depth", "parent", "result"} or
+    {"url", "depth", "parent", "error"} per page, in completion order.
+    """
+    seen = BloomFilter(max(max_pages * 20, 1000))
+    frontier: asyncio.Queue = asyncio.Queue()
+    results: asyncio.Queue = asyncio.Queue()
+
+    seed = urldefrag(seed)[0]
+    seen.add(canonicalize_url(seed))
+    frontier.put_nowait((seed, 0, None))
+    scheduled = 1
+    pending = 1  # scheduled pages that haven't finished
+
+    async def worker():
+        nonlocal scheduled, pending
+        while True:
+            url, depth, parent = await frontier.get()
+            entry: Dict[str, Any] = {"url": url, "depth": depth, "parent": parent}
+            try:
+                try:
+                    page = await crawl_page(url)
+                    entry["result"] = page
+                except Exception as e:
+                    page = None
+                    entry["error"] = getattr(e, "detail", None) or str(e)
+
+                # FIFO frontier + first-come scheduling keeps the page budget breadth-first
+                if page and depth < max_depth:
+                    for link in page.get("links") or []:
+                        if scheduled >= max_pages:
+                            break
+                        try:
+                            candidate = urldefrag(urljoin(url, str(link)))[0]
+                            if not scope.allows(candidate) or not seen.add(canonicalize_url(candidate)):
+                                continue
+                        except ValueError:
+                            # Malformed link (bad port, invalid IPv6 host, ...)
+                            continue
+                        scheduled += 1
+                        pending += 1
+                        frontier.put_nowait((candidate, depth + 1, url))
+            finally:
+                # Always account for the page, or the stream would never end
+                pending -= 1
+                await results.put(entry)
+                if pending == 0:
+                    await results.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        while True:
+            entry = await results.get()
+            if entry is None:
+                return
+            yield entry
+    finally:
+        # Also runs when the client disconnects mid-stream
+        for task in workers:
+            task.cancel()
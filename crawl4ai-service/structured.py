@@ -0,0 +1,238 @@
+"""
+Schema-driven structured extraction without an LLM.
+
+A schema names a base selector matching one element per record and the
+fields to read from each, in the JSON format of crawl4ai's
+JsonCssExtractionStrategy:
+
+    {
+      "name": "products",
+      "baseSelector": "div.product",
+      "fields": [
+        {"name": "title", "selector": "h2", "type": "text"},
+        {"name": "price", "selector": ".price", "type": "number"},
+        {"name": "url", "selector": "a", "type": "attribute", "attribute": "href"},
+        {"name": "tags", "selector": ".tag", "type": "list"},
+        {"name": "variants", "selector": ".variant", "type": "nested_list", "fields": [...]}
+      ]
+    }
+
+Selectors are CSS unless the schema sets "selectorType": "xpath"; a single
+selector can override that with an "xpath:" or "css:" prefix. A field
+without a selector reads the record element itself.
+
+Field types: text, html, attribute, number, integer, boolean (whether the
+selector matches), regex ("pattern"; the first group if it has one), list
+(text of every match), nested (one sub-record), nested_list (a sub-record
+per match). "attribute" also makes text, number, integer, regex and list
+read that attribute instead of the text; "default" replaces missing values.
+
+Every selector is compiled to an lxml XPath object once per schema and the
+compiled schema is cached by the schema's hash, so repeated extractions only
+pay for parsing the page.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import lxml.html
+from cssselect import GenericTranslator, SelectorError
+from lxml import etree
+
+import cache_keys
+
+FIELD_TYPES = {"text", "html", "attribute", "number", "integer", "boolean", "regex", "list", "nested", "nested_list"}
+MAX_RECORDS = 1000
+MAX_COMPILED = 256
+
+_NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?|-?\.\d+")
+_translator = GenericTranslator()
+_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+# Every selector is evaluated once against this at compile time, so XPath that
+# compiles but cannot run (undefined variables, unknown prefixes) is a schema error
+_PROBE = lxml.html.fromstring("<div><p>probe</p></div>")
+
+
+class SchemaError(ValueError):
+    """Raised for a schema that cannot be compiled."""
+
+
+def _optional_str(spec: Dict[str, Any], key: str, path: str) -> Optional[str]:
+    value = spec.get(key)
+    if value is not None and not isinstance(value, str):
+        raise SchemaError(f"{path}: '{key}' must be a string")
+    return value
+
+
+def _field_list(spec: Dict[str, Any], path: str) -> List[Any]:
+    fields = spec.get("fields")
+    if not fields or not isinstance(fields, list):
+        raise SchemaError(f"{path}: 'fields' must be a non-empty list")
+    return fields
+
+
+class CompiledField:
+    def __init__(self, spec: Dict[str, Any], selector_type: str, path: str):
+        if not isinstance(spec, dict):
+            raise SchemaError(f"{path}: every field must be an object")
+        self.name = spec.get("name")
+        if not isinstance(self.name, str) or not self.name:
+            raise SchemaError(f"{path}: every field needs a name")
+        path = f"{path}.{self.name}"
+        self.type = spec.get("type", "text")
+        if not isinstance(self.type, str) or self.type not in FIELD_TYPES:
+            raise SchemaError(f"{path}: unknown type {self.type!r} (expected one of {', '.join(sorted(FIELD_TYPES))})")
+        self.attribute = _optional_str(spec, "attribute", path)
+        if self.type == "attribute" and not self.attribute:
+            raise SchemaError(f"{path}: attribute fields need an 'attribute'")
+        self.default = spec.get("default")
+        self.selector = _compile_selector(_optional_str(spec, "selector", path), selector_type, path, relative=True)
+        self.pattern = None
+        if self.type == "regex":
+            try:
+                self.pattern = re.compile(_optional_str(spec, "pattern", path) or "")
+            except re.error as e:
+                raise SchemaError(f"{path}: invalid pattern: {e}")
+            if not self.pattern.pattern:
+                raise SchemaError(f"{path}: regex fields need a 'pattern'")
+        self.fields: List["CompiledField"] = []
+        if self.type in ("nested", "nested_list"):
+            self.fields = [CompiledField(f, selector_type, path) for f in _field_list(spec, path)]
+
+
+class CompiledSchema:
+    def __init__(self, schema: Dict[str, Any]):
+        if not isinstance(schema, dict):
+            raise SchemaError("Schema must be a JSON object")
+        self.name = _optional_str(schema, "name", "schema") or "records"
+        selector_type = schema.get("selectorType", "css")
+        if selector_type not in ("css", "xpath"):
+            raise SchemaError(f"selectorType must be 'css' or 'xpath', not {selector_type!r}")
+        base = _optional_str(schema, "baseSelector", "schema")
+        if not base:
+            raise SchemaError("Schema needs a baseSelector")
+        self.base = _compile_selector(base, selector_type, "baseSelector", relative=False)
+        self.fields = [CompiledField(f, selector_type, "fields") for f in _field_list(schema, "schema")]
+
+
+def _compile_selector(selector: Optional[str], selector_type: str, path: str, relative: bool) -> Optional[etree.XPath]:
+    if not selector:
+        return None
+    if selector.startswith(("xpath:", "css:")):
+        selector_type, _, selector = selector.partition(":")
+    try:
+        if selector_type == "css":
+            prefix = "descendant::" if relative else "descendant-or-self::"
+            compiled = etree.XPath(_translator.css_to_xpath(selector, prefix=prefix))
+        else:
+            compiled = etree.XPath(selector)
+        compiled(_PROBE)
+        return compiled
+    except (SelectorError, etree.XPathError) as e:
+        raise SchemaError(f"{path}: invalid {selector_type} selector {selector!r}: {e}")
+
+
+_compiled: "OrderedDict[str, CompiledSchema]" = OrderedDict()
+
+
+def schema_hash(schema: Dict[str, Any]) -> str:
+    return cache_keys.digest(schema)
+
+
+def compile_schema(schema: Dict[str, Any]) -> CompiledSchema:
+    """Compile a schema, reusing the cached compilation of an identical one; raises SchemaError"""
+    key = schema_hash(schema)
+    compiled = _compiled.get(key)
+    if compiled is not None:
+        _compiled.move_to_end(key)
+        return compiled
+    compiled = CompiledSchema(schema)
+    _compiled[key] = compiled
+    if len(_compiled) > MAX_COMPILED:
+        _compiled.popitem(last=False)
+    return compiled
+
+
+def _text(node) -> str:
+    if isinstance(node, str):
+        # Attribute and text() results are strings already
+        return " ".join(node.split())
+    return " ".join(node.text_content().split())
+
+
+def _source(field: CompiledField, node) -> Optional[str]:
+    if field.attribute and not isinstance(node, str):
+        return node.get(field.attribute)
+    return _text(node)
+
+
+def _number(value: Optional[str], integer: bool):
+    match = _NUMBER_RE.search(value or "")
+    if not match:
+        return None
+    number = float(match.group(0).replace(",", ""))
+    return int(number) if integer else number
+
+
+def _field_value(field: CompiledField, element):
+    nodes = field.selector(element) if field.selector is not None else [element]
+    if not isinstance(nodes, list):
+        # Scalar XPath results (count(), string(), ...)
+        nodes = [str(nodes)] if nodes not in (None, "") else []
+
+    if field.type == "boolean":
+        return bool(nodes)
+    if field.type == "list":
+        return [v for v in (_source(field, n) for n in nodes) if v is not None]
+    if field.type == "nested_list":
+        return [_record(field.fields, n) for n in nodes if not isinstance(n, str)]
+    if not nodes:
+        return None
+    node = nodes[0]
+    if field.type == "nested":
+        return _record(field.fields, node) if not isinstance(node, str) else None
+    if field.type == "html":
+        return node if isinstance(node, str) else lxml.html.tostring(node, encoding="unicode")
+    value = _source(field, node)
+    if field.type in ("number", "integer"):
+        return _number(value, field.type == "integer")
+    if field.type == "regex":
+        match = field.pattern.search(value or "")
+        if not match:
+            return None
+        return match.group(1) if field.pattern.groups else match.group(0)
+    return value
+
+
+def _record(fields: List[CompiledField], element) -> Dict[str, Any]:
+    record = {}
+    for field in fields:
+        value = _field_value(field, element)
+        record[field.name] = field.default if value is None else value
+    return record
+
+
+def extract(compiled: CompiledSchema, html: str) -> List[Dict[str, Any]]:
+    """Records for every element matching the schema's base selector; raises SchemaError"""
+    if not html or not html.strip():
+        return []
+    try:
+        # Bytes, so pages that declare their encoding still parse
+        root = lxml.html.fromstring(html.encode("utf-8"), parser=_PARSER)
+    except (etree.ParserError, ValueError):
+        return []
+    try:
+        matches = compiled.base(root)
+        if not isinstance(matches, list):
+            return []
+        return [_record(compiled.fields, element) for element in matches[:MAX_RECORDS]
+                if not isinstance(element, str)]
+    except etree.XPathEvalError as e:
+        # The schema's fault, not the page's
+        raise SchemaError(f"Selector failed on this page: {e}")
+
+
+def extract_with_schema(schema: Dict[str, Any], html: str) -> List[Dict[str, Any]]:
+    """Compile (or reuse) `schema` and extract from `html`; picklable for the post-processing pool"""
+    return extract(compile_schema(schema), html)
@@ -0,0 +1,33 @@
+import pytest
+
+import cache_keys
+
+
+def test_output_options_select_distinct_entries():
+    url = "https://example.com/page"
+    plain = cache_keys.crawl_digest(url)
+    assert cache_keys.crawl_digest(url, cache_keys.crawl_params(word_count_threshold=10, readiness="adaptive")) == plain
+    variants = [
+        {"css_selector": "main"},
+        {"js_code": "window.scrollTo(0, 1e6)"},
+        {"wait_for": "#content"},
+        {"word_count_threshold": 50},
+        {"readiness": "load"},
+    ]
+    digests = {cache_keys.crawl_digest(url, cache_keys.crawl_params(**options)) for options in variants}
+    assert len(digests) == len(variants)
+    assert plain not in digests
+
+
+def test_unknown_option_is_rejected():
+    with pytest.raises(TypeError):
+        cache_keys.crawl_params(timeout=30)
+
+
+def test_path_escapes_are_normalized_without_changing_meaning():
+    canonical = cache_keys.canonicalize_url
+    assert canonical("https://Example.com/%7Euser/a%2db") == "https://example.com/~user/a-b"
+    assert canonical("https://example.com/a%2fb") == "https://example.com/a%2Fb"
+    assert canonical("https://example.com/a%2Fb") != canonical("https://example.com/a/b")
+    assert canonical("https://example.com/café menu") == "https://example.com/caf%C3%A9%20menu"
+    assert canonical("https://example.com/caf%c3%a9%20menu") == "https://example.com/caf%C3%A9%20menu"
@@ -0,0 +1,66 @@
+import content_filter
+
+README = """# mytool
+
+A command line tool for syncing project files between machines quickly.
+
+## Installation
+
+Install the package and its dependencies with pip:
+
+```bash
+# install deps
+pip install mytool
+
+pip install mytool[extras]
+```
+
+## Configuration
+
+Write the configuration file before the first sync run:
+
+```toml
+[sync]
+remote = "backup"
+```
+
+## Usage
+
+Run a sync of the current project directory:
+
+```bash
+mytool sync .
+```
+
+Run it again after changes; only modified files are sent.
+
+```bash
+mytool sync . --dry-run
+```
+"""
+
+
+def test_fenced_blocks_are_atomic():
+    blocks = content_filter.split_blocks(README)
+    code = [b for b in blocks if b["text"].startswith("```")]
+    assert len(code) == 4
+    install = code[0]
+    assert install["heading"] == "Installation"
+    # Comments, blank lines and the repeated closing fences stay inside the block
+    assert install["text"] == "```bash\n# install deps\npip install mytool\n\npip install mytool[extras]\n```"
+    assert all(b["text"].endswith("```") for b in code)
+    assert "install deps" not in [b["heading"] for b in blocks]
+
+
+def test_pruned_markdown_keeps_fences_balanced():
+    pruned = content_filter.prune_markdown(README, "install pip dependencies", max_chars=400)
+    markdown = pruned["markdown"]
+    assert "pip install mytool" in markdown
+    assert "## install deps" not in markdown
+    assert markdown.count("```") % 2 == 0
+
+
+def test_truncated_fence_is_closed():
+    text = content_filter._close_fence("```python\nprint('a')")
+    assert text.endswith("\n```")
+    assert content_filter._close_fence("```\nx\n```") == "```\nx\n```"
@@ -0,0 +1,24 @@
+import negative_cache
+
+
+def host_failures(urls, threshold=3):
+    entry = None
+    for i, url in enumerate(urls):
+        entry = negative_cache.record_failure(entry, "connection", "refused", now=100.0 + i, threshold=threshold, member=url)
+    return entry
+
+
+def test_host_counts_distinct_urls():
+    entry = host_failures(["a"] * 10)
+    assert entry["failures"] == 1
+    assert not negative_cache.blocks(entry, now=200.0)
+
+    entry = host_failures(["a", "b", "a", "c"])
+    assert entry["failures"] == 3
+    assert negative_cache.blocks(entry, now=104.0)
+
+
+def test_blocking_host_keeps_backing_off():
+    entry = host_failures(["a", "b", "c", "c", "c"])
+    assert entry["failures"] == 5
+    assert len(entry["members"]) == 3
@@ -0,0 +1,79 @@
+import os
+
+import page_archive
+
+
+def open_shards(tmp_path, count=2, **kwargs):
+    """One ShardedArchive per shard, each writing its own directory and reading the rest"""
+    archives = []
+    for shard in range(count):
+        writer = page_archive.PageArchive(str(tmp_path / f"shard-{shard}"), **kwargs)
+        writer.open()
+        readers = [
+            page_archive.PageArchive(str(tmp_path / f"shard-{other}"), read_only=True, **kwargs)
+            for other in range(count) if other != shard
+        ]
+        for reader in readers:
+            reader.open()
+        archives.append(page_archive.ShardedArchive(writer, readers, refresh_seconds=0))
+    return archives
+
+
+def test_every_process_reads_every_shard(tmp_path):
+    first, second = open_shards(tmp_path)
+    first.put("a", "from first")
+    second.put("b", "from second")
+    assert second.get("a") == "from first"
+    assert first.get("b") == "from second"
+    assert first.stats()["readable_pages"] == 2
+
+
+def test_newest_version_wins_across_shards(tmp_path):
+    first, second = open_shards(tmp_path)
+    first.put("k", "old")
+    second.put("k", "new")
+    assert first.get("k") == "new"
+
+    assert first.delete("k")
+    assert first.get("k") is None
+    assert second.get("k") is None
+    assert not second.delete("missing")
+
+
+def test_reader_follows_rollover_and_compaction(tmp_path):
+    first, second = open_shards(tmp_path, segment_bytes=512, compact_ratio=0.9)
+    for i in range(20):
+        first.put(f"k{i}", "x" * 100)
+    for i in range(15):
+        first.put(f"k{i}", "y" * 100)
+    assert second.get("k3") == "y" * 100
+    assert first.compact()["segments_compacted"]
+    assert second.get("k3") == "y" * 100
+    assert second.get("k19") == "x" * 100
+
+
+def test_reader_tolerates_torn_tail(tmp_path):
+    first, second = open_shards(tmp_path)
+    first.put("a", "value")
+    first.close()
+    # Crash mid-write
+    with open(os.path.join(first.writer.directory, "00000001.seg"), "ab") as f:
+        f.write(b"OSA1\x00torn")
+    assert second.get("a") == "value"
+
+    restarted = page_archive.PageArchive(first.writer.directory)
+    restarted.open()
+    restarted.put("b", "after restart")
+    assert second.get("a") == "value"
+    assert second.get("b") == "after restart"
+
+
+def test_process_without_a_free_shard_runs_without_archive(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(page_archive, "ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(page_archive, "ARCHIVE_SHARDS", 1)
+    first = page_archive.create_archive()
+    assert first is not None
+    # flock is per open file description, so a second open in this process still conflicts
+    assert page_archive.create_archive() is None
+    assert "Raise ARCHIVE_SHARDS" in caplog.text
+    first.close()
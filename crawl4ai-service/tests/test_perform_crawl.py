@@ -0,0 +1,78 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("crawl4ai")
+
+import main  # noqa: E402
+import readiness  # noqa: E402
+
+SETTLED_HTML = '<html data-oss-ready="1500;1200;quiet"><body><h1>Title</h1><p>Body text</p></body></html>'
+
+
+class FakeCrawler:
+    def __init__(self):
+        self.configs = []
+
+    async def arun(self, url, config):
+        self.configs.append(config)
+        return SimpleNamespace(
+            success=True,
+            error_message=None,
+            html=SETTLED_HTML,
+            cleaned_html=SETTLED_HTML,
+            markdown="# Title\n\nBody text",
+            links={"internal": [], "external": []},
+            media={},
+            metadata={"title": "Title"},
+            screenshot=None,
+        )
+
+
+class FakeBrowserPool:
+    def __init__(self):
+        self.page = FakeCrawler()
+
+    @asynccontextmanager
+    async def crawler(self):
+        yield self.page
+
+    @staticmethod
+    def alive(crawler):
+        return True
+
+
+class InlinePool:
+    async def run(self, fn, *args):
+        return fn(*args)
+
+
+@pytest.fixture
+def crawl_env(monkeypatch):
+    pool = FakeBrowserPool()
+    monkeypatch.setattr(main, "browser_pool", pool)
+    monkeypatch.setattr(main, "postprocess_pool", InlinePool())
+    monkeypatch.setattr(main, "redis_client", None)
+    monkeypatch.setattr(main, "archive", None)
+    monkeypatch.setattr(main, "ADAPTIVE_READINESS", True)
+    monkeypatch.setattr(readiness, "_local_stats", {})
+    return pool
+
+
+def test_adaptive_crawl_waits_for_the_page_to_settle(crawl_env):
+    request = main.CrawlRequest(url="https://adaptive.example/page")
+    response = asyncio.run(main.perform_crawl(request))
+
+    assert response.markdown.startswith("# Title")
+    assert crawl_env.page.configs[0].wait_for.startswith("js:")
+    assert readiness._local_stats["adaptive.example"]["samples"] == 1
+
+
+def test_load_readiness_skips_the_wait(crawl_env):
+    request = main.CrawlRequest(url="https://load.example/page", readiness="load")
+    asyncio.run(main.perform_crawl(request))
+
+    assert not crawl_env.page.configs[0].wait_for
+    assert "load.example" not in readiness._local_stats
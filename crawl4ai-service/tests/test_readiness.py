@@ -0,0 +1,32 @@
+import asyncio
+
+import readiness
+
+
+def crawl(host, settle_ms=None):
+    """Plan a crawl, then observe it settling after `settle_ms` or hitting its cap"""
+    async def run():
+        plan = await readiness.plan(None, host, 30)
+        if settle_ms is None or settle_ms >= plan["cap_ms"]:
+            marker = f'<html data-oss-ready="{plan["cap_ms"]};{plan["cap_ms"]};cap">'
+        else:
+            marker = f'<html data-oss-ready="{settle_ms};{settle_ms};quiet">'
+        await readiness.observe(None, host, marker, plan["learned"])
+        return plan
+
+    return asyncio.run(run())
+
+
+def test_host_that_never_settles_gets_a_short_cap():
+    plans = [crawl("never-quiet.example") for _ in range(5)]
+    assert plans[0]["cap_ms"] == readiness.MAX_WAIT_MS
+    assert plans[-1]["cap_ms"] == readiness.MIN_CAP_MS
+    assert not plans[-1]["learned"]
+
+
+def test_short_capped_host_recovers_once_it_settles():
+    for _ in range(5):
+        crawl("recovering.example")
+    plans = [crawl("recovering.example", settle_ms=800) for _ in range(12)]
+    assert plans[-1]["learned"]
+    assert readiness._local_stats["recovering.example"]["cap_rate"] < readiness.CAPPED_RATE
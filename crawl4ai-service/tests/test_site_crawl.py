@@ -0,0 +1,44 @@
+import asyncio
+
+import site_crawl
+
+
+def run_crawl(pages, seed="https://example.com/docs/", max_depth=2, max_pages=10, concurrency=2):
+    async def crawl_page(url):
+        if url not in pages:
+            raise RuntimeError(f"not found: {url}")
+        return {"links": pages[url]}
+
+    async def collect():
+        scope = site_crawl.SiteScope(seed)
+        return [entry async for entry in site_crawl.crawl_site(seed, crawl_page, scope, max_depth, max_pages, concurrency)]
+
+    return asyncio.run(asyncio.wait_for(collect(), timeout=5))
+
+
+def test_malformed_link_is_skipped():
+    pages = {
+        "https://example.com/docs/": ["https://example.com:abc/docs/x", "/docs/a", "http://[::1/docs/b"],
+        "https://example.com/docs/a": [],
+    }
+    entries = run_crawl(pages)
+    assert sorted(e["url"] for e in entries) == ["https://example.com/docs/", "https://example.com/docs/a"]
+    assert all("result" in e for e in entries)
+
+
+def test_failed_page_still_ends_the_stream():
+    pages = {"https://example.com/docs/": ["/docs/missing"]}
+    entries = run_crawl(pages)
+    assert [e["url"] for e in entries if "error" in e] == ["https://example.com/docs/missing"]
+
+
+def test_page_budget_and_scope():
+    pages = {
+        "https://example.com/docs/": ["/docs/a", "/docs/b", "/other/c", "/docs/file.pdf"],
+        "https://example.com/docs/a": ["/docs/b", "/docs/d"],
+        "https://example.com/docs/b": [],
+    }
+    entries = run_crawl(pages, max_pages=3)
+    assert sorted(e["url"] for e in entries) == [
+        "https://example.com/docs/", "https://example.com/docs/a", "https://example.com/docs/b",
+    ]
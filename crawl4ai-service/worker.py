@@ -0,0 +1,67 @@
+"""
+Crawl4AI Worker - consumes crawl jobs from the Redis Streams queue
+
+Run alongside an API tier started with CRAWL_MODE=queue:
+
+    python worker.py
+
+Each worker runs WORKER_CONCURRENCY crawls at a time and writes results to
+the same cache the API reads from, so browser capacity scales independently
+of the API pods.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+import crawl_queue
+import main
+
+logger = logging.getLogger("crawl4ai-worker")
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
+
+
+async def handle_job(job_id: str, request: Dict[str, Any], deadline: Optional[float]):
+    """
+    Run one queued crawl; perform_crawl caches the result under the job's key.
+    Page failures and deadline rejections fail the job at once; browser
+    crashes and internal errors are left to the queue's retries.
+    """
+    try:
+        response = await main.perform_crawl(main.CrawlRequest(**request), deadline)
+    except main.PageCrawlError as e:
+        raise crawl_queue.JobFailed(e.detail, e.status_code)
+    except HTTPException as e:
+        if e.status_code < 500 or e.status_code == 504:
+            raise crawl_queue.JobFailed(e.detail, e.status_code)
+        raise
+    if response.partial:
+        # Cut short by the caller's deadline and not cached: hand it back directly
+        await crawl_queue.set_partial_result(main.redis_client, job_id, response.model_dump_json())
+
+
+async def run_worker():
+    # Workers always crawl, so the browser is launched before taking jobs
+    await main.startup_event(prewarm=main.BROWSER_PREWARM)
+    if not main.redis_client:
+        raise SystemExit("Redis is required to run a crawl worker")
+
+    worker = crawl_queue.CrawlWorker(main.redis_client, handle_job, concurrency=WORKER_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        await main.shutdown_event()
+        logger.info("Crawl worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -65,12 +65,15 @@ echo "Step 4: Creating ConfigMaps..."
 kubectl apply -f ${K8S_DIR}/configmaps/app-config.yaml
 kubectl apply -f ${K8S_DIR}/configmaps/searxng-config.yaml
 kubectl apply -f ${K8S_DIR}/configmaps/searxng-limiter.yaml
+kubectl apply -f ${K8S_DIR}/storage/screenshots-pvc.yaml
+kubectl apply -f ${K8S_DIR}/storage/archive-pvc.yaml
 
 # Step 5: Create Services
 echo ""
 echo "Step 5: Creating Services..."
 kubectl apply -f ${K8S_DIR}/services/searxng.yaml
 kubectl apply -f ${K8S_DIR}/services/crawl4ai.yaml
+kubectl apply -f ${K8S_DIR}/services/crawl4ai-headless.yaml
 kubectl apply -f ${K8S_DIR}/services/mcp-server-fastmcp.yaml
 
 # Step 6: Create Deployments
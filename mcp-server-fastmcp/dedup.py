@@ -0,0 +1,98 @@
+"""
+Near-duplicate detection for crawled pages, shared by crawl4ai-service and
+mcp-server-fastmcp.
+
+Mirrors, syndicated articles and URL variants produce near-identical
+markdown, and each used to be cached in full. crawl4ai now computes a 64-bit
+SimHash of every page's markdown at crawl time (over word 3-shingles, with
+URLs removed so mirrors on other hosts still match). A page within
+MAX_DISTANCE bits of an already cached page is stored without its body:
+
+- its entry keeps its own URL, links, metadata and extraction results, and a
+  `duplicate_of` reference ({"url", "job_id", "distance", "simhash"}) to the
+  original, whose markdown, HTML and chunk list serve both;
+- readers rebuild the full payload with `hydrate()`; if the original has
+  expired or was re-crawled into different content (its SimHash no longer
+  matches the reference) the entry counts as a cache miss.
+
+Candidates are found through BANDS bands of the fingerprint (16 bits each):
+two fingerprints at most BANDS - 1 bits apart agree on at least one band, so
+a lookup is one hash read per band. This file is duplicated in each service
+directory; keep the copies in sync - `make check-shared` verifies they match.
+"""
+
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+BITS = 64
+BANDS = 4
+MAX_DISTANCE = 3
+# Pages shorter than this (in words) are never treated as duplicates
+MIN_TOKENS = 50
+# Shingles with the smallest hashes are used, so near-duplicates sample alike
+MAX_FEATURES = 2048
+
+# Fields a duplicate's entry leaves to its original
+BODY_FIELDS = ("markdown", "html", "chunks")
+
+_URL_RE = re.compile(r"\(?\b(?:https?://|www\.)\S+")
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def fingerprint(markdown: str) -> Optional[str]:
+    """64-bit SimHash of the page text as 16 hex digits, or None for short pages"""
+    tokens = _TOKEN_RE.findall(_URL_RE.sub(" ", (markdown or "").lower()))
+    if len(tokens) < MIN_TOKENS:
+        return None
+    shingles = {" ".join(tokens[i:i + 3]) for i in range(len(tokens) - 2)}
+    hashes = sorted(_hash64(s) for s in shingles)[:MAX_FEATURES]
+    half = len(hashes) / 2
+    value = 0
+    for bit in range(BITS):
+        if sum((h >> bit) & 1 for h in hashes) > half:
+            value |= 1 << bit
+    return f"{value:016x}"
+
+
+def distance(a: str, b: str) -> int:
+    """Hamming distance between two fingerprints"""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def bands(simhash: str) -> List[Tuple[int, str]]:
+    """(band index, band value) pairs under which a fingerprint is indexed"""
+    width = len(simhash) // BANDS
+    return [(i, simhash[i * width:(i + 1) * width]) for i in range(BANDS)]
+
+
+def is_duplicate_entry(entry: Dict[str, Any]) -> bool:
+    """Whether a cached entry is a near-duplicate stored without its body"""
+    return bool(entry.get("duplicate_of")) and "markdown" not in entry
+
+
+def strip_body(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The cached form of a near-duplicate: everything but the shared body"""
+    return {k: v for k, v in payload.items() if k not in BODY_FIELDS}
+
+
+def can_reference(original: Optional[Dict[str, Any]], simhash: Optional[str]) -> bool:
+    """
+    Whether a cached entry can serve as the original of a reference made to
+    `simhash`: it must exist, hold its own body and still have that fingerprint.
+    """
+    return bool(original) and not is_duplicate_entry(original) and original.get("simhash") == simhash
+
+
+def hydrate(entry: Dict[str, Any], original: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Complete a near-duplicate's entry with its original's body. Returns None
+    if the original is gone, is itself a duplicate, or has changed since.
+    """
+    if not can_reference(original, entry["duplicate_of"].get("simhash")):
+        return None
+    return {**entry, **{field: original.get(field) for field in BODY_FIELDS}}
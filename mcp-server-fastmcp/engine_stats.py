@@ -0,0 +1,175 @@
+"""
+Per-engine latency/contribution tracking and adaptive engine selection.
+
+When web_search is called without an explicit engine list, SearXNG queries
+every configured engine and the slowest one sets our latency. EngineSelector
+learns, per category, how often each engine contributes results that make the
+top-k and how often it fails, and picks a small "fast" engine set for default
+queries. The set is refreshed periodically, and every `explore_every`-th
+query still goes to all engines so stats for excluded engines stay current.
+
+Engines listed in `unresponsive_engines` (timeouts included) count as
+failures, which keeps engines that routinely time out out of the set. Per-engine
+latency comes from the `total_<n>_<engine>` entries of SearXNG's
+Server-Timing header. The whole-request latency is set by the slowest engine,
+so it is never charged to individual engines. When every candidate has
+timings, engines are ranked by top-k results per second; otherwise (e.g. a
+proxy stripped the header) the set is chosen by contribution alone.
+"""
+
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+# One engine's total time in a Server-Timing header: total_<index>_<engine>;dur=<ms>
+_ENGINE_TIMING_RE = re.compile(r"total_\d+_([^;,]+);dur=([0-9.]+)")
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Per-engine totals (seconds) from a SearXNG Server-Timing header."""
+    return {engine.strip(): float(ms) / 1000 for engine, ms in _ENGINE_TIMING_RE.findall(header or "")}
+
+
+class EngineRecord:
+    """Running statistics for one engine in one category."""
+
+    __slots__ = ("queries", "contributions", "failures", "latency", "last_seen")
+
+    def __init__(self):
+        self.queries = 0
+        self.contributions = 0
+        self.failures = 0
+        self.latency: Optional[float] = None
+        self.last_seen = 0.0
+
+    def observe(self, latency: Optional[float], contributed: int, failed: bool, alpha: float):
+        self.queries += 1
+        self.contributions += contributed
+        self.failures += int(failed)
+        if latency is not None:
+            self.latency = latency if self.latency is None else alpha * latency + (1 - alpha) * self.latency
+        self.last_seen = time.time()
+
+    @property
+    def contribution_rate(self) -> float:
+        """Average number of top-k results contributed per query."""
+        return self.contributions / self.queries if self.queries else 0.0
+
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.queries if self.queries else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "queries": self.queries,
+            "contribution_rate": round(self.contribution_rate, 3),
+            "failure_rate": round(self.failure_rate, 3),
+            "latency_ms": int(self.latency * 1000) if self.latency is not None else None,
+        }
+
+
+class EngineSelector:
+    """Learns engine quality per category and chooses a fast default set."""
+
+    def __init__(
+        self,
+        max_engines: int = 4,
+        min_queries: int = 5,
+        min_contribution: float = 0.5,
+        max_failure_rate: float = 0.3,
+        refresh_seconds: float = 300.0,
+        explore_every: int = 10,
+        alpha: float = 0.2,
+    ):
+        self.max_engines = max_engines
+        self.min_queries = min_queries
+        self.min_contribution = min_contribution
+        self.max_failure_rate = max_failure_rate
+        self.refresh_seconds = refresh_seconds
+        self.explore_every = explore_every
+        self.alpha = alpha
+        self._stats: Dict[str, Dict[str, EngineRecord]] = {}
+        self._fast_sets: Dict[str, tuple] = {}  # category -> (computed_at, engines)
+        self._query_count = 0
+        self._lock = threading.Lock()
+
+    def select(self, category: str) -> Optional[List[str]]:
+        """
+        Engines to use for a default query, or None to query all engines
+        (not enough data yet, or an exploration query).
+        """
+        with self._lock:
+            self._query_count += 1
+            if self.explore_every and self._query_count % self.explore_every == 0:
+                return None
+            computed_at, engines = self._fast_sets.get(category, (0.0, None))
+            if time.time() - computed_at >= self.refresh_seconds:
+                engines = self._compute_fast_set(category)
+                self._fast_sets[category] = (time.time(), engines)
+            return list(engines) if engines else None
+
+    def _compute_fast_set(self, category: str) -> Optional[List[str]]:
+        candidates = [
+            (name, record)
+            for name, record in self._stats.get(category, {}).items()
+            if record.queries >= self.min_queries
+            and record.contribution_rate >= self.min_contribution
+            and record.failure_rate <= self.max_failure_rate
+        ]
+        if not candidates:
+            return None
+        if all(record.latency is not None for _, record in candidates):
+            # Most top-k results per second of the engine's own latency first
+            candidates.sort(key=lambda item: item[1].contribution_rate / max(item[1].latency, 0.001), reverse=True)
+        else:
+            candidates.sort(key=lambda item: (item[1].contribution_rate, -item[1].failure_rate), reverse=True)
+        return sorted(name for name, _ in candidates[:self.max_engines])
+
+    def record(
+        self,
+        category: str,
+        queried: Optional[List[str]],
+        data: Dict,
+        timings: Dict[str, float],
+        top_k: int,
+    ):
+        """
+        Record one SearXNG response. `queried` is None when all engines were
+        used; `timings` maps engines to their own latency (see
+        parse_server_timing) and may be empty.
+        """
+        contributions: Dict[str, int] = {}
+        for result in data.get("results", [])[:top_k]:
+            for engine in result.get("engines") or [result.get("engine")]:
+                if engine:
+                    contributions[engine] = contributions.get(engine, 0) + 1
+
+        unresponsive = set()
+        for entry in data.get("unresponsive_engines", []) or []:
+            name = entry[0] if isinstance(entry, (list, tuple)) and entry else entry
+            if isinstance(name, str):
+                unresponsive.add(name)
+
+        # Engines that returned nothing at all are invisible unless queried explicitly
+        engines = set(queried or []) | set(contributions) | unresponsive
+        for entry in data.get("results", []):
+            engines.update(e for e in (entry.get("engines") or []) if e)
+
+        with self._lock:
+            stats = self._stats.setdefault(category, {})
+            for engine in engines:
+                stats.setdefault(engine, EngineRecord()).observe(
+                    timings.get(engine), contributions.get(engine, 0), engine in unresponsive, self.alpha
+                )
+
+    def snapshot(self) -> Dict:
+        """Current per-category stats and fast sets, for health reporting."""
+        with self._lock:
+            return {
+                category: {
+                    "fast_set": (self._fast_sets.get(category) or (0, None))[1],
+                    "engines": {name: record.to_dict() for name, record in sorted(records.items())},
+                }
+                for category, records in self._stats.items()
+            }
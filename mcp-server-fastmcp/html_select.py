@@ -0,0 +1,80 @@
+"""
+CSS-selector extraction over cached HTML.
+
+Runs selectors against the cleaned HTML that crawl4ai-service already caches,
+so targeted extraction is a parse instead of a browser render. Uses the
+C-backed selectolax (lexbor) parser, falling back to lxml + cssselect.
+"""
+
+from typing import Dict, List, Optional
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # pragma: no cover - depends on installed packages
+    LexborHTMLParser = None
+
+# Cap per-selector matches so a broad selector can't blow up the response
+MAX_MATCHES = 100
+
+
+def _select_selectolax(html: str, selectors: List[str], attribute: Optional[str], limit: int) -> Dict:
+    tree = LexborHTMLParser(html)
+    results = {}
+    for selector in selectors:
+        try:
+            nodes = tree.css(selector)
+        except Exception as e:
+            results[selector] = {"error": f"Invalid selector: {e}"}
+            continue
+        if attribute:
+            values = [node.attributes.get(attribute) for node in nodes]
+            matches = [v for v in values if v is not None]
+        else:
+            matches = [
+                {"text": node.text(separator=" ", strip=True), "html": node.html}
+                for node in nodes
+            ]
+        results[selector] = {"count": len(matches), "matches": matches[:limit]}
+    return results
+
+
+def _select_lxml(html: str, selectors: List[str], attribute: Optional[str], limit: int) -> Dict:
+    import lxml.html
+
+    root = lxml.html.fromstring(html)
+    results = {}
+    for selector in selectors:
+        try:
+            nodes = root.cssselect(selector)
+        except Exception as e:
+            results[selector] = {"error": f"Invalid selector: {e}"}
+            continue
+        if attribute:
+            values = [node.get(attribute) for node in nodes]
+            matches = [v for v in values if v is not None]
+        else:
+            matches = [
+                {
+                    "text": " ".join(node.text_content().split()),
+                    "html": lxml.html.tostring(node, encoding="unicode"),
+                }
+                for node in nodes
+            ]
+        results[selector] = {"count": len(matches), "matches": matches[:limit]}
+    return results
+
+
+def select(html: str, selectors: List[str], attribute: Optional[str] = None, limit: int = MAX_MATCHES) -> Dict:
+    """
+    Apply CSS selectors to an HTML document.
+
+    Returns a dict keyed by selector with the match count and up to `limit`
+    matches: text and outer HTML per element, or the attribute values when
+    `attribute` is given. Invalid selectors report an error entry instead of
+    failing the whole call.
+    """
+    if not html:
+        return {selector: {"count": 0, "matches": []} for selector in selectors}
+    if LexborHTMLParser is not None:
+        return _select_selectolax(html, selectors, attribute, limit)
+    return _select_lxml(html, selectors, attribute, limit)
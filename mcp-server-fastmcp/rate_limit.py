@@ -0,0 +1,248 @@
+"""
+Per-client rate limiting and priority-aware load shedding for MCP tools.
+
+Rate limiting: every client has a token bucket (`capacity` tokens, refilled
+at `refill_per_second`). Tool calls are charged by cost - search and cached
+reads are cheap, fresh crawls are expensive - so one agent looping web_crawl
+drains its own bucket instead of crawl4ai's capacity for everyone. Buckets
+live in Redis and are updated by a Lua script, so all replicas share them and
+a check-and-take is a single round trip; the Redis clock is used so replica
+clock skew doesn't matter. Without Redis each process keeps its own buckets.
+The same script keeps per-client daily usage counters (calls, tokens,
+rejections) for accounting.
+
+Load shedding: calls that put work on the backends hold a slot in a
+`LoadShedder` while they run. As in-flight work grows, low priority calls
+(site crawls) are refused first, then normal ones (fresh crawls), and high
+priority calls (searches) only at full capacity. Once the shedder is
+contended, no client may hold more than its fair share of the slots, so the
+remaining capacity is split between the clients that are active.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+
+class AdmissionError(Exception):
+    """A tool call was refused; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(AdmissionError):
+    """The client's token bucket doesn't hold enough tokens for the call."""
+
+
+class OverloadedError(AdmissionError):
+    """The backends are saturated and the call's priority is being shed."""
+
+
+# KEYS[1] bucket hash, KEYS[2] usage hash; ARGV capacity, rate, cost, usage TTL
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+redis.call('HINCRBY', KEYS[2], 'calls', 1)
+if allowed == 1 then
+  redis.call('HINCRBYFLOAT', KEYS[2], 'tokens', cost)
+else
+  redis.call('HINCRBY', KEYS[2], 'rejected', 1)
+end
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[4]))
+return {allowed, tostring(tokens)}
+"""
+
+USAGE_TTL_SECONDS = 8 * 86400
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets shared through Redis, with a local fallback."""
+
+    def __init__(
+        self,
+        get_redis: Callable[[], Optional[object]],
+        capacity: float = 60.0,
+        refill_per_second: float = 1.0,
+    ):
+        self.get_redis = get_redis
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._script = None
+        self._local: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @staticmethod
+    def bucket_key(client: str) -> str:
+        # Hash tag keeps a client's bucket and usage keys in one cluster slot
+        return f"ratelimit:{{{client}}}"
+
+    @staticmethod
+    def usage_key(client: str, day: Optional[str] = None) -> str:
+        day = day or time.strftime("%Y%m%d", time.gmtime())
+        return f"ratelimit:{{{client}}}:usage:{day}"
+
+    def _take_redis(self, client: str, cost: float) -> Optional[Tuple[bool, float]]:
+        r = self.get_redis()
+        if r is None:
+            return None
+        try:
+            if self._script is None:
+                self._script = r.register_script(_TAKE_SCRIPT)
+            allowed, tokens = self._script(
+                keys=[self.bucket_key(client), self.usage_key(client)],
+                args=[self.capacity, self.refill_per_second, cost, USAGE_TTL_SECONDS],
+            )
+            return bool(int(allowed)), float(tokens)
+        except Exception:
+            return None
+
+    def _take_local(self, client: str, cost: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._local.get(client, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - ts) * self.refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._local[client] = (tokens, now)
+            if len(self._local) > 10000:
+                # Drop buckets that have refilled completely; they hold no state
+                full = [c for c, (t, s) in self._local.items()
+                        if t + (now - s) * self.refill_per_second >= self.capacity]
+                for c in full:
+                    del self._local[c]
+        return allowed, tokens
+
+    def take(self, client: str, cost: float):
+        """Charge `cost` tokens to `client`, raising RateLimitedError if the bucket is short"""
+        if cost <= 0:
+            return
+        # A call costing more than the bucket holds could never pass
+        cost = min(cost, self.capacity)
+        result = self._take_redis(client, cost)
+        allowed, tokens = result if result is not None else self._take_local(client, cost)
+        if not allowed:
+            self.rejected += 1
+            retry_after = (cost - tokens) / self.refill_per_second if self.refill_per_second > 0 else 60.0
+            raise RateLimitedError(
+                f"Rate limit exceeded for client {client}: call costs {cost:g} tokens, {tokens:.1f} available",
+                retry_after=round(retry_after, 1),
+            )
+
+    def usage(self, client: str, day: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """Usage counters of `client` for a UTC day (YYYYMMDD, default today); None without Redis"""
+        r = self.get_redis()
+        if r is None:
+            return None
+        try:
+            return r.hgetall(self.usage_key(client, day))
+        except Exception:
+            return None
+
+    def snapshot(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "refill_per_second": self.refill_per_second,
+            "rejected": self.rejected,
+            "local_buckets": len(self._local),
+        }
+
+
+class LoadShedder:
+    """Bounded in-flight backend work with priority-aware, fair-share admission."""
+
+    HIGH, NORMAL, LOW = "high", "normal", "low"
+
+    def __init__(
+        self,
+        capacity: int = 32,
+        shed_at: Optional[Dict[str, float]] = None,
+        saturated: Optional[Callable[[], bool]] = None,
+    ):
+        self.capacity = max(1, capacity)
+        # Load (in-flight / capacity) at which each priority starts being refused
+        self.shed_at = shed_at or {self.LOW: 0.5, self.NORMAL: 0.8, self.HIGH: 1.0}
+        # Extra signal, e.g. an open circuit breaker: treat the backends as loaded
+        self.saturated = saturated
+        self._inflight: Dict[str, int] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self.shed: Dict[str, int] = {self.HIGH: 0, self.NORMAL: 0, self.LOW: 0}
+
+    def _load(self) -> float:
+        load = self._total / self.capacity
+        if self.saturated is not None and self.saturated():
+            load = max(load, self.shed_at[self.NORMAL])
+        return load
+
+    def try_acquire(self, client: str, priority: str = NORMAL) -> Optional[str]:
+        """Take a slot; returns None on success or the reason the call is shed"""
+        with self._lock:
+            load = self._load()
+            if load >= self.shed_at.get(priority, 1.0):
+                reason = f"backends saturated ({self._total}/{self.capacity} in flight), shedding {priority} priority"
+            elif load >= self.shed_at[self.LOW]:
+                # Contended: split the slots between the clients that are active
+                active = len(self._inflight) + (0 if client in self._inflight else 1)
+                fair_share = max(1, math.ceil(self.capacity / active))
+                if self._inflight.get(client, 0) >= fair_share:
+                    reason = f"client {client} holds its fair share ({fair_share}) of backend capacity"
+                else:
+                    reason = None
+            else:
+                reason = None
+            if reason:
+                self.shed[priority] = self.shed.get(priority, 0) + 1
+                return reason
+            self._inflight[client] = self._inflight.get(client, 0) + 1
+            self._total += 1
+            return None
+
+    def release(self, client: str):
+        with self._lock:
+            count = self._inflight.get(client, 0) - 1
+            if count > 0:
+                self._inflight[client] = count
+            else:
+                self._inflight.pop(client, None)
+            self._total = max(0, self._total - 1)
+
+    @contextmanager
+    def slot(self, client: str, priority: str = NORMAL):
+        """Hold a slot for the duration of the block, raising OverloadedError if shed"""
+        reason = self.try_acquire(client, priority)
+        if reason:
+            raise OverloadedError(reason, retry_after=2.0 if priority == self.HIGH else 10.0)
+        try:
+            yield
+        finally:
+            self.release(client)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_flight": self._total,
+                "clients": len(self._inflight),
+                "load": round(self._load(), 3),
+                "shed": dict(self.shed),
+            }
@@ -0,0 +1,323 @@
+"""
+Resilient upstream calls: circuit breakers, adaptive timeouts and hedging.
+
+Each upstream (SearXNG, crawl4ai) gets an `Upstream` that tracks recent
+latencies, derives its timeout from the observed p99 instead of a flat 30s,
+fails fast while its circuit breaker is open, and can hedge idempotent
+requests by sending a second attempt to another replica once the first has
+taken longer than the observed p95. With a `ConsistentHashRouter` requests
+that carry a routing key go to the replica owning that key (see routing.py).
+
+Callers may pass a deadline (a `time.monotonic()` instant) for the whole tool
+call. The request timeout is clamped to the time left, the remaining budget is
+sent to the upstream in the X-Request-Deadline-Ms header so it can drop work
+nobody will wait for, and no attempt is made once the deadline has passed.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+from routing import ConsistentHashRouter
+
+# Remaining time budget in milliseconds, relative so clock skew doesn't matter
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+class DeadlineExceededError(httpx.TimeoutException):
+    """Raised instead of calling an upstream after the caller's deadline has passed."""
+
+
+class LatencyTracker:
+    """Sliding window of recent successful request latencies (seconds)."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_seconds`; then lets a single probe through (half-open) and closes
+    again if it succeeds. A probe that ends without an outcome (the caller's
+    deadline ran out, an unexpected error) is given up with `release()` so
+    the next call can probe instead of the breaker staying half-open.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_thread: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_thread = threading.get_ident()
+                return True
+            # Open, or half-open with the probe already in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+            self._probe_thread = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_thread = None
+
+    def release(self):
+        """End a call on this thread; a probe it held that recorded nothing reopens the breaker."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probe_thread == threading.get_ident():
+                # _opened_at is unchanged, so the next allow() probes right away
+                self.state = self.OPEN
+                self._probe_thread = None
+
+
+class Upstream:
+    """
+    An upstream service reachable at one or more replica base URLs.
+
+    Until `min_samples` latencies have been observed the timeout is
+    `default_timeout`; afterwards it is p99 * `timeout_multiplier`, clamped to
+    [`min_timeout`, `max_timeout`]. Responses whose status is in
+    `failure_statuses` (default: any 5xx) count against the circuit breaker.
+    With a `router`, the replica set is the router's and requests given a
+    `route_key` are sent by consistent hash; others still go round-robin.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_urls: List[str],
+        client: httpx.Client,
+        executor: ThreadPoolExecutor,
+        default_timeout: float = 30.0,
+        min_timeout: float = 2.0,
+        max_timeout: float = 30.0,
+        timeout_multiplier: float = 2.0,
+        min_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        failure_statuses: Optional[Set[int]] = None,
+        router: Optional[ConsistentHashRouter] = None,
+    ):
+        self.name = name
+        self.base_urls = [u.rstrip("/") for u in base_urls if u]
+        self.client = client
+        self.executor = executor
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.failure_statuses = failure_statuses
+        self.router = router
+        self.latency = LatencyTracker()
+        self._next_replica = 0
+        self._lock = threading.Lock()
+
+    def timeout(self, floor: Optional[float] = None) -> float:
+        """Current adaptive timeout; `floor` raises it for known-slow requests."""
+        p99 = self.latency.percentile(99)
+        if p99 is None or len(self.latency) < self.min_samples:
+            timeout = self.default_timeout
+        else:
+            timeout = min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+        return max(timeout, floor) if floor else timeout
+
+    def hedge_delay(self) -> Optional[float]:
+        """Delay before hedging: the observed p95, once there is enough data."""
+        if len(self.latency) < self.min_samples:
+            return None
+        return self.latency.percentile(95)
+
+    @property
+    def replicas(self) -> List[str]:
+        return self.router.members if self.router is not None else self.base_urls
+
+    def _targets(self, route_key: Optional[str]) -> List[str]:
+        """Replicas to try, in order: the first is the primary, the next the hedge/fallback"""
+        if self.router is not None and route_key:
+            targets = self.router.route(route_key)
+            if targets:
+                return targets
+        replicas = self.replicas
+        with self._lock:
+            index = self._next_replica % len(replicas)
+            self._next_replica = index + 1
+        return replicas[index:] + replicas[:index]
+
+    def _send(
+        self, base_url: str, method: str, path: str, timeout: float, deadline: Optional[float], **kwargs
+    ) -> httpx.Response:
+        started = time.monotonic()
+        clamped = False
+        if deadline is not None:
+            remaining = deadline - started
+            if remaining <= 0:
+                raise DeadlineExceededError(f"Deadline exceeded before calling {self.name}")
+            clamped = remaining < timeout
+            timeout = min(timeout, remaining)
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), DEADLINE_HEADER: str(int(remaining * 1000))}
+        if self.router is not None:
+            self.router.acquire(base_url)
+        try:
+            response = self.client.request(method, f"{base_url}{path}", timeout=timeout, **kwargs)
+        except httpx.TimeoutException as e:
+            if clamped:
+                # Timed out on the caller's budget, not the upstream's timeout
+                raise DeadlineExceededError(f"Deadline exceeded while calling {self.name}") from e
+            self.breaker.record_failure()
+            raise
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            if self.router is not None and isinstance(e, httpx.ConnectError):
+                self.router.eject(base_url)
+            raise
+        finally:
+            if self.router is not None:
+                self.router.release(base_url)
+        if self._is_failure(response):
+            self.breaker.record_failure()
+        else:
+            # The upstream answered; a 4xx means it rejected the request itself
+            self.breaker.record_success()
+            self.latency.record(time.monotonic() - started)
+        return response
+
+    def _is_failure(self, response: httpx.Response) -> bool:
+        if self.failure_statuses is None:
+            return response.status_code >= 500
+        return response.status_code in self.failure_statuses
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        hedge: bool = False,
+        timeout_floor: Optional[float] = None,
+        deadline: Optional[float] = None,
+        route_key: Optional[str] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """
+        Send a request, failing fast if the circuit is open or `deadline`
+        (a time.monotonic() instant) has passed.
+
+        With `hedge=True` (idempotent requests only) a second attempt goes to
+        the next replica after the p95 delay; the first response wins and the
+        other attempt is cancelled, or discarded if it already started. With
+        a single replica there is nothing to hedge to and the request is sent
+        once.
+
+        With a router, `route_key` (e.g. the target's canonical host) picks
+        the replica; a replica refusing the connection is ejected and the
+        request goes to the next one on the ring.
+        """
+        if deadline is not None and deadline <= time.monotonic():
+            raise DeadlineExceededError(f"Deadline exceeded before calling {self.name}")
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit breaker is open; failing fast")
+
+        try:
+            timeout = self.timeout(timeout_floor)
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+            targets = self._targets(route_key)
+            # A hedge to the same single replica only doubles its load
+            delay = self.hedge_delay() if hedge and len(targets) >= 2 else None
+            if delay is None or delay >= timeout:
+                try:
+                    return self._send(targets[0], method, path, timeout, deadline, **kwargs)
+                except httpx.ConnectError:
+                    # The request never reached the replica, so another one can take it
+                    if self.router is None or len(targets) < 2:
+                        raise
+                    return self._send(targets[1], method, path, timeout, deadline, **kwargs)
+
+            primary = self.executor.submit(self._send, targets[0], method, path, timeout, deadline, **kwargs)
+            done, _ = wait([primary], timeout=delay)
+            if done:
+                return primary.result()
+
+            secondary = self.executor.submit(self._send, targets[1], method, path, timeout - delay, deadline, **kwargs)
+            pending = {primary, secondary}
+            fallback: Optional[Future] = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None and not self._is_failure(future.result()):
+                        for loser in pending:
+                            _cancel(loser)
+                        return future.result()
+                    fallback = future
+            # Both attempts failed: surface the last outcome
+            return fallback.result()
+        finally:
+            # A probe that recorded no outcome must not leave the breaker half-open
+            self.breaker.release()
+
+    def status(self) -> Dict:
+        """Breaker state and latency percentiles for health reporting."""
+        def ms(value: Optional[float]) -> Optional[int]:
+            return int(value * 1000) if value is not None else None
+
+        return {
+            "circuit": self.breaker.state,
+            "replicas": len(self.replicas),
+            "samples": len(self.latency),
+            "p50_ms": ms(self.latency.percentile(50)),
+            "p95_ms": ms(self.latency.percentile(95)),
+            "p99_ms": ms(self.latency.percentile(99)),
+            "timeout_ms": ms(self.timeout()),
+        }
+
+
+def _cancel(future: Future):
+    """Cancel a losing attempt; if it is already running, close its response when it lands."""
+    if not future.cancel():
+        future.add_done_callback(
+            lambda f: f.result().close() if f.exception() is None else None
+        )
@@ -0,0 +1,185 @@
+"""
+Consistent-hash routing of crawls across crawl4ai replicas.
+
+Round-robin (or the Service's random spread) sends the same URL and domain
+to a different crawl4ai pod nearly every time, so per-pod state - warm
+browser contexts, learned per-host readiness, host backoff - is rarely
+reused. `ConsistentHashRouter` maps a routing key (the canonical host, or
+the canonical URL) onto a hash ring of replicas instead:
+
+- Each replica owns `vnodes` points on the ring, so keys spread evenly and a
+  membership change only moves the keys of the replica that joined or left.
+- Bounded loads: a replica may hold at most ceil(`load_factor` * average)
+  in-flight requests; a key whose owner is full overflows to the next
+  replica on the ring, so one hot domain cannot swamp a pod.
+- Replicas that refuse connections are ejected for `eject_seconds`; their
+  keys move to the next replica on the ring until they come back.
+- With `discovery_host` (a headless Service name) the replica set follows
+  the addresses it resolves to, so scaling crawl4ai rebalances the ring.
+
+In-flight counts are per MCP replica; with several MCP replicas each one
+bounds its own share of the load.
+"""
+
+import bisect
+import hashlib
+import math
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+def _point(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Immutable ring of `vnodes` points per member."""
+
+    def __init__(self, members: List[str], vnodes: int = 160):
+        self.members = sorted(set(members))
+        points = sorted((_point(f"{member}#{i}"), member) for member in self.members for i in range(vnodes))
+        self._hashes = [p for p, _ in points]
+        self._owners = [m for _, m in points]
+
+    def walk(self, key: str) -> List[str]:
+        """Distinct members in ring order starting at the key's owner"""
+        if not self._hashes:
+            return []
+        start = bisect.bisect(self._hashes, _point(key))
+        seen: List[str] = []
+        for i in range(len(self._owners)):
+            owner = self._owners[(start + i) % len(self._owners)]
+            if owner not in seen:
+                seen.append(owner)
+                if len(seen) == len(self.members):
+                    break
+        return seen
+
+
+class ConsistentHashRouter:
+    """Bounded-load consistent hashing over replica base URLs."""
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        load_factor: float = 1.25,
+        vnodes: int = 160,
+        eject_seconds: float = 30.0,
+        discovery_host: Optional[str] = None,
+        discovery_port: int = 8000,
+        discovery_scheme: str = "http",
+        discovery_seconds: float = 15.0,
+    ):
+        self.load_factor = load_factor
+        self.vnodes = vnodes
+        self.eject_seconds = eject_seconds
+        self.discovery_host = discovery_host
+        self.discovery_port = discovery_port
+        self.discovery_scheme = discovery_scheme
+        self.discovery_seconds = discovery_seconds
+        self.ring = HashRing([u.rstrip("/") for u in base_urls if u], vnodes)
+        self.rebalances = 0
+        self._in_flight: Dict[str, int] = {}
+        self._routed: Dict[str, int] = {}
+        self._overflowed = 0
+        self._ejected: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._discovery_thread: Optional[threading.Thread] = None
+
+    @property
+    def members(self) -> List[str]:
+        return self.ring.members
+
+    def update_members(self, base_urls: List[str]) -> bool:
+        """Replace the replica set; returns whether it changed"""
+        members = sorted({u.rstrip("/") for u in base_urls if u})
+        if not members or members == self.ring.members:
+            return False
+        ring = HashRing(members, self.vnodes)
+        with self._lock:
+            self.ring = ring
+            self._ejected = {u: t for u, t in self._ejected.items() if u in members}
+            self.rebalances += 1
+        return True
+
+    def route(self, key: str) -> List[str]:
+        """
+        Replicas to try for `key`, best first: the first healthy replica on
+        the ring with spare capacity, then the remaining healthy ones in ring
+        order, then ejected ones as a last resort.
+        """
+        now = time.monotonic()
+        with self._lock:
+            order = self.ring.walk(key)
+            healthy = [u for u in order if self._ejected.get(u, 0) <= now]
+            ejected = [u for u in order if u not in healthy]
+            if not healthy:
+                return ejected
+            total = sum(self._in_flight.get(u, 0) for u in healthy)
+            capacity = max(1, math.ceil(self.load_factor * (total + 1) / len(healthy)))
+            chosen = next((u for u in healthy if self._in_flight.get(u, 0) < capacity), healthy[0])
+            if chosen != order[0]:
+                self._overflowed += 1
+            return [chosen] + [u for u in healthy if u != chosen] + ejected
+
+    def acquire(self, base_url: str):
+        with self._lock:
+            self._in_flight[base_url] = self._in_flight.get(base_url, 0) + 1
+            self._routed[base_url] = self._routed.get(base_url, 0) + 1
+
+    def release(self, base_url: str):
+        with self._lock:
+            self._in_flight[base_url] = max(0, self._in_flight.get(base_url, 0) - 1)
+
+    def eject(self, base_url: str):
+        """Take a replica out of rotation after a connection failure"""
+        with self._lock:
+            self._ejected[base_url] = time.monotonic() + self.eject_seconds
+
+    def discover(self) -> bool:
+        """Resolve `discovery_host` and rebuild the ring if the replica set changed"""
+        if not self.discovery_host:
+            return False
+        try:
+            infos = socket.getaddrinfo(self.discovery_host, self.discovery_port, proto=socket.IPPROTO_TCP)
+        except socket.gaierror:
+            return False
+        urls = []
+        for family, _, _, _, address in infos:
+            host = f"[{address[0]}]" if family == socket.AF_INET6 else address[0]
+            urls.append(f"{self.discovery_scheme}://{host}:{self.discovery_port}")
+        return self.update_members(urls)
+
+    def start_discovery(self):
+        """Re-resolve the discovery host every `discovery_seconds` in a daemon thread"""
+        if not self.discovery_host or self._discovery_thread is not None:
+            return
+
+        def run():
+            while True:
+                self.discover()
+                time.sleep(self.discovery_seconds)
+
+        self._discovery_thread = threading.Thread(target=run, name="crawl4ai-discovery", daemon=True)
+        self._discovery_thread.start()
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "members": len(self.ring.members),
+                "load_factor": self.load_factor,
+                "rebalances": self.rebalances,
+                "overflowed": self._overflowed,
+                "replicas": {
+                    u: {
+                        "in_flight": self._in_flight.get(u, 0),
+                        "routed": self._routed.get(u, 0),
+                        "ejected": self._ejected.get(u, 0) > now,
+                    }
+                    for u in self.ring.members
+                },
+            }
+
@@ -4,34 +4,242 @@ Simple FastMCP server exposing SearXNG and Crawl4AI tools.
 Replaces the complex TypeScript MCP server with a simple Python implementation.
 """
 
+import time
+_import_started = time.perf_counter()
+
 import os
+import re
 import json
+import hashlib
+import logging
+import ipaddress
+import secrets
+import threading
 import httpx
-from typing import Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
 from fastmcp import FastMCP
 
-# Initialize FastMCP server
-mcp = FastMCP("OSS Search Tools")
+import cache_keys
+import content_filter
+import dedup
+import html_select
+import negative_cache
+from engine_stats import EngineSelector, parse_server_timing
+from rate_limit import AdmissionError, LoadShedder, RateLimitedError, TokenBucketLimiter
+from routing import ConsistentHashRouter
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceededError, Upstream
+
+try:
+    from fastmcp.server.dependencies import get_http_headers, get_http_request
+except ImportError:  # older fastmcp: every caller counts as one client
+    def get_http_headers(include_all: bool = False):
+        return {}
+
+    def get_http_request():
+        raise RuntimeError("No active HTTP request")
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+logger = logging.getLogger(__name__)
 
 # Get service URLs from environment
 SEARXNG_URL = os.getenv("SEARXNG_URL", "http://searxng.search-infrastructure.svc.cluster.local:8080")
 CRAWL4AI_URL = os.getenv("CRAWL4AI_URL", "http://crawl4ai.search-infrastructure.svc.cluster.local:8000")
+# Optional comma-separated replica URLs, used for hedged requests
+SEARXNG_URLS = [u.strip() for u in os.getenv("SEARXNG_URLS", SEARXNG_URL).split(",") if u.strip()]
+CRAWL4AI_URLS = [u.strip() for u in os.getenv("CRAWL4AI_URLS", CRAWL4AI_URL).split(",") if u.strip()]
+# Crawls go to the crawl4ai replica owning the target's canonical "host" (or
+# "url") on a consistent-hash ring, overflowing past CRAWL4AI_LOAD_FACTOR times
+# the average in-flight load; "none" spreads them round-robin
+CRAWL4AI_ROUTE_BY = os.getenv("CRAWL4AI_ROUTE_BY", "host").lower()
+CRAWL4AI_LOAD_FACTOR = float(os.getenv("CRAWL4AI_LOAD_FACTOR", "1.25"))
+CRAWL4AI_EJECT_SECONDS = float(os.getenv("CRAWL4AI_EJECT_SECONDS", "30"))
+# Headless Service resolving to every crawl4ai pod; replaces CRAWL4AI_URLS when set
+CRAWL4AI_DISCOVERY_HOST = os.getenv("CRAWL4AI_DISCOVERY_HOST", "")
+CRAWL4AI_DISCOVERY_PORT = int(os.getenv("CRAWL4AI_DISCOVERY_PORT", "8000"))
+CRAWL4AI_DISCOVERY_SECONDS = float(os.getenv("CRAWL4AI_DISCOVERY_SECONDS", "15"))
+# Base URL that MCP clients can reach crawl4ai at, for screenshot links
+# (CRAWL4AI_URL is usually cluster-internal)
+CRAWL4AI_PUBLIC_URL = os.getenv("CRAWL4AI_PUBLIC_URL", CRAWL4AI_URL)
 REDIS_ENABLED = os.getenv("REDIS_ENABLED", "false").lower() == "true"
 REDIS_HOST = os.getenv("REDIS_HOST", "redis-cluster.redis.svc.cluster.local")
 REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 
+# Speculative prefetch of top search results into the crawl cache (opt-in)
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K", "3"))
+# Maximum number of URLs prefetched per minute across all replicas
+PREFETCH_BUDGET = int(os.getenv("PREFETCH_BUDGET", "30"))
+
+# web_search responses carry a handle (their cache key's digest) that follow-up
+# tools such as analyze_search_results accept instead of the results. Handles
+# resolve through this replica's recent searches, then Redis.
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "3600"))
+SEARCH_HANDLE_CACHE_SIZE = int(os.getenv("SEARCH_HANDLE_CACHE_SIZE", "256"))
+# Return only the handle, titles and URLs from web_search unless asked otherwise
+SEARCH_COMPACT = os.getenv("SEARCH_COMPACT", "false").lower() == "true"
+
+# Upstream resilience: timeouts adapt to observed latency, breakers fail fast
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+SEARCH_TIMEOUT_MIN = float(os.getenv("SEARCH_TIMEOUT_MIN", "2"))
+SEARCH_TIMEOUT_MAX = float(os.getenv("SEARCH_TIMEOUT_MAX", "30"))
+CRAWL_TIMEOUT_MIN = float(os.getenv("CRAWL_TIMEOUT_MIN", "5"))
+CRAWL_TIMEOUT_MAX = float(os.getenv("CRAWL_TIMEOUT_MAX", "150"))
+# Added to a crawl's page timeout to cover queueing and post-processing
+CRAWL_TIMEOUT_SLACK = float(os.getenv("CRAWL_TIMEOUT_SLACK", "10"))
+# End-to-end budget of a web_search call; crawl tools use their timeout plus the slack
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "30"))
+# End-to-end budget of a web_crawl_site call
+SITE_CRAWL_DEADLINE_SECONDS = float(os.getenv("SITE_CRAWL_DEADLINE_SECONDS", "600"))
+
+# Adaptive default engine set for searches that don't name engines (opt-in)
+ADAPTIVE_ENGINES = os.getenv("ADAPTIVE_ENGINES", "false").lower() == "true"
+
+# Per-client token buckets (shared through Redis when enabled) and load shedding.
+# Cheap calls: searches, cached reads, analysis; fresh crawls cost more.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+RATE_LIMIT_CAPACITY = float(os.getenv("RATE_LIMIT_CAPACITY", "60"))
+RATE_LIMIT_REFILL_PER_SECOND = float(os.getenv("RATE_LIMIT_REFILL_PER_SECOND", "1"))
+TOOL_COST_CHEAP = float(os.getenv("TOOL_COST_CHEAP", "1"))
+TOOL_COST_CRAWL = float(os.getenv("TOOL_COST_CRAWL", "10"))
+# web_crawl_site is charged per requested page (capped at the bucket size)
+TOOL_COST_SITE_PAGE = float(os.getenv("TOOL_COST_SITE_PAGE", "1"))
+CLIENT_ID_HEADER = os.getenv("CLIENT_ID_HEADER", "X-Client-Id")
+# Peers (e.g. nginx) whose CLIENT_ID_HEADER and X-Real-IP are believed;
+# comma-separated addresses or CIDRs. Anyone else is identified by bearer
+# token, then by connection address.
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(p.strip(), strict=False)
+    for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()
+]
+# GET /usage/{client_id} is off unless enabled, and requires X-Usage-Token
+# when USAGE_TOKEN is set
+USAGE_ENDPOINT_ENABLED = os.getenv("USAGE_ENDPOINT_ENABLED", "false").lower() == "true"
+USAGE_TOKEN = os.getenv("USAGE_TOKEN", "")
+LOAD_SHED_ENABLED = os.getenv("LOAD_SHED_ENABLED", "true").lower() == "true"
+# Concurrent backend calls per replica before low/normal/high priority calls are shed
+LOAD_SHED_CAPACITY = int(os.getenv("LOAD_SHED_CAPACITY", "32"))
+
+# Negative caching: failing searches back off exponentially, and crawls of URLs
+# or hosts that crawl4ai has negative-cached fail without a round trip
+NEGATIVE_CACHE_ENABLED = os.getenv("NEGATIVE_CACHE_ENABLED", "true").lower() == "true"
+BACKOFF_BASE_SECONDS = float(os.getenv("BACKOFF_BASE_SECONDS", str(negative_cache.BACKOFF_BASE_SECONDS)))
+BACKOFF_MAX_SECONDS = float(os.getenv("BACKOFF_MAX_SECONDS", str(negative_cache.BACKOFF_MAX_SECONDS)))
+
+# Transport when PORT is set: "http" (streamable HTTP) or the legacy "sse".
+# Stateless HTTP keeps no per-connection session in the pod, so every request
+# can go to any replica and scaling in or out drops no sessions.
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "http").lower()
+MCP_HTTP_PATH = os.getenv("MCP_HTTP_PATH", "/mcp")
+MCP_STATELESS_HTTP = os.getenv("MCP_STATELESS_HTTP", "true").lower() == "true"
+# Answer each request with one JSON body instead of an SSE stream
+MCP_JSON_RESPONSE = os.getenv("MCP_JSON_RESPONSE", "true").lower() == "true"
+# Keep MCP session state (Context.set_state) in Redis instead of in the pod
+MCP_SESSION_STATE_REDIS = os.getenv("MCP_SESSION_STATE_REDIS", "true").lower() == "true"
+
+# Initialize FastMCP server
+_session_state_store = None
+if REDIS_ENABLED and MCP_SESSION_STATE_REDIS:
+    try:
+        from key_value.aio.stores.redis import RedisStore
+        _session_state_store = RedisStore(host=REDIS_HOST, port=REDIS_PORT, default_collection="oss-mcp-session")
+    except ImportError:
+        logger.warning(
+            "MCP_SESSION_STATE_REDIS is set but py-key-value-aio[redis] is not installed; "
+            "keeping session state in memory, so it is lost when a request lands on another replica"
+        )
+mcp = None
+if _session_state_store is not None:
+    try:
+        mcp = FastMCP("OSS Search Tools", session_state_store=_session_state_store)
+    except TypeError:
+        logger.warning("This FastMCP release has no pluggable session state store; keeping session state in memory")
+if mcp is None:
+    mcp = FastMCP("OSS Search Tools")
+
 # HTTP client with timeout
 http_client = httpx.Client(timeout=30.0)
 
+# Threads for hedged attempts
+_upstream_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream")
+
+searxng = Upstream(
+    "searxng", SEARXNG_URLS, http_client, _upstream_executor,
+    min_timeout=SEARCH_TIMEOUT_MIN, max_timeout=SEARCH_TIMEOUT_MAX,
+    breaker=CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS),
+)
+crawl4ai_router = None
+if CRAWL4AI_ROUTE_BY in ("host", "url"):
+    crawl4ai_router = ConsistentHashRouter(
+        CRAWL4AI_URLS,
+        load_factor=CRAWL4AI_LOAD_FACTOR,
+        eject_seconds=CRAWL4AI_EJECT_SECONDS,
+        discovery_host=CRAWL4AI_DISCOVERY_HOST or None,
+        discovery_port=CRAWL4AI_DISCOVERY_PORT,
+        discovery_seconds=CRAWL4AI_DISCOVERY_SECONDS,
+    )
+crawl4ai = Upstream(
+    "crawl4ai", CRAWL4AI_URLS, http_client, _upstream_executor,
+    min_timeout=CRAWL_TIMEOUT_MIN, max_timeout=CRAWL_TIMEOUT_MAX,
+    breaker=CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS),
+    # crawl4ai answers 500 when the target page fails; only gateway/overload errors mean it is unhealthy
+    failure_statuses={502, 503, 504},
+    router=crawl4ai_router,
+)
+
+engine_selector = EngineSelector(
+    max_engines=int(os.getenv("ADAPTIVE_ENGINES_MAX", "4")),
+    min_contribution=float(os.getenv("ADAPTIVE_ENGINES_MIN_CONTRIBUTION", "0.5")),
+    refresh_seconds=float(os.getenv("ADAPTIVE_ENGINES_REFRESH_SECONDS", "300")),
+    explore_every=int(os.getenv("ADAPTIVE_ENGINES_EXPLORE_EVERY", "10")),
+)
+
+# Shared Redis client (created lazily so the server starts without Redis)
+_redis_client = None
+
+rate_limiter = TokenBucketLimiter(
+    lambda: get_redis_client(),
+    capacity=RATE_LIMIT_CAPACITY,
+    refill_per_second=RATE_LIMIT_REFILL_PER_SECOND,
+)
+# An open crawl4ai breaker counts as saturation: only high priority calls get through
+load_shedder = LoadShedder(
+    LOAD_SHED_CAPACITY,
+    saturated=lambda: crawl4ai.breaker.state == CircuitBreaker.OPEN,
+)
+
+# handle -> (expires_at, web_search response JSON), least recently used first
+_recent_searches: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_recent_searches_lock = threading.Lock()
+
+# Prefetches are submitted off the request path, one at a time
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+_prefetch_lock = threading.Lock()
+_prefetch_window = {"minute": 0, "used": 0}
+
+
+def get_redis_client():
+    """Return the shared Redis client, or None if caching is disabled."""
+    global _redis_client
+    if not REDIS_ENABLED:
+        return None
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    return _redis_client
+
 
 def get_from_redis(key: str) -> Optional[str]:
     """Get value from Redis cache if enabled."""
     if not REDIS_ENABLED:
         return None
     try:
-        import redis
-        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-        return r.get(key)
+        return get_redis_client().get(key)
     except Exception:
         return None
 
@@ -41,13 +249,365 @@ def set_to_redis(key: str, value: str, ttl: int = 3600):
     if not REDIS_ENABLED:
         return
     try:
-        import redis
-        r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-        r.setex(key, ttl, value)
+        get_redis_client().setex(key, ttl, value)
     except Exception:
         pass
 
 
+def delete_from_redis(key: str):
+    """Delete a key from Redis if enabled."""
+    if not REDIS_ENABLED:
+        return
+    try:
+        get_redis_client().delete(key)
+    except Exception:
+        pass
+
+
+def remember_search(handle: str, result_json: str):
+    """Keep a web_search response in this replica's handle tier"""
+    if SEARCH_HANDLE_CACHE_SIZE <= 0:
+        return
+    with _recent_searches_lock:
+        _recent_searches[handle] = (time.time() + SEARCH_CACHE_TTL, result_json)
+        _recent_searches.move_to_end(handle)
+        while len(_recent_searches) > SEARCH_HANDLE_CACHE_SIZE:
+            _recent_searches.popitem(last=False)
+
+
+def get_search_by_handle(handle: str) -> Optional[dict]:
+    """The web_search response behind a handle, from recent searches or Redis"""
+    cache_key = cache_keys.search_key_from_handle(handle)
+    if cache_key is None:
+        return None
+    with _recent_searches_lock:
+        entry = _recent_searches.get(handle)
+        if entry and entry[0] > time.time():
+            _recent_searches.move_to_end(handle)
+            return json.loads(entry[1])
+    cached = get_from_redis(cache_key)
+    if not cached:
+        return None
+    remember_search(handle, cached)
+    return json.loads(cached)
+
+
+def compact_search_response(result_json: str) -> str:
+    """A web_search response reduced to its handle and each result's title and URL"""
+    data = json.loads(result_json)
+    return json.dumps({
+        "query": data.get("query"),
+        "handle": data.get("handle"),
+        "total_results": data.get("total_results"),
+        "results": [{"title": r.get("title", ""), "url": r.get("url", "")} for r in data.get("results", [])],
+    }, indent=2)
+
+
+def get_cached_crawl(cache_key: str, hydrate: bool = True) -> Optional[dict]:
+    """
+    Read a crawl4ai CrawlResponse payload from the shared crawl cache.
+    Near-duplicates are stored without a body and get their original's.
+    """
+    cached = get_from_redis(cache_key)
+    if not cached:
+        return None
+    try:
+        data = json.loads(cached)
+    except ValueError:
+        return None
+    if hydrate and dedup.is_duplicate_entry(data):
+        original_key = cache_keys.crawl_key_from_digest(data["duplicate_of"]["job_id"])
+        return dedup.hydrate(data, get_cached_crawl(original_key, hydrate=False))
+    return data
+
+
+def duplicate_summary(data: dict) -> Optional[dict]:
+    """What callers see of a page's near-duplicate reference"""
+    ref = data.get("duplicate_of")
+    return {"url": ref["url"], "distance": ref.get("distance")} if ref else None
+
+
+def get_failure_entries(keys: List[str]) -> List[Optional[dict]]:
+    """Negative-cache entries for keys (None where absent or disabled)."""
+    if not (REDIS_ENABLED and NEGATIVE_CACHE_ENABLED):
+        return [None] * len(keys)
+    try:
+        values = get_redis_client().mget(keys)
+    except Exception:
+        return [None] * len(keys)
+    return [json.loads(v) if v else None for v in values]
+
+
+def crawl_route_key(url: str) -> str:
+    """Key that picks the crawl4ai replica for a crawl of `url`"""
+    if CRAWL4AI_ROUTE_BY == "url":
+        return cache_keys.canonicalize_url(url)
+    return cache_keys.canonical_host(url)
+
+
+def crawl_backoff(url: str, timeout: Optional[int] = None) -> Optional[dict]:
+    """
+    The recorded failure if crawl4ai is backing off from this URL or its host,
+    checked here so a retrying agent doesn't even cost a crawl4ai request.
+    """
+    keys = [cache_keys.url_failure_key(url), cache_keys.host_failure_key(cache_keys.canonical_host(url))]
+    now = time.time()
+    for entry, scope in zip(get_failure_entries(keys), ("url", "host")):
+        if negative_cache.blocks(entry, now, timeout or 30):
+            return negative_cache.error_response(entry, scope, now)
+    return None
+
+
+def record_search_failure(cache_key: str, previous: Optional[dict], error: Exception):
+    """Negative-cache a failed search so retries back off instead of re-querying SearXNG."""
+    if not (REDIS_ENABLED and NEGATIVE_CACHE_ENABLED):
+        return
+    # Open breakers already fail fast, and a spent deadline is the caller's budget
+    if isinstance(error, (CircuitOpenError, DeadlineExceededError)):
+        return
+    status = error.response.status_code if isinstance(error, httpx.HTTPStatusError) else None
+    error_class = negative_cache.classify_error(str(error), status)
+    now = time.time()
+    entry = negative_cache.record_failure(
+        previous, error_class, str(error), now, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS
+    )
+    set_to_redis(
+        cache_keys.failure_key(cache_key), json.dumps(entry),
+        ttl=negative_cache.entry_ttl(entry, now, BACKOFF_MAX_SECONDS),
+    )
+
+
+def backoff_error(message: str, failure: dict) -> str:
+    return json.dumps({"error": message, "details": failure.pop("error"), **failure}, indent=2)
+
+
+def format_crawl_result(data: dict, url: str) -> dict:
+    """Format a crawl4ai CrawlResponse payload for the web_crawl tool."""
+    markdown = data.get("markdown", "") or ""
+    media = data.get("media", {}) or {}
+    result = {
+        "url": data.get("url", url),
+        "title": data.get("metadata", {}).get("title", ""),
+        "description": data.get("metadata", {}).get("description", ""),
+        "content_length": len(markdown),
+        "links_found": len(data.get("links", [])),
+        "images_found": len(media.get("images", [])),
+        "videos_found": len(media.get("videos", [])),
+        "markdown_preview": markdown[:1000],
+        "full_markdown": markdown,
+        "links": data.get("links", [])[:20],
+        "images": media.get("images", [])[:10],
+        "videos": media.get("videos", [])[:10],
+    }
+    
+    # Markdown was pruned to the passages relevant to a query
+    if data.get("relevance"):
+        result["relevance"] = data["relevance"]
+    
+    # The crawl hit its deadline; the content is whatever had rendered by then
+    if data.get("partial"):
+        result["partial"] = True
+    
+    # Nearly the same page as one already cached; agents can skip one of them
+    if data.get("duplicate_of"):
+        result["duplicate_of"] = duplicate_summary(data)
+    
+    # Screenshots are stored by crawl4ai-service; return a fetchable reference
+    if data.get("screenshot_ref"):
+        ref = data["screenshot_ref"]
+        result["screenshot"] = {**ref, "url": f"{CRAWL4AI_PUBLIC_URL.rstrip('/')}{ref['url']}"}
+    elif data.get("screenshot"):
+        result["screenshot"] = data.get("screenshot")
+    
+    return result
+
+
+def make_cursor(job_id: str, index: int) -> str:
+    """Opaque cursor for chunk `index` of a crawl's paginated markdown."""
+    return f"{job_id}.{index}"
+
+
+def parse_cursor(cursor: str) -> Tuple[str, int]:
+    """Split a cursor into (job ID, chunk index); raises ValueError if malformed."""
+    job_id, _, index = cursor.strip().rpartition(".")
+    if not job_id or not index.isdigit():
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return job_id, int(index)
+
+
+def get_markdown_chunk(job_id: str, index: int) -> Optional[dict]:
+    """
+    Read one chunk of a crawl's paginated markdown: a single LINDEX on the
+    shared cache, falling back to crawl4ai (which rebuilds evicted chunk
+    lists). Returns None if the page isn't cached or the index is past the end.
+    """
+    if index < 0:
+        return None
+    client = get_redis_client()
+    if client:
+        try:
+            chunks_key = cache_keys.chunks_key_from_digest(job_id)
+            pipe = client.pipeline(transaction=False)
+            pipe.lindex(chunks_key, index)
+            pipe.llen(chunks_key)
+            content, total = pipe.execute()
+            if total:
+                return {"index": index, "total": total, "content": content} if content is not None else None
+        except Exception:
+            pass
+    response = crawl4ai.request("GET", f"/result/{job_id}/chunks/{index}", hedge=HEDGE_ENABLED)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+def read_chunk_response(url: str, job_id: str, index: int, chunk: Optional[dict] = None) -> str:
+    """Tool response for one chunk of a page, with the cursor of the next one."""
+    if chunk is None:
+        chunk = get_markdown_chunk(job_id, index)
+    if chunk is None:
+        return json.dumps({
+            "error": "Chunk not available",
+            "details": f"Chunk {index} is past the end of the page, or the cached page has expired",
+        }, indent=2)
+    has_next = chunk["index"] + 1 < chunk["total"]
+    return json.dumps({
+        "url": url,
+        "chunk_index": chunk["index"],
+        "total_chunks": chunk["total"],
+        "content": chunk["content"],
+        "next_cursor": make_cursor(job_id, chunk["index"] + 1) if has_next else None,
+    }, indent=2)
+
+
+def is_trusted_proxy(address: Optional[str]) -> bool:
+    """Whether a peer address is one of TRUSTED_PROXIES"""
+    try:
+        ip = ipaddress.ip_address(address or "")
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def current_client_id() -> str:
+    """
+    Identify the caller for rate limiting. The client id header is honoured
+    only from a trusted proxy; otherwise the caller is a hash of its bearer
+    token, else its address (nginx's X-Real-IP when the peer is a trusted
+    proxy, the connection's own address otherwise). stdio sessions have no
+    headers and count as one local client.
+    """
+    headers = {k.lower(): v for k, v in get_http_headers(include_all=True).items()}
+    if not headers:
+        return "local"
+    try:
+        peer = get_http_request().client
+        peer = peer.host if peer else None
+    except RuntimeError:
+        peer = None
+    trusted = is_trusted_proxy(peer)
+    client = headers.get(CLIENT_ID_HEADER.lower()) if trusted else None
+    if not client:
+        token = headers.get("authorization", "").partition(" ")[2]
+        if token:
+            client = "token-" + hashlib.blake2b(token.encode("utf-8"), digest_size=8).hexdigest()
+    if not client:
+        client = (headers.get("x-real-ip") if trusted else None) or peer or ""
+    return re.sub(r"[^A-Za-z0-9._:@-]", "_", client)[:64] or "anonymous"
+
+
+def charge(cost: float):
+    """Charge the calling client's token bucket; raises RateLimitedError"""
+    if RATE_LIMIT_ENABLED:
+        rate_limiter.take(current_client_id(), cost)
+
+
+@contextmanager
+def backend_slot(priority: str):
+    """Hold a load-shedding slot around a backend call; raises OverloadedError"""
+    if not LOAD_SHED_ENABLED:
+        yield
+        return
+    with load_shedder.slot(current_client_id(), priority):
+        yield
+
+
+def admission_error(e: AdmissionError) -> str:
+    return json.dumps({
+        "error": "Rate limit exceeded" if isinstance(e, RateLimitedError) else "Server overloaded",
+        "details": str(e),
+        "retry_after": e.retry_after
+    }, indent=2)
+
+
+def take_prefetch_budget(requested: int) -> int:
+    """
+    Reserve up to `requested` URLs from the per-minute prefetch budget.
+    Uses a Redis counter so the budget is global across replicas, falling back
+    to a per-process counter when Redis is unavailable.
+    """
+    minute = int(time.time() // 60)
+    r = get_redis_client()
+    if r is not None:
+        try:
+            key = f"prefetch:budget:{minute}"
+            used = r.incrby(key, requested)
+            r.expire(key, 120)
+            granted = max(0, min(requested, PREFETCH_BUDGET - (used - requested)))
+            if granted < requested:
+                r.decrby(key, requested - granted)
+            return granted
+        except Exception:
+            pass
+
+    with _prefetch_lock:
+        if _prefetch_window["minute"] != minute:
+            _prefetch_window["minute"] = minute
+            _prefetch_window["used"] = 0
+        granted = max(0, min(requested, PREFETCH_BUDGET - _prefetch_window["used"]))
+        _prefetch_window["used"] += granted
+        return granted
+
+
+def prefetch_urls(urls: List[str]):
+    """Submit URLs to crawl4ai as low-priority background crawls."""
+    candidates = []
+    r = get_redis_client()
+    for url in urls:
+        if not url.startswith(("http://", "https://")) or url in candidates:
+            continue
+        # Skip URLs that are already cached
+        if get_from_redis(cache_keys.crawl_key(url)):
+            continue
+        # Skip URLs another replica is already prefetching
+        if r is not None:
+            try:
+                if not r.set(f"prefetch:pending:{url}", "1", nx=True, ex=300):
+                    continue
+            except Exception:
+                pass
+        candidates.append(url)
+
+    granted = take_prefetch_budget(len(candidates)) if candidates else 0
+    # URLs left out of the budget must stay claimable by the next search
+    unclaimed = candidates[granted:]
+    try:
+        if granted:
+            crawl4ai.request(
+                "POST", "/crawl/batch",
+                json={"urls": candidates[:granted], "priority": "low"},
+            ).raise_for_status()
+    except Exception:
+        # Prefetching is best-effort; the agent's own web_crawl still works
+        unclaimed = candidates
+    if r is not None and unclaimed:
+        try:
+            r.delete(*[f"prefetch:pending:{url}" for url in unclaimed])
+        except Exception:
+            pass
+
+
 @mcp.tool()
 def web_search(
     query: str,
@@ -56,7 +616,9 @@ def web_search(
     language: Optional[str] = None,
     page: int = 1,
     safe_search: int = 0,
-    max_results: int = 10
+    max_results: int = 10,
+    prefetch: Optional[bool] = None,
+    compact: Optional[bool] = None
 ) -> str:
     """
     Search the web using SearXNG meta-search engine.
@@ -70,17 +632,48 @@ def web_search(
         page: Page number for pagination (starts at 1) (default: 1)
         safe_search: Safe search level - 0=off, 1=moderate, 2=strict (default: 0)
         max_results: Maximum number of results to return (default: 10, max: 20)
+        prefetch: Speculatively crawl the top results in the background so a follow-up
+            web_crawl is served from cache (default: PREFETCH_ENABLED setting)
+        compact: Return only the result handle and each result's title and URL
+            (default: SEARCH_COMPACT setting)
     
     Returns:
-        JSON string with search results including titles, URLs, content snippets, and metadata.
+        JSON string with search results including titles, URLs, content snippets, and metadata,
+        and a `handle` to pass to analyze_search_results instead of the results.
     """
+    try:
+        charge(TOOL_COST_CHEAP)
+    except AdmissionError as e:
+        return admission_error(e)
+    
     # Generate cache key
-    cache_key = f"search:{query}:{engines or 'all'}:{categories or 'general'}:{language or 'en'}:{page}:{max_results}"
+    cache_key = cache_keys.search_key(
+        query, engines, categories, language, page, safe_search, max_results
+    )
+    
+    handle = cache_keys.search_handle(cache_key)
+    should_prefetch = PREFETCH_ENABLED if prefetch is None else prefetch
+    compact = SEARCH_COMPACT if compact is None else compact
     
     # Check cache
     cached = get_from_redis(cache_key)
     if cached:
-        return cached
+        if '"handle": "' not in cached:
+            # Cached before responses carried handles
+            cached = json.dumps({"handle": handle, **json.loads(cached)}, indent=2)
+        remember_search(handle, cached)
+        if should_prefetch:
+            try:
+                cached_urls = [r.get("url", "") for r in json.loads(cached).get("results", [])]
+                _prefetch_executor.submit(prefetch_urls, cached_urls[:PREFETCH_TOP_K])
+            except Exception:
+                pass
+        return compact_search_response(cached) if compact else cached
+    
+    # A query that failed recently answers with its error until the backoff ends
+    failure_entry = get_failure_entries([cache_keys.failure_key(cache_key)])[0]
+    if negative_cache.blocks(failure_entry, time.time()):
+        return backoff_error("Search failed", negative_cache.error_response(failure_entry, "query", time.time()))
     
     try:
         # Prepare search parameters
@@ -92,14 +685,35 @@ def web_search(
             "pageno": page,
             "safesearch": safe_search,
         }
+        category = categories or "general"
+        selected_engines = None
         if engines:
             params["engines"] = engines
+        elif ADAPTIVE_ENGINES:
+            # Skip engines that are slow or rarely make the top results
+            selected_engines = engine_selector.select(category)
+            if selected_engines:
+                params["engines"] = ",".join(selected_engines)
         
         # Perform search
-        response = http_client.get(f"{SEARXNG_URL}/search", params=params)
+        started = time.monotonic()
+        with backend_slot(LoadShedder.HIGH):
+            response = searxng.request(
+                "GET", "/search", hedge=HEDGE_ENABLED, params=params,
+                deadline=started + SEARCH_DEADLINE_SECONDS,
+            )
         response.raise_for_status()
         data = response.json()
         
+        if ADAPTIVE_ENGINES:
+            engine_selector.record(
+                category,
+                engines.split(",") if engines else selected_engines,
+                data,
+                parse_server_timing(response.headers.get("Server-Timing")),
+                max_results,
+            )
+        
         # Format results
         results = []
         for result in data.get("results", [])[:max_results]:
@@ -114,8 +728,9 @@ def web_search(
         
         response_data = {
             "query": query,
+            "handle": handle,
             "total_results": len(data.get("results", [])),
-            "engines_used": engines or "all configured engines",
+            "engines_used": engines or (",".join(selected_engines) if selected_engines else "all configured engines"),
             "category": categories or "general",
             "language": language or "en",
             "page": page,
@@ -124,12 +739,22 @@ def web_search(
         
         result_json = json.dumps(response_data, indent=2)
         
-        # Cache result (1 hour TTL)
-        set_to_redis(cache_key, result_json, ttl=3600)
+        # Cache result
+        set_to_redis(cache_key, result_json, ttl=SEARCH_CACHE_TTL)
+        remember_search(handle, result_json)
+        if failure_entry:
+            delete_from_redis(cache_keys.failure_key(cache_key))
         
-        return result_json
+        # Warm the crawl cache for the results the agent is most likely to open next
+        if should_prefetch and PREFETCH_TOP_K > 0:
+            _prefetch_executor.submit(prefetch_urls, [r["url"] for r in results[:PREFETCH_TOP_K]])
         
+        return compact_search_response(result_json) if compact else result_json
+        
+    except AdmissionError as e:
+        return admission_error(e)
     except httpx.HTTPError as e:
+        record_search_failure(cache_key, failure_entry, e)
         return json.dumps({
             "error": f"Search failed",
             "details": str(e)
@@ -148,7 +773,11 @@ def web_crawl(
     chunking_strategy: Optional[str] = None,
     screenshot: bool = False,
     wait_for: Optional[str] = None,
-    timeout: Optional[int] = None
+    timeout: Optional[int] = None,
+    query: Optional[str] = None,
+    max_chars: int = 4000,
+    offset: Optional[int] = None,
+    cursor: Optional[str] = None
 ) -> str:
     """
     Deep crawl and extract content from a webpage using Crawl4AI.
@@ -158,68 +787,96 @@ def web_crawl(
         url: URL to crawl (must be a valid HTTP/HTTPS URL)
         extraction_strategy: Content extraction strategy - "auto" (default), "llm" (AI-powered), "cosine" (semantic similarity-based)
         chunking_strategy: How to chunk content - "markdown" (default, preserves structure), "regex" (pattern-based), "sliding" (fixed-size)
-        screenshot: Capture screenshot of the page (returned as base64) (default: False)
+        screenshot: Capture screenshot of the page (returned as a reference with a fetch URL) (default: False)
         wait_for: CSS selector to wait for before extraction (useful for dynamic content)
         timeout: Request timeout in seconds (default: 30)
+        query: Only return the passages relevant to this question, with navigation and boilerplate
+            removed. Much smaller than the full page; repeat with another query at no crawl cost.
+        max_chars: Size budget for the passages returned with `query` (default: 4000)
+        offset: Return only this chunk (0-based) of the page's markdown instead of the whole page.
+            Long pages report `pagination.total_chunks`; chunks follow `chunking_strategy`.
+        cursor: Continue reading a long page: pass the `next_cursor` from the previous chunk
     
     Returns:
-        JSON string with crawled content including markdown, links, images, videos, and metadata.
+        JSON string with crawled content including markdown, links, images, videos, and metadata,
+        or a single chunk with `next_cursor` when `offset` or `cursor` is given.
     """
-    # Generate cache key
-    cache_key = f"crawl:{url}"
-    
-    # Check cache
-    cached = get_from_redis(cache_key)
-    if cached:
-        return cached
+    # crawl4ai-service caches the full crawl payload under the shared key;
+    # read it directly to skip the HTTP round trip on a hit
+    job_id = cache_keys.crawl_digest(url, cache_keys.crawl_params(
+        extraction_strategy, chunking_strategy, screenshot, wait_for=wait_for
+    ))
+    cache_key = cache_keys.crawl_key_from_digest(job_id)
+    # The whole call must finish within the page timeout plus slack; crawl4ai
+    # receives what is left of it and trims or drops the crawl to match
+    deadline = time.monotonic() + (timeout or 30) + CRAWL_TIMEOUT_SLACK
     
     try:
-        # Prepare crawl request
-        payload = {
-            "url": url,
-            "screenshot": screenshot,
-        }
-        if extraction_strategy:
-            payload["extraction_strategy"] = extraction_strategy
-        if chunking_strategy:
-            payload["chunking_strategy"] = chunking_strategy
-        if wait_for:
-            payload["wait_for"] = wait_for
-        if timeout:
-            payload["timeout"] = timeout
-        
-        # Perform crawl
-        response = http_client.post(f"{CRAWL4AI_URL}/crawl", json=payload)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Format response
-        result = {
-            "url": data.get("url", url),
-            "title": data.get("metadata", {}).get("title", ""),
-            "description": data.get("metadata", {}).get("description", ""),
-            "content_length": len(data.get("markdown", "")),
-            "links_found": len(data.get("links", [])),
-            "images_found": len(data.get("media", {}).get("images", [])),
-            "videos_found": len(data.get("media", {}).get("videos", [])),
-            "markdown_preview": data.get("markdown", "")[:1000],
-            "full_markdown": data.get("markdown", ""),
-            "links": data.get("links", [])[:20],
-            "images": data.get("media", {}).get("images", [])[:10],
-            "videos": data.get("media", {}).get("videos", [])[:10],
-        }
+        charge(TOOL_COST_CHEAP)
         
-        # Include screenshot if available
-        if data.get("screenshot"):
-            result["screenshot"] = data.get("screenshot")
+        # Chunk reads are a single list lookup, without loading the page
+        if cursor:
+            return read_chunk_response(url, *parse_cursor(cursor))
+        if offset is not None:
+            chunk = get_markdown_chunk(job_id, offset)
+            if chunk is not None:
+                return read_chunk_response(url, job_id, offset, chunk)
         
-        result_json = json.dumps(result, indent=2)
+        data = get_cached_crawl(cache_key)
+        pruned_upstream = False
+        if data is None:
+            failure = crawl_backoff(url, timeout)
+            if failure:
+                return backoff_error("Crawl failed", failure)
+            
+            # Prepare crawl request
+            payload = {
+                "url": url,
+                "screenshot": screenshot,
+            }
+            if extraction_strategy:
+                payload["extraction_strategy"] = extraction_strategy
+            if chunking_strategy:
+                payload["chunking_strategy"] = chunking_strategy
+            if wait_for:
+                payload["wait_for"] = wait_for
+            if timeout:
+                payload["timeout"] = timeout
+            if query and offset is None:
+                # crawl4ai caches the full page and returns only the relevant passages
+                payload["query"] = query
+                payload["max_chars"] = max_chars
+                pruned_upstream = True
+            
+            # Perform crawl (crawl4ai-service caches the result); only a
+            # fresh crawl pays the expensive rate
+            charge(TOOL_COST_CRAWL - TOOL_COST_CHEAP)
+            with backend_slot(LoadShedder.NORMAL):
+                response = crawl4ai.request(
+                    "POST", "/crawl", json=payload,
+                    timeout_floor=(timeout or 30) + CRAWL_TIMEOUT_SLACK,
+                    deadline=deadline,
+                    route_key=crawl_route_key(url),
+                )
+            response.raise_for_status()
+            data = response.json()
         
-        # Cache result (24 hours TTL for crawl)
-        set_to_redis(cache_key, result_json, ttl=86400)
+        if offset is not None:
+            return read_chunk_response(url, job_id, offset)
+        if query and not pruned_upstream:
+            pruned = content_filter.prune_markdown(data.get("markdown", ""), query, max_chars)
+            data = {**data, "markdown": pruned.pop("markdown"), "relevance": pruned}
         
-        return result_json
+        result = format_crawl_result(data, url)
+        chunk_count = (data.get("chunks") or {}).get("count", 0)
+        if chunk_count > 1:
+            # A near-duplicate's chunks are its original's
+            chunks_job_id = (data.get("duplicate_of") or {}).get("job_id", job_id)
+            result["pagination"] = {"total_chunks": chunk_count, "first_cursor": make_cursor(chunks_job_id, 0)}
+        return json.dumps(result, indent=2)
         
+    except AdmissionError as e:
+        return admission_error(e)
     except httpx.HTTPError as e:
         return json.dumps({
             "error": f"Crawl failed",
@@ -236,88 +893,322 @@ def web_crawl(
 def extract_content(
     url: str,
     content_type: Optional[str] = "text",
-    selector: Optional[str] = None
+    selector: Optional[str] = None,
+    selectors: Optional[List[str]] = None,
+    attribute: Optional[str] = None,
+    offset: Optional[int] = None,
+    cursor: Optional[str] = None
 ) -> str:
     """
     Extract specific content from a webpage using CSS selectors or AI extraction.
     Uses cached crawl results when available, otherwise performs a fresh crawl.
+    Selectors run against the cached HTML, so targeted extraction does not re-render the page.
     
     Args:
         url: URL to extract content from
         content_type: Type of content to extract - "text" (default), "links", "images", "metadata", "all"
         selector: CSS selector for specific elements (optional, uses AI extraction if not provided)
+        selectors: Several CSS selectors to apply in one call (optional)
+        attribute: Return this attribute of each matched element (e.g. "href", "src") instead of its text
+        offset: With content_type "text", return only this chunk (0-based) of the page text
+        cursor: With content_type "text", continue from the `next_cursor` of the previous chunk
     
     Returns:
         JSON string with extracted content in structured format.
     """
-    # First try to get from cache
-    cache_key = f"crawl:{url}"
-    cached = get_from_redis(cache_key)
+    try:
+        charge(TOOL_COST_CHEAP)
+    except AdmissionError as e:
+        return admission_error(e)
     
-    crawl_data = None
-    if cached:
+    deadline = time.monotonic() + 30 + CRAWL_TIMEOUT_SLACK
+    job_id = cache_keys.crawl_digest(url)
+    paginated = content_type == "text" and not (selector or selectors) and (cursor or offset is not None)
+    
+    if paginated:
         try:
-            crawl_data = json.loads(cached)
-        except:
-            pass
+            if cursor:
+                return read_chunk_response(url, *parse_cursor(cursor))
+            chunk = get_markdown_chunk(job_id, offset)
+            if chunk is not None:
+                return read_chunk_response(url, job_id, offset, chunk)
+        except Exception as e:
+            return json.dumps({
+                "error": f"Failed to read content chunk",
+                "details": str(e)
+            }, indent=2)
+    
+    # First try the shared crawl cache (default crawl parameters)
+    crawl_data = get_cached_crawl(cache_keys.crawl_key_from_digest(job_id))
     
     # If not in cache, perform a fresh crawl
     if not crawl_data:
+        failure = crawl_backoff(url)
+        if failure:
+            return backoff_error("Failed to crawl URL for extraction", failure)
         try:
             payload = {"url": url, "extraction_strategy": "auto"}
-            response = http_client.post(f"{CRAWL4AI_URL}/crawl", json=payload)
+            charge(TOOL_COST_CRAWL - TOOL_COST_CHEAP)
+            with backend_slot(LoadShedder.NORMAL):
+                response = crawl4ai.request(
+                    "POST", "/crawl", json=payload,
+                    timeout_floor=30 + CRAWL_TIMEOUT_SLACK,
+                    deadline=deadline,
+                    route_key=crawl_route_key(url),
+                )
             response.raise_for_status()
-            data = response.json()
-            
-            crawl_data = {
-                "markdown": data.get("markdown", ""),
-                "links": data.get("links", []),
-                "images": data.get("media", {}).get("images", []),
-                "videos": data.get("media", {}).get("videos", []),
-                "metadata": data.get("metadata", {}),
-            }
+            crawl_data = response.json()
+        except AdmissionError as e:
+            return admission_error(e)
         except Exception as e:
             return json.dumps({
                 "error": f"Failed to crawl URL for extraction",
                 "details": str(e)
             }, indent=2)
     
+    if paginated:
+        try:
+            return read_chunk_response(url, job_id, offset)
+        except Exception as e:
+            return json.dumps({
+                "error": f"Failed to read content chunk",
+                "details": str(e)
+            }, indent=2)
+    
+    media = crawl_data.get("media", {}) or {}
+    
     # Extract based on content_type
     result = {"url": url, "content_type": content_type}
     
-    if content_type == "text" or content_type == "all":
+    css_selectors = ([selector] if selector else []) + list(selectors or [])
+    
+    # Selector matches replace the full page text
+    if css_selectors:
+        result["selectors"] = html_select.select(crawl_data.get("html", ""), css_selectors, attribute)
+        if attribute:
+            result["attribute"] = attribute
+    elif content_type == "text" or content_type == "all":
         result["text"] = crawl_data.get("markdown", "")
         result["text_length"] = len(crawl_data.get("markdown", ""))
+        chunk_count = (crawl_data.get("chunks") or {}).get("count", 0)
+        if chunk_count > 1:
+            chunks_job_id = (crawl_data.get("duplicate_of") or {}).get("job_id", job_id)
+            result["pagination"] = {"total_chunks": chunk_count, "first_cursor": make_cursor(chunks_job_id, 0)}
+    if crawl_data.get("duplicate_of"):
+        result["duplicate_of"] = duplicate_summary(crawl_data)
     
     if content_type == "links" or content_type == "all":
         result["links"] = crawl_data.get("links", [])
         result["links_count"] = len(crawl_data.get("links", []))
     
     if content_type == "images" or content_type == "all":
-        result["images"] = crawl_data.get("images", [])
-        result["images_count"] = len(crawl_data.get("images", []))
+        result["images"] = media.get("images", [])
+        result["images_count"] = len(media.get("images", []))
     
     if content_type == "videos" or content_type == "all":
-        result["videos"] = crawl_data.get("videos", [])
-        result["videos_count"] = len(crawl_data.get("videos", []))
+        result["videos"] = media.get("videos", [])
+        result["videos_count"] = len(media.get("videos", []))
     
     if content_type == "metadata" or content_type == "all":
         result["metadata"] = crawl_data.get("metadata", {})
     
-    # If selector provided, try to extract specific elements
-    if selector:
-        # Note: This would require additional parsing logic
-        # For now, we return the full content and note the selector
-        result["selector"] = selector
-        result["note"] = "Selector-based extraction requires additional parsing - returning full content"
+    return json.dumps(result, indent=2)
+
+
+@mcp.tool()
+def extract_structured(
+    url: str,
+    schema: Dict[str, Any],
+    wait_for: Optional[str] = None,
+    timeout: Optional[int] = None
+) -> str:
+    """
+    Extract repeated records (products, listings, table rows, search results) from a webpage
+    with a CSS/XPath schema instead of an LLM. Runs on the rendered page; results are cached
+    per URL and schema, so repeating a call is instant.
+    
+    Args:
+        url: URL to extract records from
+        schema: {"name": "...", "baseSelector": "<one element per record>", "fields": [
+                 {"name": "...", "selector": "<relative selector>", "type": "text"}, ...]}.
+                 Field types: text, html, attribute (with "attribute"), number, integer, boolean,
+                 regex (with "pattern"), list, nested and nested_list (with "fields").
+                 Selectors are CSS; set "selectorType": "xpath" or prefix one with "xpath:" for XPath.
+        wait_for: CSS selector to wait for before extraction (optional)
+        timeout: Page timeout in seconds (default: 30)
+    
+    Returns:
+        JSON string with the records and their count.
+    """
+    try:
+        charge(TOOL_COST_CHEAP)
+    except AdmissionError as e:
+        return admission_error(e)
+    
+    job_id = cache_keys.crawl_digest(url, cache_keys.crawl_params(
+        cache_keys.schema_extraction(schema), None, False, wait_for=wait_for
+    ))
+    deadline = time.monotonic() + (timeout or 30) + CRAWL_TIMEOUT_SLACK
+    data = get_cached_crawl(cache_keys.crawl_key_from_digest(job_id))
+    cached = data is not None
+    
+    if data is None:
+        failure = crawl_backoff(url, timeout)
+        if failure:
+            return backoff_error("Failed to crawl URL for extraction", failure)
+        payload = {"url": url, "extraction_schema": schema}
+        if wait_for:
+            payload["wait_for"] = wait_for
+        if timeout:
+            payload["timeout"] = timeout
+        try:
+            charge(TOOL_COST_CRAWL - TOOL_COST_CHEAP)
+            with backend_slot(LoadShedder.NORMAL):
+                response = crawl4ai.request(
+                    "POST", "/crawl", json=payload,
+                    timeout_floor=(timeout or 30) + CRAWL_TIMEOUT_SLACK,
+                    deadline=deadline,
+                    route_key=crawl_route_key(url),
+                )
+            if response.status_code == 422:
+                return json.dumps({
+                    "error": "Invalid extraction schema",
+                    "details": response.json().get("detail")
+                }, indent=2)
+            response.raise_for_status()
+            data = response.json()
+        except AdmissionError as e:
+            return admission_error(e)
+        except Exception as e:
+            return json.dumps({
+                "error": f"Failed to crawl URL for extraction",
+                "details": str(e)
+            }, indent=2)
     
+    records = data.get("extracted_content") or []
+    if isinstance(records, dict) and records.get("error"):
+        # The page crawled fine but the schema failed on it
+        return json.dumps({
+            "error": "Structured extraction failed",
+            "details": records["error"]
+        }, indent=2)
+    result = {
+        "url": url,
+        "name": schema.get("name") or "records",
+        "count": len(records),
+        "records": records,
+        "cached": cached,
+    }
+    if data.get("duplicate_of"):
+        result["duplicate_of"] = duplicate_summary(data)
     return json.dumps(result, indent=2)
 
 
+@mcp.tool()
+def web_crawl_site(
+    url: str,
+    max_depth: int = 2,
+    max_pages: int = 30,
+    path_prefix: Optional[str] = None,
+    include_subdomains: bool = False,
+    preview_chars: int = 500
+) -> str:
+    """
+    Crawl a whole site (e.g. a documentation section) breadth-first from a seed URL in one call.
+    Follows links on the same host under the seed's directory (or path_prefix) up to the depth
+    and page limits. Every page is cached, so reading one in full with web_crawl afterwards is instant.
+    
+    Args:
+        url: Seed URL to start from
+        max_depth: Maximum link hops from the seed (default: 2, max: 5)
+        max_pages: Maximum pages to crawl (default: 30, max: 500)
+        path_prefix: Only follow links whose path starts with this (default: the seed URL's directory)
+        include_subdomains: Also follow links to subdomains of the seed host (default: False)
+        preview_chars: Characters of markdown to include per page (default: 500)
+    
+    Returns:
+        JSON string with one entry per page (URL, depth, title, content length, preview) and any failures.
+    """
+    payload = {
+        "url": url,
+        "max_depth": max_depth,
+        "max_pages": max_pages,
+        "include_subdomains": include_subdomains,
+    }
+    if path_prefix:
+        payload["path_prefix"] = path_prefix
+    
+    try:
+        charge(TOOL_COST_SITE_PAGE * max_pages)
+        # Site crawls are bulk work and are the first to be shed
+        with backend_slot(LoadShedder.LOW):
+            response = crawl4ai.request(
+                "POST", "/crawl/site", json=payload,
+                timeout_floor=SITE_CRAWL_DEADLINE_SECONDS,
+                deadline=time.monotonic() + SITE_CRAWL_DEADLINE_SECONDS,
+                route_key=crawl_route_key(url),
+            )
+        response.raise_for_status()
+        
+        pages, failures, summary = [], [], {}
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("type") == "summary":
+                summary = entry
+            elif "result" in entry:
+                data = entry["result"]
+                markdown = data.get("markdown", "") or ""
+                page = {
+                    "url": data.get("url", entry["url"]),
+                    "depth": entry["depth"],
+                    "title": data.get("metadata", {}).get("title", ""),
+                    "content_length": len(markdown),
+                    "links_found": len(data.get("links", [])),
+                    "markdown_preview": markdown[:preview_chars],
+                }
+                if data.get("duplicate_of"):
+                    page["duplicate_of"] = duplicate_summary(data)
+                pages.append(page)
+            else:
+                failures.append({"url": entry["url"], "depth": entry["depth"], "error": entry.get("error")})
+        
+        # No need to preview a page twice when its near-duplicate was crawled too
+        crawled = {page["url"] for page in pages}
+        for page in pages:
+            if page.get("duplicate_of") and page["duplicate_of"]["url"] in crawled:
+                page.pop("markdown_preview")
+        
+        return json.dumps({
+            "seed": url,
+            "scope": summary.get("scope"),
+            "pages_crawled": len(pages),
+            "pages_failed": len(failures),
+            "stopped": summary.get("stopped"),
+            "pages": pages,
+            "failures": failures,
+        }, indent=2)
+        
+    except AdmissionError as e:
+        return admission_error(e)
+    except httpx.HTTPError as e:
+        return json.dumps({
+            "error": f"Site crawl failed",
+            "details": str(e)
+        }, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "error": f"Unexpected error during site crawl",
+            "details": str(e)
+        }, indent=2)
+
+
 @mcp.tool()
 def analyze_search_results(
-    query: str,
-    results: str,
+    query: Optional[str] = None,
+    results: Optional[str] = None,
+    handles: Optional[List[str]] = None,
     relevance_weight: float = 0.5,
     freshness_weight: float = 0.3,
     authority_weight: float = 0.2
@@ -325,10 +1216,13 @@ def analyze_search_results(
     """
     Analyze and score search results based on relevance, freshness, and authority.
     Provides insights, summaries, and ranked recommendations.
+    Pass the `handle` of one or more web_search calls rather than their results: they are
+    read from the cache, and results of several searches are merged and ranked together.
     
     Args:
-        query: Original search query
-        results: JSON string of search results (from web_search tool)
+        query: Query to score relevance against (default: each search's own query)
+        results: JSON string of search results (from web_search tool), or a search handle
+        handles: Handles of web_search calls to analyze together
         relevance_weight: Weight for relevance scoring (default: 0.5)
         freshness_weight: Weight for freshness scoring (default: 0.3)
         authority_weight: Weight for authority scoring (default: 0.2)
@@ -337,18 +1231,64 @@ def analyze_search_results(
         JSON string with analysis including scores, insights, and recommendations.
     """
     try:
-        # Parse results
-        if isinstance(results, str):
-            results_data = json.loads(results)
-        else:
-            results_data = results
+        charge(TOOL_COST_CHEAP)
+    except AdmissionError as e:
+        return admission_error(e)
+    
+    try:
+        handle_list = list(handles or [])
+        if isinstance(results, str) and cache_keys.search_key_from_handle(results.strip()):
+            handle_list.insert(0, results.strip())
+            results = None
+        
+        # (search query, results) of every search being analyzed
+        searches = []
+        for handle in dict.fromkeys(handle_list):
+            handle_data = get_search_by_handle(handle)
+            if handle_data is None:
+                return json.dumps({
+                    "error": "Unknown or expired search handle",
+                    "details": f"{handle}: run web_search again or pass its results",
+                    "query": query
+                }, indent=2)
+            searches.append((handle_data.get("query"), handle_data.get("results", [])))
         
-        # Extract results list
-        # Handle both formats: {"results": [...]} or just [...]
-        if isinstance(results_data, list):
-            search_results = results_data
-        else:
-            search_results = results_data.get("results", [])
+        if results:
+            # Parse results
+            if isinstance(results, str):
+                results_data = json.loads(results)
+            else:
+                results_data = results
+            
+            # Extract results list
+            # Handle both formats: {"results": [...]} or just [...]
+            if isinstance(results_data, list):
+                searches.append((None, results_data))
+            else:
+                searches.append((results_data.get("query"), results_data.get("results", [])))
+        
+        # The same page found by several searches is analyzed once
+        search_results = []
+        seen_urls = set()
+        for search_query, batch in searches:
+            for result in batch:
+                url_key = None
+                if result.get("url"):
+                    try:
+                        url_key = cache_keys.canonicalize_url(result["url"])
+                    except ValueError:
+                        # Malformed URLs (e.g. a bad port) are compared as given
+                        url_key = result["url"]
+                if url_key in seen_urls:
+                    continue
+                if url_key:
+                    seen_urls.add(url_key)
+                search_results.append((search_query, result))
+        
+        # Without a query, each result is scored against the query that found it
+        queries = list(dict.fromkeys(q for q, _ in searches if q))
+        score_query = query
+        query = query or " | ".join(queries)
         if not search_results:
             return json.dumps({
                 "query": query,
@@ -358,9 +1298,9 @@ def analyze_search_results(
         
         # Analyze each result
         analyzed = []
-        query_terms = query.lower().split()
         
-        for result in search_results:
+        for search_query, result in search_results:
+            query_terms = (score_query or search_query or " ".join(queries)).lower().split()
             title = result.get("title", "").lower()
             content = result.get("content", "").lower()
             url = result.get("url", "")
@@ -372,7 +1312,7 @@ def analyze_search_results(
                     relevance_score += 2.0
                 if term in content:
                     relevance_score += 1.0
-            relevance_score = min(relevance_score / (len(query_terms) * 3), 1.0)
+            relevance_score = min(relevance_score / (max(len(query_terms), 1) * 3), 1.0)
             
             # Calculate freshness score (if published date available)
             freshness_score = 0.5  # Default neutral
@@ -394,7 +1334,7 @@ def analyze_search_results(
                 authority_score * authority_weight
             )
             
-            analyzed.append({
+            entry = {
                 "title": result.get("title", ""),
                 "url": result.get("url", ""),
                 "scores": {
@@ -403,7 +1343,10 @@ def analyze_search_results(
                     "authority": round(authority_score, 3),
                     "composite": round(composite_score, 3)
                 }
-            })
+            }
+            if len(queries) > 1:
+                entry["query"] = search_query
+            analyzed.append(entry)
         
         # Sort by composite score
         analyzed.sort(key=lambda x: x["scores"]["composite"], reverse=True)
@@ -419,6 +1362,8 @@ def analyze_search_results(
             "top_result_url": top_result["url"] if top_result else None,
             "top_result_score": top_result["scores"]["composite"] if top_result else None
         }
+        if len(searches) > 1:
+            insights["searches_merged"] = len(searches)
         
         # Build response
         response = {
@@ -452,25 +1397,117 @@ def analyze_search_results(
 # Add health check endpoint for Kubernetes
 from starlette.responses import JSONResponse
 
+# Filled by warm_up(); /health/ready passes once it has run
+_warmup = {"done": False, "seconds": {"imports": round(IMPORT_SECONDS, 3)}, "errors": {}}
+_started_at = time.time()
+
+
+def warm_up():
+    """
+    Open the Redis connection and the HTTP keep-alive pools to every upstream
+    replica before the first tool call, recording how long each step took.
+    Unreachable upstreams are reported but don't block readiness: the circuit
+    breakers handle them once traffic arrives.
+    """
+    started = time.perf_counter()
+    if REDIS_ENABLED:
+        step = time.perf_counter()
+        try:
+            get_redis_client().ping()
+        except Exception as e:
+            _warmup["errors"]["redis"] = str(e)
+        _warmup["seconds"]["redis"] = round(time.perf_counter() - step, 3)
+    for name, urls, path in (("searxng", SEARXNG_URLS, "/healthz"), ("crawl4ai", CRAWL4AI_URLS, "/health/live")):
+        step = time.perf_counter()
+        for url in urls:
+            try:
+                http_client.get(f"{url}{path}", timeout=5.0)
+            except Exception as e:
+                _warmup["errors"][url] = str(e)
+        _warmup["seconds"][name] = round(time.perf_counter() - step, 3)
+    _warmup["seconds"]["warm_up"] = round(time.perf_counter() - started, 3)
+    _warmup["done"] = True
+
+
+@mcp.custom_route("/health/live", methods=["GET"])
+async def liveness_check(request):
+    """Liveness probe: the process is serving HTTP."""
+    return JSONResponse({"status": "alive", "uptime_seconds": round(time.time() - _started_at, 1)})
+
+
+@mcp.custom_route("/health/ready", methods=["GET"])
+async def readiness_check(request):
+    """Readiness probe: 503 until warm_up() has run."""
+    return JSONResponse(
+        {"ready": _warmup["done"], "startup_seconds": _warmup["seconds"], "errors": _warmup["errors"]},
+        status_code=200 if _warmup["done"] else 503,
+    )
+
+
+async def _registered_tool_names() -> List[str]:
+    """Names of the tools registered on the server, across FastMCP releases."""
+    if hasattr(mcp, "get_tools"):  # FastMCP 2.x: name -> tool
+        return sorted(await mcp.get_tools())
+    return sorted(tool.name for tool in await mcp.list_tools())
+
+
 @mcp.custom_route("/health", methods=["GET"])
 async def health_check(request):
     """Health check endpoint for Kubernetes probes."""
     return JSONResponse({
         "status": "healthy",
         "service": "mcp-server-fastmcp",
-        "transport": "sse",
-        "tools": ["web_search", "web_crawl", "extract_content", "analyze_search_results"]
+        "transport": MCP_TRANSPORT,
+        "stateless": MCP_STATELESS_HTTP if MCP_TRANSPORT == "http" else False,
+        "session_state": "redis" if _session_state_store is not None else "memory",
+        "tools": await _registered_tool_names(),
+        "upstreams": {"searxng": searxng.status(), "crawl4ai": crawl4ai.status()},
+        "crawl4ai_routing": crawl4ai_router.snapshot() if crawl4ai_router else None,
+        "engines": engine_selector.snapshot() if ADAPTIVE_ENGINES else None,
+        "admission": {
+            "rate_limit": rate_limiter.snapshot() if RATE_LIMIT_ENABLED else None,
+            "load_shedding": load_shedder.snapshot() if LOAD_SHED_ENABLED else None
+        }
     })
 
 
+@mcp.custom_route("/usage/{client_id}", methods=["GET"])
+async def client_usage(request):
+    """Per-client accounting: calls, tokens charged and rejections for a UTC day (?day=YYYYMMDD)."""
+    if not USAGE_ENDPOINT_ENABLED:
+        return JSONResponse({"error": "Not Found"}, status_code=404)
+    if USAGE_TOKEN and not secrets.compare_digest(request.headers.get("x-usage-token", ""), USAGE_TOKEN):
+        return JSONResponse({"error": "Invalid usage token"}, status_code=403)
+    client_id = request.path_params["client_id"]
+    day = request.query_params.get("day")
+    usage = rate_limiter.usage(client_id, day)
+    if usage is None:
+        return JSONResponse({"error": "Usage accounting requires Redis"}, status_code=503)
+    return JSONResponse({"client_id": client_id, "day": day or time.strftime("%Y%m%d", time.gmtime()), "usage": usage})
+
+
 if __name__ == "__main__":
     # Run the FastMCP server
     # FastMCP automatically handles stdio, HTTP, and SSE transports
     port = os.getenv("PORT")
-    if port:
-        # HTTP/SSE mode for Kubernetes/remote access
-        # Bind to 0.0.0.0 to allow external connections
+    # Warm connections in the background while the transport starts
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if crawl4ai_router:
+        crawl4ai_router.start_discovery()
+    if port and MCP_TRANSPORT == "sse":
+        # Legacy SSE mode: each client is pinned to the replica holding its stream
         mcp.run(transport="sse", port=int(port), host="0.0.0.0")
+    elif port:
+        # Streamable HTTP mode for Kubernetes/remote access
+        # Bind to 0.0.0.0 to allow external connections
+        mcp.run(
+            transport="streamable-http",
+            port=int(port),
+            host="0.0.0.0",
+            path=MCP_HTTP_PATH,
+            stateless_http=MCP_STATELESS_HTTP,
+            json_response=MCP_JSON_RESPONSE,
+        )
     else:
         # stdio mode for local/spawned processes
         mcp.run()